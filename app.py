@@ -1,8 +1,10 @@
 from flask import Flask, render_template, redirect, url_for
-from blueprints.webhook import webhook_bp
+from blueprints.webhook import webhook_bp, init_app as init_webhooks
 from blueprints.products import products_bp
 from blueprints.logs import logs_bp
 from blueprints.ignore import ignore_bp
+from blueprints.jobs import jobs_bp
+from blueprints.metrics import metrics_bp
 from utils.logging_helper import setup_logging
 
 app = Flask(__name__)
@@ -15,6 +17,11 @@ app.register_blueprint(webhook_bp)
 app.register_blueprint(products_bp)
 app.register_blueprint(logs_bp)
 app.register_blueprint(ignore_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(metrics_bp)
+
+# Start processing received webhooks
+init_webhooks(app)
 
 # Home route
 @app.route('/')
@@ -0,0 +1,222 @@
+"""
+ASGI entry point. The webhook endpoint, the log stream and the products routes are served directly on the
+event loop, so thousands of concurrent webhooks and log stream subscribers need no thread each, and the
+products routes call Shopify and OpenAI through pooled asyncio clients. Every other route is served by
+the Flask app in a bounded thread pool.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import contextlib
+import threading
+import urllib.parse
+import config
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MultiDict
+from app import app as flask_app
+from blueprints.logs import KEEP_ALIVE_INTERVAL, format_event, log_filters
+from blueprints.products import REVIEW_STREAMING, parse_upload_form, store_upload_results, load_upload_results
+from blueprints.webhook import accept_webhook
+from utils.async_http import close_sessions
+from utils.image_pipeline import transfer_images_async
+from utils.logging_helper import log_store, entry_matches
+from utils.openai_helper import openai_limiter
+from utils.pipeline import generate_products_content_async, iter_products_content_async
+from utils.shopify_helper import get_vendor_products_async, update_products_async
+
+# Maximum number of concurrent log stream clients; each one only costs a coroutine here
+ASGI_LOG_MAX_SUBSCRIBERS = getattr(config, 'ASGI_LOG_MAX_SUBSCRIBERS', 10000)
+
+# Threads running the Flask routes that are not served on the event loop
+ASGI_WSGI_WORKERS = getattr(config, 'ASGI_WSGI_WORKERS', 20)
+
+class LogNotifier:
+    """
+    Wakes every log stream coroutine when a log entry is added. Log entries are added from any thread, so
+    the wake-up is handed to the event loop, at most once per loop iteration however many entries arrive.
+    """
+    def __init__(self, loop):
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._waiter = loop.create_future()
+        self.subscribers = 0
+
+    def notify(self):
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # The event loop has been closed
+            pass
+
+    def _wake(self):
+        with self._lock:
+            self._scheduled = False
+        waiter, self._waiter = self._waiter, self._loop.create_future()
+        waiter.set_result(None)
+
+    async def wait(self, timeout):
+        """
+        Waits for the next log entry.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waiter), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+async def handle_webhook(request):
+    body = await request.body()
+    # Storing the webhook is a short SQLite write, which must not block the event loop
+    result, status_code = await run_in_threadpool(accept_webhook, body, request.headers)
+    return JSONResponse(result, status_code=status_code)
+
+async def stream_logs(request):
+    notifier = request.app.state.log_notifier
+    # Resume after the last entry the client saw when the browser reconnects
+    last_seq = log_store.resume_point(request.headers.get('last-event-id') or request.query_params.get('since'))
+    filters = log_filters(request.query_params)
+
+    if notifier.subscribers >= ASGI_LOG_MAX_SUBSCRIBERS:
+        return PlainTextResponse("Too many log stream clients", status_code=503)
+    notifier.subscribers += 1
+
+    async def generate():
+        seq = last_seq
+        while True:
+            entries = log_store.since(seq)
+            if not entries:
+                if not await notifier.wait(KEEP_ALIVE_INTERVAL):
+                    yield ": keep-alive\n\n"
+                continue
+            seq = entries[-1][0]
+            events = "".join(format_event(entry_seq, entry) for entry_seq, entry in entries if entry_matches(entry, **filters))
+            if events:
+                yield events
+
+    def unsubscribe():
+        notifier.subscribers -= 1
+
+    # The background task runs when the response ends, including when the client disconnects
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        background=BackgroundTask(unsubscribe),
+    )
+
+# The Flask templates, rendered asynchronously so a streamed page can iterate over an async generator
+templates = flask_app.jinja_env.overlay(enable_async=True)
+
+def url_builder(request):
+    """
+    Returns a url_for for templates rendered outside Flask, building URLs for the Flask app's endpoints.
+    """
+    adapter = flask_app.url_map.bind(
+        request.url.netloc, script_name=request.scope.get('root_path') or None, url_scheme=request.url.scheme
+    )
+
+    def url_for(endpoint, **values):
+        return adapter.build(endpoint, values)
+    return url_for
+
+async def read_form(request):
+    """
+    Reads a URL-encoded form into the MultiDict that Flask's request.form is, so form handling can be shared.
+    """
+    body = await request.body()
+    return MultiDict(urllib.parse.parse_qsl(body.decode('utf-8', errors='replace'), keep_blank_values=True))
+
+async def generate_for_vendor(request):
+    form = await read_form(request)
+    vendor = form.get('vendor')
+    min_inventory_level = form.get('min_inventory_level', 0, type=int)
+
+    if not vendor:
+        return PlainTextResponse("Vendor not specified", status_code=400)
+
+    products = await get_vendor_products_async(vendor, min_inventory_level)
+    if not products:
+        return PlainTextResponse(f"No products found for vendor {vendor} below the minimum inventory level", status_code=404)
+
+    concurrency = form.get('concurrency', type=int)
+    force_regenerate = bool(form.get('force_regenerate'))
+    template = templates.get_template('review_content.html')
+    url_for = url_builder(request)
+
+    if REVIEW_STREAMING:
+        # The page is rendered while the products are processed, in product order
+        product_responses = iter_products_content_async(products, max_workers=concurrency, force_regenerate=force_regenerate)
+        return StreamingResponse(
+            template.generate_async(products=product_responses, url_for=url_for),
+            media_type='text/html',
+            headers={'X-Accel-Buffering': 'no'},
+        )
+
+    product_responses = await generate_products_content_async(products, max_workers=concurrency, force_regenerate=force_regenerate)
+    return HTMLResponse(await template.render_async(products=product_responses, url_for=url_for))
+
+async def upload_content(request):
+    product_ids, updates, images = parse_upload_form(await read_form(request))
+
+    errors = await update_products_async(updates)
+    transferred = await transfer_images_async(images)
+
+    # The results are written to the shared state, which may be a SQLite database
+    upload_id = await run_in_threadpool(store_upload_results, product_ids, errors, transferred)
+    return RedirectResponse(url_builder(request)('products.success_page', upload_id=upload_id), status_code=302)
+
+async def success_page(request):
+    template = templates.get_template('success.html')
+    url_for = url_builder(request)
+    upload_id = request.query_params.get('upload_id')
+    if not upload_id:
+        return HTMLResponse(await template.render_async(url_for=url_for))
+
+    results = await run_in_threadpool(load_upload_results, upload_id)
+    if results is None:
+        return PlainTextResponse("Upload results not found or expired", status_code=404)
+    return HTMLResponse(await template.render_async(results=results, url_for=url_for))
+
+async def generation_stats(request):
+    return JSONResponse(openai_limiter.stats())
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    notifier = LogNotifier(asyncio.get_running_loop())
+    app.state.log_notifier = notifier
+    # Keep the registered callable: every notifier.notify access creates a new bound method
+    listener = notifier.notify
+    log_store.add_listener(listener)
+    try:
+        yield
+    finally:
+        log_store.remove_listener(listener)
+        await close_sessions()
+
+app = Starlette(
+    routes=[
+        Route('/webhook', handle_webhook, methods=['POST']),
+        Route('/logs/stream', stream_logs),
+        Route('/generate_for_vendor', generate_for_vendor, methods=['POST']),
+        Route('/upload_content', upload_content, methods=['POST']),
+        Route('/upload_success', success_page),
+        Route('/generation_stats', generation_stats),
+        # Everything else, including /webhook/stats and /logs/history, is served by Flask
+        Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_WORKERS)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,107 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import Flask, request, jsonify
+
+def create_app(latency=0.5, jitter=0.2, error_rate=0.0, retry_after=1.0):
+    """
+    Creates a Flask app imitating the OpenAI chat completions endpoint. Answers follow the app's prompts:
+    the numbered single-product format, or a JSON array with one object per listed product for batched
+    prompts.
+
+    Args:
+        latency (float): Seconds every completion takes.
+        jitter (float): Up to this many extra seconds, chosen at random, added to each completion.
+        error_rate (float): Share of requests rejected with HTTP 429.
+        retry_after (float): The retry-after hint sent with rejected requests, in seconds.
+
+    Returns:
+        Flask: The app.
+    """
+    app = Flask(__name__)
+    counters = Counter()
+    lock = threading.Lock()
+
+    def count(name, amount=1):
+        with lock:
+            counters[name] += amount
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        payload = request.get_json(silent=True) or {}
+        messages = payload.get("messages") or []
+
+        if random.random() < error_rate:
+            count("rate_limited")
+            response = jsonify({"error": {
+                "message": "Rate limit reached for requests",
+                "type": "requests",
+                "param": None,
+                "code": "rate_limit_exceeded",
+            }})
+            response.status_code = 429
+            response.headers["retry-after"] = str(retry_after)
+            response.headers["x-ratelimit-reset-requests"] = f"{int(retry_after * 1000)}ms"
+            return response
+
+        time.sleep(latency + random.uniform(0, jitter))
+
+        prompt = messages[-1]["content"] if messages else ""
+        content = _batch_answer(prompt) if "Products:" in prompt else _single_answer(prompt)
+        prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        count("completions")
+        count("completion_tokens", completion_tokens)
+
+        return jsonify({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    @app.route('/_stats')
+    def stats():
+        with lock:
+            return jsonify(dict(counters))
+
+    return app
+
+def _product_fields(title):
+    words = [word.lower() for word in re.findall(r"\w+", title)] or ["product"]
+    return {
+        "description": f"The {title} is a dependable everyday product, made to last and easy to care for. " * 3,
+        "tags": ", ".join(words[:5] + ["bench"]),
+        "category": "Benchmark Goods",
+    }
+
+def _single_answer(prompt):
+    match = re.search(r"titled '(.*)'", prompt)
+    fields = _product_fields(match.group(1) if match else "product")
+    return (
+        f"1. Description: {fields['description'].strip()}\n"
+        f"2. Tags: {fields['tags']}\n"
+        f"3. Category: {fields['category']}"
+    )
+
+def _batch_answer(prompt):
+    product_list = prompt.split("Products:", 1)[1]
+    items = [
+        dict(_product_fields(title.strip()), index=int(index), title=title.strip())
+        for index, title in re.findall(r"^\s*(\d+)\. (.+)$", product_list, re.MULTILINE)
+    ]
+    return json.dumps(items)
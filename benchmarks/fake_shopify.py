@@ -0,0 +1,450 @@
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from flask import Flask, request, jsonify, Response
+
+BENCH_VENDOR = "Bench Vendor"
+
+def build_catalogue(product_count, vendor=BENCH_VENDOR, variants_per_product=3):
+    """
+    Builds a deterministic product catalogue in the REST products endpoint structure. Every product's ID,
+    variants and inventory follow from its position, so the benchmark runner can derive inventory item IDs
+    without asking the server.
+
+    Args:
+        product_count (int): The number of products.
+        vendor (str): The vendor of every product.
+        variants_per_product (int): The number of variants per product.
+
+    Returns:
+        list: The products, ordered by ID.
+    """
+    base_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    products = []
+    for position in range(product_count):
+        product_id = 1000001 + position
+        # Every fifth product is sold out, so inventory webhooks move products between draft and active
+        quantity = 0 if position % 5 == 0 else position % 7 + 1
+        products.append({
+            "id": product_id,
+            "admin_graphql_api_id": f"gid://shopify/Product/{product_id}",
+            "title": f"Bench Product {position:05d}",
+            "vendor": vendor,
+            "status": "active",
+            "body_html": "",
+            "tags": "",
+            "product_type": "",
+            "updated_at": (base_time + timedelta(seconds=position)).isoformat(),
+            "variants": [
+                {
+                    "id": variant_id(product_id, number),
+                    "product_id": product_id,
+                    "title": f"Size {number + 1}",
+                    "inventory_item_id": inventory_item_id(product_id, number),
+                    "inventory_quantity": quantity,
+                }
+                for number in range(variants_per_product)
+            ],
+            "images": [],
+        })
+    return products
+
+def variant_id(product_id, number):
+    return product_id * 10 + number
+
+def inventory_item_id(product_id, number):
+    return 9000000000 + variant_id(product_id, number)
+
+def image_bytes(name, size):
+    """
+    Returns size bytes of deterministic fake JPEG data for an image name.
+    """
+    seed = hashlib.sha256(name.encode('utf-8')).digest()
+    return b'\xff\xd8\xff\xe0' + (seed * (size // len(seed) + 1))[:max(0, size - 4)]
+
+class FakeStore:
+    """
+    In-memory state of the fake Shopify store: the catalogue, both rate-limit buckets and request counters.
+    """
+    def __init__(self, products, rest_bucket_size, rest_leak_rate, graphql_bucket_size, graphql_restore_rate):
+        self.products = {product["id"]: product for product in products}
+        self.inventory_items = {
+            variant["inventory_item_id"]: (product["id"], variant)
+            for product in products for variant in product["variants"]
+        }
+        self.rest_bucket_size = rest_bucket_size
+        self.rest_leak_rate = rest_leak_rate
+        self.graphql_bucket_size = graphql_bucket_size
+        self.graphql_restore_rate = graphql_restore_rate
+        self.counters = Counter()
+        self.next_image_id = 1
+        self.bulk_operations = []  # (operation ID, vendor, ready at), the last one being current
+        self._lock = threading.Lock()
+        self._rest_used = 0.0
+        self._graphql_available = float(graphql_bucket_size)
+        self._last_update = time.monotonic()
+
+    def _leak(self):
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+        self._rest_used = max(0.0, self._rest_used - elapsed * self.rest_leak_rate)
+        self._graphql_available = min(
+            float(self.graphql_bucket_size), self._graphql_available + elapsed * self.graphql_restore_rate
+        )
+
+    def take_rest(self):
+        """
+        Takes one request from the REST bucket.
+
+        Returns:
+            str: The X-Shopify-Shop-Api-Call-Limit value, or None if the bucket is full and the call is throttled.
+        """
+        with self._lock:
+            self._leak()
+            if self._rest_used + 1 > self.rest_bucket_size:
+                self.counters["rest_throttled"] += 1
+                return None
+            self._rest_used += 1
+            return f"{int(self._rest_used + 0.999)}/{self.rest_bucket_size}"
+
+    def take_graphql(self, requested_cost, actual_cost):
+        """
+        Takes points from the GraphQL bucket.
+
+        Returns:
+            tuple: (allowed, extensions.cost object)
+        """
+        with self._lock:
+            self._leak()
+            allowed = requested_cost <= self._graphql_available
+            if allowed:
+                self._graphql_available -= actual_cost
+            else:
+                self.counters["graphql_throttled"] += 1
+            return allowed, {
+                "requestedQueryCost": requested_cost,
+                "actualQueryCost": actual_cost if allowed else None,
+                "throttleStatus": {
+                    "maximumAvailable": float(self.graphql_bucket_size),
+                    "currentlyAvailable": int(self._graphql_available),
+                    "restoreRate": float(self.graphql_restore_rate),
+                },
+            }
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+def create_app(product_count=1000, variants_per_product=3, latency=0.0, rest_bucket_size=400, rest_leak_rate=20.0,
+               graphql_bucket_size=2000, graphql_restore_rate=100.0, src_failure_rate=0.0, images_per_search=5,
+               image_size=50 * 1024, bulk_delay=1.0):
+    """
+    Creates a Flask app imitating the parts of the Shopify Admin API the app uses: REST products with Link
+    pagination, product updates (REST PUTs and aliased GraphQL productUpdate mutations), product images,
+    GraphQL inventory item lookups and bulk product exports, all behind REST and GraphQL rate-limit buckets with
+    Shopify's headers and throttling responses. It also serves an image search page and the images it
+    links to, standing in for the scraped search engine.
+
+    Args:
+        product_count (int): The number of products in the catalogue.
+        variants_per_product (int): The number of variants per product.
+        latency (float): Seconds added to every Admin API request.
+        rest_bucket_size (int): The REST bucket size (40 on standard plans, 400 on Plus).
+        rest_leak_rate (float): REST requests leaked per second (2 on standard plans, 20 on Plus).
+        graphql_bucket_size (int): The GraphQL cost bucket size.
+        graphql_restore_rate (float): GraphQL points restored per second.
+        src_failure_rate (float): Share of image uploads by URL that fail, as when Shopify cannot fetch the image.
+        images_per_search (int): The number of images on each search page.
+        image_size (int): The size in bytes of each served image.
+        bulk_delay (float): Seconds a bulk operation runs before its result is ready.
+
+    Returns:
+        Flask: The app.
+    """
+    app = Flask(__name__)
+    store = FakeStore(
+        build_catalogue(product_count, variants_per_product=variants_per_product),
+        rest_bucket_size, rest_leak_rate, graphql_bucket_size, graphql_restore_rate
+    )
+    app.config["store"] = store
+
+    @app.before_request
+    def simulate_latency():
+        if latency and request.path.startswith('/admin/'):
+            time.sleep(latency)
+
+    def rest_endpoint(view):
+        # Applies the REST bucket to a view and adds the call limit header to its response
+        def wrapped(*args, **kwargs):
+            call_limit = store.take_rest()
+            if call_limit is None:
+                response = jsonify({"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."})
+                response.status_code = 429
+                response.headers["Retry-After"] = "2.0"
+                return response
+            response = app.make_response(view(*args, **kwargs))
+            response.headers["X-Shopify-Shop-Api-Call-Limit"] = call_limit
+            return response
+        wrapped.__name__ = view.__name__
+        return wrapped
+
+    @app.route('/admin/api/<version>/products.json', methods=['GET'])
+    @rest_endpoint
+    def list_products(version):
+        store.count("GET products.json")
+        if request.args.get('page_info'):
+            cursor = json.loads(base64.urlsafe_b64decode(request.args['page_info']))
+        else:
+            cursor = {"vendor": request.args.get('vendor'), "updated_at_min": request.args.get('updated_at_min'), "offset": 0}
+        limit = min(int(request.args.get('limit', 50)), 250)
+
+        matching = [
+            product for product in store.products.values()
+            if (not cursor["vendor"] or product["vendor"] == cursor["vendor"])
+            and (not cursor["updated_at_min"] or product["updated_at"] >= cursor["updated_at_min"])
+        ]
+        page = matching[cursor["offset"]:cursor["offset"] + limit]
+
+        response = jsonify({"products": page})
+        if cursor["offset"] + limit < len(matching):
+            next_cursor = dict(cursor, offset=cursor["offset"] + limit)
+            page_info = base64.urlsafe_b64encode(json.dumps(next_cursor).encode('utf-8')).decode('ascii')
+            response.headers["Link"] = f'<{request.base_url}?limit={limit}&page_info={page_info}>; rel="next"'
+        return response
+
+    @app.route('/admin/api/<version>/products/<int:product_id>.json', methods=['PUT'])
+    @rest_endpoint
+    def update_product(version, product_id):
+        store.count("PUT products")
+        product = store.products.get(product_id)
+        if not product:
+            return jsonify({"errors": "Not Found"}), 404
+        changes = (request.get_json(silent=True) or {}).get("product") or {}
+        for field in ("body_html", "tags", "product_type", "status"):
+            if field in changes:
+                product[field] = changes[field]
+        product["updated_at"] = datetime.now(timezone.utc).isoformat()
+        return jsonify({"product": product})
+
+    @app.route('/admin/api/<version>/products/<int:product_id>/images.json', methods=['POST'])
+    @rest_endpoint
+    def create_product_image(version, product_id):
+        image = (request.get_json(silent=True) or {}).get("image") or {}
+        if product_id not in store.products:
+            return jsonify({"errors": "Not Found"}), 404
+        if image.get("src"):
+            store.count("POST images (src)")
+            if random.random() < src_failure_rate:
+                return jsonify({"errors": {"image": ["Could not download image"]}}), 422
+        elif image.get("attachment"):
+            store.count("POST images (attachment)")
+            store.count("attachment bytes", len(base64.b64decode(image["attachment"])))
+        else:
+            return jsonify({"errors": {"image": ["can't be blank"]}}), 422
+
+        with store._lock:
+            image_id = store.next_image_id
+            store.next_image_id += 1
+            created = {
+                "id": image_id,
+                "product_id": product_id,
+                "position": len(store.products[product_id]["images"]) + 1,
+                "src": f"https://cdn.shopify.example/files/{image_id}.jpg",
+            }
+            store.products[product_id]["images"].append(created)
+        return jsonify({"image": created})
+
+    @app.route('/admin/api/<version>/products/<int:product_id>/images/<int:image_id>.json', methods=['GET', 'DELETE'])
+    @rest_endpoint
+    def product_image(version, product_id, image_id):
+        store.count(f"{request.method} image")
+        images = (store.products.get(product_id) or {}).get("images") or []
+        image = next((image for image in images if image["id"] == image_id), None)
+        if not image:
+            return jsonify({"errors": "Not Found"}), 404
+        if request.method == 'DELETE':
+            with store._lock:
+                images.remove(image)
+            return jsonify({})
+        return jsonify({"image": image})
+
+    @app.route('/admin/api/<version>/graphql.json', methods=['POST'])
+    def graphql(version):
+        payload = request.get_json(silent=True) or {}
+        query = payload.get("query") or ""
+        variables = payload.get("variables") or {}
+
+        if "nodes(" in query:
+            store.count("graphql nodes")
+            ids = variables.get("ids") or []
+            cost = 3 * len(ids) + 1
+            allowed, cost_info = store.take_graphql(cost, cost)
+            if not allowed:
+                return _throttled(cost_info)
+            return jsonify({"data": {"nodes": [_inventory_item_node(store, gid) for gid in ids]}, "extensions": {"cost": cost_info}})
+
+        mutations = re.findall(r"(\w+)\s*:\s*productUpdate\(input:\s*\$(\w+)\)", query)
+        if mutations:
+            store.count("graphql productUpdate")
+            store.count("productUpdate products", len(mutations))
+            cost = 10 * len(mutations) + 1
+            allowed, cost_info = store.take_graphql(cost, 10 * len(mutations))
+            if not allowed:
+                return _throttled(cost_info)
+            data = {alias: _product_update(store, variables.get(variable) or {}) for alias, variable in mutations}
+            return jsonify({"data": data, "extensions": {"cost": cost_info}})
+
+        if "bulkOperationRunQuery" in query:
+            store.count("graphql bulkOperationRunQuery")
+            allowed, cost_info = store.take_graphql(10, 10)
+            if not allowed:
+                return _throttled(cost_info)
+            with store._lock:
+                operation_id = f"gid://shopify/BulkOperation/{len(store.bulk_operations) + 1}"
+                store.bulk_operations.append((operation_id, _bulk_vendor(variables.get("query") or ""), time.monotonic() + bulk_delay))
+            return jsonify({"data": {"bulkOperationRunQuery": {
+                "bulkOperation": {"id": operation_id, "status": "CREATED"},
+                "userErrors": [],
+            }}, "extensions": {"cost": cost_info}})
+
+        if "currentBulkOperation" in query:
+            store.count("graphql currentBulkOperation")
+            allowed, cost_info = store.take_graphql(1, 1)
+            if not allowed:
+                return _throttled(cost_info)
+            with store._lock:
+                current = store.bulk_operations[-1] if store.bulk_operations else None
+            operation = None
+            if current:
+                operation_id, vendor, ready_at = current
+                completed = time.monotonic() >= ready_at
+                object_count = sum(
+                    1 + len(product["variants"]) for product in store.products.values()
+                    if not vendor or product["vendor"] == vendor
+                )
+                operation = {
+                    "id": operation_id,
+                    "status": "COMPLETED" if completed else "RUNNING",
+                    "errorCode": None,
+                    "objectCount": str(object_count) if completed else "0",
+                    "url": f"{request.host_url}bulk-results/{operation_id.split('/')[-1]}.jsonl" if completed else None,
+                }
+            return jsonify({"data": {"currentBulkOperation": operation}, "extensions": {"cost": cost_info}})
+
+        store.count("graphql unsupported")
+        return jsonify({"errors": [{"message": "Query not supported by the fake store"}]})
+
+    @app.route('/bulk-results/<int:number>.jsonl')
+    def bulk_result(number):
+        # Stands in for the signed storage URL, which must be fetched without the store's access token
+        store.count("GET bulk result")
+        if "X-Shopify-Access-Token" in request.headers:
+            store.count("bulk result requests with access token")
+        if number > len(store.bulk_operations):
+            return jsonify({"errors": "Not Found"}), 404
+        vendor = store.bulk_operations[number - 1][1]
+        products = [product for product in store.products.values() if not vendor or product["vendor"] == vendor]
+        return Response(bulk_products_jsonl(products), mimetype="application/jsonl")
+
+    @app.route('/search')
+    def image_search():
+        store.count("GET search")
+        query = request.args.get('q', '')
+        images = "".join(
+            f'<img src="{request.host_url}images/{hashlib.md5(f"{query}-{number}".encode("utf-8")).hexdigest()}.jpg">'
+            for number in range(images_per_search)
+        )
+        return f"<html><body>{images}</body></html>"
+
+    @app.route('/images/<name>.jpg')
+    def image(name):
+        store.count("GET images")
+        return Response(image_bytes(name, image_size), mimetype="image/jpeg")
+
+    @app.route('/_stats')
+    def stats():
+        with store._lock:
+            return jsonify(dict(store.counters))
+
+    return app
+
+def bulk_products_jsonl(products):
+    """
+    Yields the JSONL result of the app's bulk products query, one line per product followed by a line per
+    variant linked with __parentId, as Shopify writes it (see benchmarks/fixtures/bulk_products.jsonl).
+    """
+    for product in products:
+        yield json.dumps({
+            "id": product["admin_graphql_api_id"],
+            "title": product["title"],
+            "vendor": product["vendor"],
+            "status": product["status"].upper(),
+            "updatedAt": product["updated_at"],
+        }) + "\n"
+        for variant in product["variants"]:
+            yield json.dumps({
+                "id": f"gid://shopify/ProductVariant/{variant['id']}",
+                "inventoryQuantity": variant["inventory_quantity"],
+                "inventoryItem": {"id": f"gid://shopify/InventoryItem/{variant['inventory_item_id']}"},
+                "__parentId": product["admin_graphql_api_id"],
+            }) + "\n"
+
+def _bulk_vendor(bulk_query):
+    # The app's bulk query searches products with a quoted vendor:"..." term
+    literal = re.search(r'products\(query:\s*("(?:[^"\\]|\\.)*")', bulk_query)
+    search = json.loads(literal.group(1)) if literal else ""
+    match = re.search(r'vendor:"((?:[^"\\]|\\.)*)"', search)
+    return re.sub(r'\\(.)', r'\1', match.group(1)) if match else None
+
+def _inventory_item_node(store, gid):
+    try:
+        inventory_item_id = int(gid.split('/')[-1])
+    except ValueError:
+        return None
+    if inventory_item_id not in store.inventory_items:
+        return None
+    product_id, variant = store.inventory_items[inventory_item_id]
+    product = store.products[product_id]
+    return {
+        "id": gid,
+        "variant": {
+            "title": variant["title"],
+            "product": {
+                "id": product["admin_graphql_api_id"],
+                "title": product["title"],
+                "status": product["status"].upper(),
+                "totalInventory": sum(v["inventory_quantity"] for v in product["variants"]),
+            },
+        },
+    }
+
+def _product_update(store, product_input):
+    try:
+        product_id = int(str(product_input.get("id", "")).split('/')[-1])
+    except ValueError:
+        product_id = None
+    product = store.products.get(product_id)
+    if not product:
+        return {"product": None, "userErrors": [{"field": ["id"], "message": "Product does not exist"}]}
+
+    fields = {"descriptionHtml": "body_html", "productType": "product_type", "status": "status"}
+    for input_field, product_field in fields.items():
+        if input_field in product_input:
+            product[product_field] = product_input[input_field].lower() if input_field == "status" else product_input[input_field]
+    if "tags" in product_input:
+        product["tags"] = ", ".join(product_input["tags"])
+    product["updated_at"] = datetime.now(timezone.utc).isoformat()
+    return {"product": {"id": product["admin_graphql_api_id"]}, "userErrors": []}
+
+def _throttled(cost_info):
+    return jsonify({
+        "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED", "documentation": "https://shopify.dev/api/usage/rate-limits"}}],
+        "extensions": {"cost": cost_info},
+    })
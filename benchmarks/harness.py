@@ -0,0 +1,126 @@
+import logging
+import multiprocessing
+import resource
+import socket
+import threading
+import time
+import requests
+from werkzeug.serving import make_server
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _serve(factory, kwargs, port):
+    # Runs in a child process; request logging would only slow the stand-in down
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, factory(**kwargs), threaded=True).serve_forever()
+
+def start_server_process(factory, **kwargs):
+    """
+    Serves the app returned by factory(**kwargs) from a separate process, so the stand-in servers do not
+    compete with the app under test for the GIL.
+
+    Returns:
+        tuple: (process, base URL)
+    """
+    port = free_port()
+    process = multiprocessing.get_context('spawn').Process(target=_serve, args=(factory, kwargs, port), daemon=True)
+    process.start()
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{base_url}/_stats")
+    return process, base_url
+
+def start_server_thread(app):
+    """
+    Serves a WSGI app from a background thread of this process with werkzeug's threaded server.
+
+    Returns:
+        tuple: (server, base URL)
+    """
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.port}"
+
+def start_asgi_server_thread(app):
+    """
+    Serves an ASGI app from a background thread of this process with uvicorn.
+
+    Returns:
+        tuple: (server, base URL)
+    """
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='error', access_log=False))
+    threading.Thread(target=server.run, name="bench-asgi-server", daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{base_url}/webhook/stats")
+    return server, base_url
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {url} did not start within {timeout} seconds")
+            time.sleep(0.1)
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of values, or None if there are none.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+class LatencyRecorder:
+    """
+    Thread-safe collection of latency samples, in seconds.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+        self.errors = 0
+
+    def record(self, seconds, ok=True):
+        with self._lock:
+            self.samples.append(seconds)
+            if not ok:
+                self.errors += 1
+
+    def summary(self):
+        """
+        Returns the count, error count and the p50, p99 and maximum latency in milliseconds.
+        """
+        with self._lock:
+            samples = list(self.samples)
+        return {
+            "count": len(samples),
+            "errors": self.errors,
+            "p50_ms": _ms(percentile(samples, 50)),
+            "p99_ms": _ms(percentile(samples, 99)),
+            "max_ms": _ms(max(samples) if samples else None),
+        }
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in MiB (ru_maxrss is in KiB on Linux).
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def counter_delta(before, after):
+    """
+    Returns the counters that changed between two /_stats snapshots of a stand-in server.
+    """
+    return {key: value - before.get(key, 0) for key, value in sorted(after.items()) if value != before.get(key, 0)}
@@ -0,0 +1,338 @@
+"""
+Benchmarks the app against local stand-ins for the Shopify Admin API and OpenAI, so throughput can be
+measured without touching a real store.
+
+Usage (from the repository root):
+    python -m benchmarks.run webhooks --rate 5000 --duration 60
+    python -m benchmarks.run vendor --products 1000
+    python -m benchmarks.run vendor --set VENDOR_FETCH_MODE=bulk --set BULK_POLL_INTERVAL=0.2
+    python -m benchmarks.run upload --products 500 --images 2
+    python -m benchmarks.run webhooks --server asgi --rate 20000
+    python -m benchmarks.run webhooks --max-pending 2 --duration 10
+
+The stand-ins run in their own processes. The app runs in this process on werkzeug's threaded server,
+or on uvicorn through asgi.py with --server asgi. A generated config module points it at the stand-ins
+and at a temporary directory for its databases, so a real config.py is never used. Any other setting
+can be overridden with --set NAME=VALUE.
+"""
+import argparse
+import ast
+import base64
+import hashlib
+import hmac
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import uuid
+import os
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmarks import fake_openai, fake_shopify
+from benchmarks.harness import (
+    LatencyRecorder, counter_delta, peak_rss_mb, start_server_process, start_server_thread,
+    start_asgi_server_thread
+)
+
+WEBHOOK_SECRET = "bench-secret"
+
+def install_config(shopify_url, openai_url, data_dir, args):
+    """
+    Registers a config module for the app, pointing it at the stand-ins. Must run before the app is imported.
+    """
+    settings = {
+        "SHOPIFY_STORE": "bench.myshopify.com",
+        "SHOPIFY_ACCESS_TOKEN": "bench",
+        "SHOPIFY_API_BASE_URL": f"{shopify_url}/admin/api/2023-07",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_BASE": f"{openai_url}/v1",
+        "IMAGE_SEARCH_URL": f"{shopify_url}/search",
+        "SCRAPE_DELAY": (0, 0),
+        "IGNORE_LIST_FILE": os.path.join(data_dir, "ignored_products.json"),
+        "CONTENT_CACHE_PATH": os.path.join(data_dir, "content_cache.db"),
+        "IMAGE_INDEX_PATH": os.path.join(data_dir, "image_index.db"),
+        "WEBHOOK_INBOX_PATH": os.path.join(data_dir, "webhook_inbox.db"),
+        "SHOPIFY_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEBHOOK_DEBOUNCE_DELAY": args.debounce,
+        "WEBHOOK_DEBOUNCE_MAX_PENDING": args.max_pending,
+        # Match the app's limiter to the stand-in's buckets
+        "SHOPIFY_REST_BUCKET_SIZE": args.rest_bucket_size,
+        "SHOPIFY_REST_LEAK_RATE": args.rest_leak_rate,
+        "SHOPIFY_GRAPHQL_BUCKET_SIZE": args.graphql_bucket_size,
+        "SHOPIFY_GRAPHQL_RESTORE_RATE": args.graphql_restore_rate,
+        # High enough that the stand-in's latency, not the client-side budget, limits generation
+        "OPENAI_REQUESTS_PER_MINUTE": 10000,
+        "OPENAI_TOKENS_PER_MINUTE": 2000000,
+    }
+    for override in args.set:
+        name, _, value = override.partition("=")
+        try:
+            settings[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            settings[name] = value
+
+    config = types.ModuleType("config")
+    config.__dict__.update(settings)
+    sys.modules["config"] = config
+    return settings
+
+def inventory_item_ids(product_count):
+    return [
+        variant["inventory_item_id"]
+        for product in fake_shopify.build_catalogue(product_count)
+        for variant in product["variants"]
+    ]
+
+def sign(body):
+    digest = hmac.new(WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+def run_webhooks(args, app_url):
+    """
+    Sends inventory webhooks at a fixed rate (open loop, so a slow server does not slow the sender down),
+    then waits until the app has processed all of them.
+
+    The run fails its checks if webhooks are left unprocessed (e.g. status updates dropped by the debouncer)
+    or if the debouncer flushed more often than webhooks were sent, which means it is spinning.
+    """
+    items = inventory_item_ids(args.products)
+    total = max(1, int(args.rate / 60 * args.duration))
+    interval = 60.0 / args.rate
+    latencies = LatencyRecorder()
+    local = threading.local()
+    debouncer_before = requests.get(f"{app_url}/webhook/stats", timeout=10).json()["debouncer"]
+
+    def send(number, scheduled):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = json.dumps({
+            "inventory_item_id": random.choice(items),
+            "location_id": 1,
+            "available": random.randint(0, 5),
+        }).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "X-Shopify-Topic": "inventory_levels/update",
+            "X-Shopify-Webhook-Id": f"bench-{number}-{uuid.uuid4().hex}",
+            "X-Shopify-Hmac-Sha256": sign(body),
+        }
+        try:
+            ok = session.post(f"{app_url}/webhook", data=body, headers=headers, timeout=30).status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        # Measured from the scheduled send time, so queueing in front of a slow server counts
+        latencies.record(time.perf_counter() - scheduled, ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        for number in range(total):
+            scheduled = started + number * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, number, scheduled)
+    sent_seconds = time.perf_counter() - started
+
+    # Wait for the inbox, the inventory lookups and the debounced status updates to finish
+    drained = False
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline:
+        stats = requests.get(f"{app_url}/webhook/stats", timeout=10).json()
+        if not stats.get("inbox_backlog") and not stats.get("pending_webhooks") and not stats.get("pending_status_updates"):
+            drained = True
+            break
+        time.sleep(0.25)
+    drain_seconds = time.perf_counter() - started - sent_seconds
+
+    debouncer = counter_delta(debouncer_before, requests.get(f"{app_url}/webhook/stats", timeout=10).json()["debouncer"])
+    failed_checks = []
+    if not drained:
+        failed_checks.append("webhooks left unprocessed")
+    if debouncer.get("flushes", 0) > total:
+        failed_checks.append("debouncer flushed more often than webhooks were sent")
+
+    return dict(
+        latencies.summary(),
+        requests_per_second=round(total / sent_seconds, 1),
+        drained=drained,
+        drain_seconds=round(drain_seconds, 2),
+        debounce_flushes=debouncer.get("flushes", 0),
+        debounce_early_flushes=debouncer.get("early_flushes", 0),
+        failed_checks=failed_checks,
+    )
+
+def run_vendor(args, app_url):
+    """
+    Generates content for a whole vendor, repeated --repeat times, measuring time to first byte and total time.
+    """
+    latencies = LatencyRecorder()
+    first_bytes = LatencyRecorder()
+    form = {
+        "vendor": fake_shopify.BENCH_VENDOR,
+        "min_inventory_level": 1000,
+        "force_regenerate": "1",
+    }
+    if args.concurrency:
+        form["concurrency"] = args.concurrency
+
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        with requests.post(f"{app_url}/generate_for_vendor", data=form, stream=True, timeout=None) as response:
+            chunks = response.iter_content(chunk_size=65536)
+            next(chunks, None)
+            first_bytes.record(time.perf_counter() - started)
+            for _ in chunks:
+                pass
+        latencies.record(time.perf_counter() - started, response.status_code == 200)
+
+    summary = latencies.summary()
+    return dict(
+        summary,
+        first_byte_p50_ms=first_bytes.summary()["p50_ms"],
+        products_per_second=round(args.products / (summary["p50_ms"] / 1000), 1) if summary["p50_ms"] else None,
+    )
+
+def run_upload(args, app_url, shopify_url):
+    """
+    Approves every product of the vendor at once, as the review page's form would, with --images selected
+    images per product.
+    """
+    products = fake_shopify.build_catalogue(args.products)
+    form = []
+    for product in products:
+        product_id = product["id"]
+        form.append(("product_ids", product_id))
+        form.append((f"description_{product_id}", f"<p>Description of {product['title']}</p>"))
+        form.append((f"tags_{product_id}", "bench, tags"))
+        form.append((f"category_{product_id}", "Benchmark Goods"))
+        for number in range(args.images):
+            form.append((f"selected_images_{product_id}", f"{shopify_url}/images/{product_id}-{number}.jpg"))
+
+    latencies = LatencyRecorder()
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        response = requests.post(f"{app_url}/upload_content", data=form, allow_redirects=False, timeout=None)
+        latencies.record(time.perf_counter() - started, response.status_code in (200, 302))
+
+    summary = latencies.summary()
+    return dict(
+        summary,
+        products_per_second=round(args.products / (summary["p50_ms"] / 1000), 1) if summary["p50_ms"] else None,
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app against local Shopify and OpenAI stand-ins.")
+    parser.add_argument("scenario", choices=["webhooks", "vendor", "upload"])
+    parser.add_argument("--products", type=int, default=1000, help="Products in the stand-in catalogue (default 1000)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of the vendor and upload scenarios")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed, for reproducible runs")
+
+    webhooks = parser.add_argument_group("webhooks scenario")
+    webhooks.add_argument("--rate", type=float, default=5000, help="Webhooks per minute (default 5000)")
+    webhooks.add_argument("--duration", type=float, default=60, help="Seconds to send webhooks for (default 60)")
+    webhooks.add_argument("--clients", type=int, default=32, help="Concurrent webhook senders")
+    webhooks.add_argument("--debounce", type=float, default=2.0, help="WEBHOOK_DEBOUNCE_DELAY for the run")
+    webhooks.add_argument("--max-pending", type=int, default=10000,
+                          help="WEBHOOK_DEBOUNCE_MAX_PENDING for the run; small values exercise the early flush")
+    webhooks.add_argument("--drain-timeout", type=float, default=300, help="Longest wait for processing to finish")
+
+    vendor = parser.add_argument_group("vendor and upload scenarios")
+    vendor.add_argument("--concurrency", type=int, help="Pipeline concurrency sent with the vendor form")
+    vendor.add_argument("--images", type=int, default=1, help="Selected images per product in the upload scenario")
+
+    shopify = parser.add_argument_group("Shopify stand-in")
+    shopify.add_argument("--shopify-latency", type=float, default=0.05, help="Seconds per Admin API request")
+    shopify.add_argument("--rest-bucket-size", type=int, default=400)
+    shopify.add_argument("--rest-leak-rate", type=float, default=20.0)
+    shopify.add_argument("--graphql-bucket-size", type=int, default=2000)
+    shopify.add_argument("--graphql-restore-rate", type=float, default=100.0)
+    shopify.add_argument("--src-failure-rate", type=float, default=0.0,
+                         help="Share of image uploads by URL that fail, forcing download and re-upload")
+
+    openai = parser.add_argument_group("OpenAI stand-in")
+    openai.add_argument("--openai-latency", type=float, default=1.0, help="Seconds per completion")
+    openai.add_argument("--openai-jitter", type=float, default=0.5, help="Extra random seconds per completion")
+    openai.add_argument("--openai-error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi",
+                        help="Serve the app with werkzeug's threaded server or with uvicorn through asgi.py")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override an app config setting, e.g. --set GENERATION_CONCURRENCY=16")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also report peak Python heap allocations (tracemalloc; slows the app down)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results to a JSON file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    _, shopify_url = start_server_process(
+        fake_shopify.create_app,
+        product_count=args.products,
+        latency=args.shopify_latency,
+        rest_bucket_size=args.rest_bucket_size,
+        rest_leak_rate=args.rest_leak_rate,
+        graphql_bucket_size=args.graphql_bucket_size,
+        graphql_restore_rate=args.graphql_restore_rate,
+        src_failure_rate=args.src_failure_rate,
+    )
+    _, openai_url = start_server_process(
+        fake_openai.create_app,
+        latency=args.openai_latency,
+        jitter=args.openai_jitter,
+        error_rate=args.openai_error_rate,
+    )
+
+    data_dir = tempfile.mkdtemp(prefix="bench-")
+    settings = install_config(shopify_url, openai_url, data_dir, args)
+
+    # Imported only now, so that it reads the generated config
+    if args.server == "asgi":
+        from asgi import app
+        _, app_url = start_asgi_server_thread(app)
+    else:
+        from app import app
+        _, app_url = start_server_thread(app)
+
+    shopify_before = requests.get(f"{shopify_url}/_stats").json()
+    openai_before = requests.get(f"{openai_url}/_stats").json()
+    if args.trace_memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    if args.scenario == "webhooks":
+        result = run_webhooks(args, app_url)
+    elif args.scenario == "vendor":
+        result = run_vendor(args, app_url)
+    else:
+        result = run_upload(args, app_url, shopify_url)
+    result["wall_seconds"] = round(time.perf_counter() - started, 2)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    if args.trace_memory:
+        result["peak_python_heap_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    result["shopify_requests"] = counter_delta(shopify_before, requests.get(f"{shopify_url}/_stats").json())
+    result["openai_requests"] = counter_delta(openai_before, requests.get(f"{openai_url}/_stats").json())
+
+    report = {
+        "scenario": args.scenario,
+        "arguments": {name: value for name, value in vars(args).items() if name not in ("json",)},
+        "config": {name: value for name, value in settings.items() if "PATH" not in name and "FILE" not in name},
+        "result": result,
+    }
+    print(json.dumps(report["result"], indent=2, default=str))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, default=str)
+    if result.get("failed_checks"):
+        sys.exit("Failed checks: " + "; ".join(result["failed_checks"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify
+from utils.job_queue import get_job_queue
+
+# Define the jobs blueprint
+jobs_bp = Blueprint('jobs', __name__)
+
+# Route for submitting a background content-generation job
+@jobs_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    data = request.get_json(silent=True) or request.form
+    vendor = data.get('vendor')
+    min_inventory_level = int(data.get('min_inventory_level', 0))  # Default to 0 if not specified
+
+    if not vendor:
+        return "Vendor not specified", 400
+
+    force_regenerate = bool(data.get('force_regenerate'))
+
+    job_id = get_job_queue().submit(vendor, min_inventory_level, force_regenerate)
+
+    # API clients get the job id straight away; browser forms are sent to the progress page
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            "job_id": job_id,
+            "progress_url": url_for('jobs.job_progress', job_id=job_id),
+            "review_url": url_for('jobs.review_job', job_id=job_id),
+        }), 202
+    return redirect(url_for('jobs.job_page', job_id=job_id))
+
+# Route for the job progress page
+@jobs_bp.route('/jobs/<job_id>')
+def job_page(job_id):
+    job = get_job_queue().get_job(job_id)
+    if not job:
+        return "Job not found", 404
+    return render_template('job.html', job=job)
+
+# Route for polling job progress
+@jobs_bp.route('/jobs/<job_id>/progress')
+def job_progress(job_id):
+    job = get_job_queue().get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+# Route for reviewing the results of a job, including a job that is still running
+@jobs_bp.route('/jobs/<job_id>/review')
+def review_job(job_id):
+    job_queue = get_job_queue()
+    if not job_queue.get_job(job_id):
+        return "Job not found", 404
+    return render_template('review_content.html', products=job_queue.get_results(job_id))
@@ -1,9 +1,27 @@
-from flask import Blueprint, Response, render_template
-import time
-from utils.logging_helper import log_data
+from flask import Blueprint, Response, render_template, request, jsonify
+from utils.logging_helper import log_store, entry_matches
 
 logs_bp = Blueprint('logs', __name__)
 
+# Seconds between keep-alive comments on an idle stream, so disconnected clients are noticed
+KEEP_ALIVE_INTERVAL = 15
+
+def log_filters(args):
+    # Server-side filters shared by the stream and history endpoints (and the ASGI log stream)
+    return {
+        "level": args.get('level'),
+        "logger": args.get('logger'),
+        "product_id": args.get('product_id'),
+        "job_id": args.get('job_id'),
+    }
+
+def format_event(entry_seq, entry):
+    """
+    Formats a log entry as a server-sent event; the id lets the browser resume after reconnecting.
+    """
+    data = "\n".join(f"data: {line}" for line in entry["message"].splitlines() or [""])
+    return f"id: {log_store.event_id(entry_seq)}\n{data}\n\n"
+
 @logs_bp.route('/logs')
 def logs_page():
     return render_template('logs.html')  # Ensure 'logs.html' exists in the 'templates' folder
@@ -11,12 +29,41 @@ def logs_page():
 # Stream logs
 @logs_bp.route('/logs/stream')
 def stream_logs():
+    # Resume after the last entry the client saw when the browser reconnects
+    last_seq = log_store.resume_point(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    filters = log_filters(request.args)
+
+    if not log_store.add_subscriber():
+        return "Too many log stream clients", 503
+
     def generate():
-        previous_log_count = 0
+        seq = last_seq
         while True:
-            if len(log_data) > previous_log_count:
-                for log_entry in log_data[previous_log_count:]:
-                    yield f"data: {log_entry}\n\n"
-                previous_log_count = len(log_data)
-            time.sleep(1)
-    return Response(generate(), mimetype='text/event-stream')
+            entries = log_store.wait_for_entries(seq, timeout=KEEP_ALIVE_INTERVAL)
+            if not entries:
+                yield ": keep-alive\n\n"
+                continue
+            seq = entries[-1][0]
+            for entry_seq, entry in entries:
+                if entry_matches(entry, **filters):
+                    yield format_event(entry_seq, entry)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # Runs when the client disconnects, even if the stream never started
+    response.call_on_close(log_store.remove_subscriber)
+    return response
+
+# Page through the buffered log history as JSON
+@logs_bp.route('/logs/history')
+def log_history():
+    after = request.args.get('after', 0, type=int)
+    before = request.args.get('before', type=int)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+
+    entries = log_store.between(after, before, limit, **log_filters(request.args))
+    return jsonify({
+        "entries": entries,
+        "last_seq": log_store.last_seq,
+        # Pass as 'after' to fetch the next page
+        "next_after": entries[-1]["seq"] if entries else after,
+    })
@@ -0,0 +1,9 @@
+from flask import Blueprint, Response
+from utils.metrics import render
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Route exposing latency histograms and request counters in the Prometheus text format
+@metrics_bp.route('/metrics')
+def metrics():
+    return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
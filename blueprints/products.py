@@ -1,11 +1,23 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, Response, render_template, request, jsonify, stream_template, redirect, url_for
 import logging
-from utils.openai_helper import generate_product_content, parse_generated_content
-from utils.shopify_helper import get_vendor_products, update_product_with_content, scrape_images, upload_images_to_shopify, download_image
+import uuid
+import config
+from utils.pipeline import generate_products_content, iter_products_content
+from utils.openai_helper import openai_limiter
+from utils.image_pipeline import transfer_images
+from utils.shopify_helper import get_vendor_products, update_products
+from utils.shared_state import get_shared_state
 
 # Define the products blueprint
 products_bp = Blueprint('products', __name__)
 
+# Stream the review page, sending each product's block as soon as its content is ready, instead of
+# rendering the page once every product is done
+REVIEW_STREAMING = getattr(config, 'REVIEW_STREAMING', True)
+
+# Seconds the per-product results of an upload stay available to the success page
+UPLOAD_RESULTS_TTL = getattr(config, 'UPLOAD_RESULTS_TTL', 3600)
+
 # Route for generating content for a vendor
 @products_bp.route('/generate_for_vendor', methods=['POST'])
 def generate_for_vendor():
@@ -21,33 +33,22 @@ def generate_for_vendor():
     if not products:
         return f"No products found for vendor {vendor} below the minimum inventory level", 404
 
-    product_responses = []
-
-    for product in products:
-        product_title = product['title']
-        product_id = product['id']
+    # Optional per-request override of the pipeline parallelism
+    concurrency = request.form.get('concurrency', type=int)
 
-        # Log the product being processed
-        logging.info(f"Processing product '{product_title}' with ID {product_id}")
+    # Regenerate content even for products that were generated before
+    force_regenerate = bool(request.form.get('force_regenerate'))
 
-        # Generate content only for products below the minimum inventory level
-        generated_content = generate_product_content(product_title)
-        if not generated_content:
-            logging.error(f"Failed to generate content for product '{product_title}'")
-            continue
+    if REVIEW_STREAMING:
+        # The page is rendered while the products are processed, in product order
+        product_responses = iter_products_content(products, max_workers=concurrency, force_regenerate=force_regenerate)
+        response = Response(stream_template('review_content.html', products=product_responses))
+        # Stop reverse proxies such as nginx from buffering the streamed page
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
 
-        description, tags, category = parse_generated_content(generated_content)
-        images = scrape_images(product_title)
-
-        # Add the product details and generated content to the response list
-        product_responses.append({
-            "product_id": product_id,
-            "title": product_title,
-            "description": description,
-            "tags": tags,
-            "category": category,
-            "images": images
-        })
+    # Generate content and look up images for many products at once; results keep the product order
+    product_responses = generate_products_content(products, max_workers=concurrency, force_regenerate=force_regenerate)
 
     # Render the review content page for the user to review the generated content
     return render_template('review_content.html', products=product_responses)
@@ -55,30 +56,91 @@ def generate_for_vendor():
 # Route for uploading content
 @products_bp.route('/upload_content', methods=['POST'])
 def upload_content():
-    product_ids = request.form.getlist('product_ids')
+    product_ids, updates, images = parse_upload_form(request.form)
+
+    # Update the products with the generated content in batched GraphQL mutations
+    errors = update_products(updates)
+
+    # Transfer the selected images for all products concurrently
+    transferred = transfer_images(images)
+
+    # Redirect rather than render, so that refreshing the success page does not send every update again
+    upload_id = store_upload_results(product_ids, errors, transferred)
+    return redirect(url_for('products.success_page', upload_id=upload_id))
+
+def parse_upload_form(form):
+    """
+    Reads the reviewed content submitted from the review page. Shared with the upload route in asgi.py.
+
+    Args:
+        form (MultiDict): The submitted form.
+
+    Returns:
+        tuple: The product IDs, one update per product for update_products, and the (product ID, image URL)
+        pairs of the selected images.
+    """
+    product_ids = form.getlist('product_ids')
+    updates = []
+    images = []
 
     for product_id in product_ids:
-        description = request.form.get(f'description_{product_id}')
-        tags = request.form.get(f'tags_{product_id}')
-        category = request.form.get(f'category_{product_id}')
-        selected_images = request.form.getlist(f'selected_images_{product_id}')
+        description = form.get(f'description_{product_id}')
+        tags = form.get(f'tags_{product_id}')
+        category = form.get(f'category_{product_id}')
+        selected_images = form.getlist(f'selected_images_{product_id}')
 
         # Log the collected data for each product
         logging.info(f"Processing product {product_id} with description: {description}, tags: {tags}, category: {category}")
         logging.info(f"Selected images: {selected_images}")
 
-        # Update the product with the generated content and upload images
-        update_product_with_content(product_id, description, tags, category)
-
-        for image_url in selected_images:
-            image_data = download_image(image_url)
-            if image_data:
-                upload_images_to_shopify(product_id, image_data, filename="product_image.jpg")
-
-    # Redirect to the success page after all products are processed
-    return redirect(url_for('products.success_page'))
+        updates.append({"id": product_id, "description": description, "tags": tags, "category": category})
+        images.extend((product_id, image_url) for image_url in selected_images)
+
+    return product_ids, updates, images
+
+def store_upload_results(product_ids, errors, transferred):
+    """
+    Stores the outcome of an upload for every product, for the success page. The results are kept in the
+    shared state, as the success page may be served by another worker.
+
+    Args:
+        product_ids (list): The uploaded product IDs.
+        errors (dict): The product update errors, as returned by update_products.
+        transferred (list): The image transfers, as returned by transfer_images.
+
+    Returns:
+        str: The upload ID to pass to the success page.
+    """
+    results = {
+        product_id: {"product_id": product_id, "error": errors.get(product_id), "images_uploaded": 0, "images_failed": 0}
+        for product_id in product_ids
+    }
+    for image in transferred:
+        results[image['product_id']]["images_uploaded" if image['image'] else "images_failed"] += 1
+
+    upload_id = uuid.uuid4().hex
+    get_shared_state().set_value(f"upload_results:{upload_id}", list(results.values()), UPLOAD_RESULTS_TTL)
+    return upload_id
+
+def load_upload_results(upload_id):
+    """
+    Returns the results stored by store_upload_results, or None if they have expired.
+    """
+    return get_shared_state().get_value(f"upload_results:{upload_id}")
 
 # Route for the success page after content upload
 @products_bp.route('/upload_success')
 def success_page():
-    return render_template('success.html')
\ No newline at end of file
+    upload_id = request.args.get('upload_id')
+    if not upload_id:
+        return render_template('success.html')
+
+    results = load_upload_results(upload_id)
+    if results is None:
+        return "Upload results not found or expired", 404
+    return render_template('success.html', results=results)
+
+# Route reporting time spent waiting on OpenAI rate limits versus generating
+@products_bp.route('/generation_stats')
+def generation_stats():
+    return jsonify(openai_limiter.stats())
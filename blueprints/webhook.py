@@ -1,43 +1,243 @@
 from flask import Blueprint, request, jsonify
-from utils.shopify_helper import get_parent_product_info, update_product_status
+from utils.shopify_helper import update_products_status
+from utils.inventory_batcher import get_inventory_batcher
+from utils.debounce import KeyedDebouncer
+from utils.status_cache import status_cache
+from utils.product_index import get_product_index
+from utils.ignore_store import ignore_store
+from utils.shared_state import get_shared_state
+from utils.webhook_inbox import get_webhook_inbox
+from utils.logging_helper import log_context
+from concurrent.futures import Future
+import base64
+import hashlib
+import hmac
 import logging
-from threading import Timer
+import os
+import threading
+import config
 
 webhook_bp = Blueprint('webhook', __name__)
 
-# In-memory store for webhook events
-webhook_store = {}
+# Seconds to wait for more webhooks for the same product before updating its status
+WEBHOOK_DEBOUNCE_DELAY = getattr(config, 'WEBHOOK_DEBOUNCE_DELAY', 2.0)
 
-# Webhook route to handle Shopify product updates
+# Pending products beyond which the oldest are flushed before their debounce delay has passed
+WEBHOOK_DEBOUNCE_MAX_PENDING = getattr(config, 'WEBHOOK_DEBOUNCE_MAX_PENDING', 10000)
+
+# Shared secret used to verify webhook signatures; verification is skipped if it is not configured
+SHOPIFY_WEBHOOK_SECRET = getattr(config, 'SHOPIFY_WEBHOOK_SECRET', None)
+
+# Webhook route to handle Shopify product updates. The webhook is only verified and stored in the
+# durable inbox here; the inbox consumer processes it after Shopify has been acknowledged.
 @webhook_bp.route('/webhook', methods=['POST'])
 def handle_webhook():
-    payload = request.json
-    logging.info('Received webhook payload:')
+    result, status_code = accept_webhook(request.get_data(), request.headers)
+    return jsonify(result), status_code
+
+def accept_webhook(body, headers):
+    """
+    Verifies a received webhook and stores it in the inbox. Shared by the Flask route and the ASGI app.
+
+    Args:
+        body (bytes): The raw request body.
+        headers (Mapping): The request headers.
+
+    Returns:
+        tuple: (response JSON, HTTP status code)
+    """
+    if SHOPIFY_WEBHOOK_SECRET and not verify_webhook(body, headers.get('X-Shopify-Hmac-Sha256', '')):
+        logging.warning("Rejected webhook with an invalid HMAC signature")
+        return {"status": "unauthorized"}, 401
+
+    get_webhook_inbox().append(
+        headers.get('X-Shopify-Webhook-Id'),
+        headers.get('X-Shopify-Topic', 'inventory_levels/update'),
+        body.decode('utf-8')
+    )
+
+    return {"status": "success"}, 200
+
+def verify_webhook(body, hmac_header):
+    """
+    Checks Shopify's X-Shopify-Hmac-Sha256 signature of a webhook body.
+    """
+    digest = hmac.new(SHOPIFY_WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode('utf-8'), hmac_header)
+
+def dispatch_webhook(topic, payload):
+    """
+    Processes a webhook taken from the inbox.
+
+    Returns:
+        Future: For inventory webhooks, completes once the product's status has been written to Shopify (or
+        no write was needed); None for webhooks that were fully processed already.
+    """
+    logging.info(f'Processing {topic} webhook payload:')
     logging.info(payload)
 
+    # Product webhooks only keep the local product index current
+    index = get_product_index()
+    if topic in ('products/create', 'products/update'):
+        if index:
+            index.upsert_products([payload])
+        return None
+    if topic == 'products/delete':
+        if index:
+            index.delete_product(payload['id'])
+        return None
+
     inventory_item_id = payload.get('inventory_item_id')
-    product_name, total_inventory, parent_product_id = get_parent_product_info(inventory_item_id)
+    if index and payload.get('available') is not None and payload.get('location_id') is not None:
+        index.update_inventory_level(inventory_item_id, payload['location_id'], payload['available'])
+
+    # The parent product lookup is batched with other webhooks arriving in the same window
+    lookup = get_inventory_batcher().submit(inventory_item_id)
+    done = Future()
+
+    def on_lookup(future):
+        try:
+            store_webhook(future, done)
+        except Exception as e:
+            done.set_exception(e)
+
+    lookup.add_done_callback(on_lookup)
+    return done
+
+# Route exposing status cache counters (hits and skipped status writes)
+@webhook_bp.route('/webhook/stats')
+def webhook_stats():
+    return jsonify({
+        "status_cache": status_cache.stats(),
+        "pending_webhooks": webhook_debouncer.pending_count(),
+        "pending_status_updates": len(get_shared_state().pending_debounces()),
+        "debouncer": webhook_debouncer.stats(),
+        "inbox_backlog": get_webhook_inbox().pending_count(),
+    })
 
-    webhook_store[parent_product_id] = {
+def store_webhook(future, done):
+    """
+    Schedules the debounced status update for a looked-up inventory webhook. done is completed once the
+    status has been written, so the inbox only then marks the webhook processed.
+    """
+    try:
+        product_name, total_inventory, parent_product_id = future.result()
+    except Exception as e:
+        # Re-raised so the inbox retries the webhook later
+        logging.error(f"Failed to look up parent product for webhook: {e}")
+        raise
+
+    if not parent_product_id:
+        done.set_result(None)
+        return
+
+    # product_name is "<product title> (<variant title>)"; the ignore list holds product titles
+    if product_name.rsplit(' (', 1)[0] in ignore_store or product_name in ignore_store:
+        logging.info(f"Ignoring webhook for ignored product '{product_name}'")
+        done.set_result(None)
+        return
+
+    index = get_product_index()
+    if index:
+        index.update_total_inventory(parent_product_id, total_inventory)
+
+    webhook_data = {
         'product_name': product_name,
         'total_inventory': total_inventory,
         'product_id': parent_product_id,
     }
 
-    timer = Timer(2.0, process_webhook, args=[parent_product_id])
-    timer.start()
+    with _status_waiters_lock:
+        _status_waiters.setdefault(parent_product_id, []).append(done)
 
-    return jsonify({"status": "success"}), 200
+    # A later webhook for the same product replaces this one and extends the wait. The shared state makes
+    # this hold across worker processes: whichever worker's timer fires after the last webhook claims it.
+    get_shared_state().schedule_debounce(parent_product_id, webhook_data, WEBHOOK_DEBOUNCE_DELAY)
+    webhook_debouncer.schedule(parent_product_id, webhook_data)
 
-def process_webhook(parent_product_id):
-    webhook_data = webhook_store.pop(parent_product_id, None)
+def process_webhooks(webhooks, early=()):
+    shared_state = get_shared_state()
+    claimed = {}
+    waiters = {}
+    for product_id, webhook_data in webhooks.items():
+        # Taken before the claim, so that every waiting webhook is covered by the claimed update
+        with _status_waiters_lock:
+            waiters[product_id] = _status_waiters.pop(product_id, [])
 
-    if webhook_data:
-        product_name = webhook_data.get('product_name')
-        total_inventory = webhook_data.get('total_inventory')
-        product_id = webhook_data.get('product_id')
+        try:
+            # Keys flushed early to bound the pending keys are claimed before their deadline, not dropped
+            claimed_data = shared_state.claim_debounce(product_id, force=product_id in early)
+            pending = not claimed_data and shared_state.debounce_pending(product_id)
+        except Exception as e:
+            logging.exception(f"Failed to claim the status update of product {product_id}")
+            _complete_waiters(waiters.pop(product_id), str(e))
+            continue
 
-        if total_inventory <= 0:
-            update_product_status(product_id, 'draft')
+        if claimed_data:
+            claimed[product_id] = claimed_data
+        elif pending:
+            # Another worker received a later webhook for the product and pushed its deadline back. Keys
+            # flushed early were claimed above regardless of their deadline, so only a real extension by
+            # another worker waits again; re-scheduling an early flush would flush it again at once.
+            with _status_waiters_lock:
+                _status_waiters.setdefault(product_id, []).extend(waiters.pop(product_id))
+            webhook_debouncer.schedule(product_id, webhook_data)
         else:
-            update_product_status(product_id, 'active')
+            # Another worker claimed the product and writes its status
+            _complete_waiters(waiters.pop(product_id))
+    logging.info(f"Updating status for {len(claimed)} products")
+
+    statuses = {}
+    for webhook_data in claimed.values():
+        with log_context(product_id=webhook_data['product_id']):
+            statuses[webhook_data['product_id']] = target_status(webhook_data)
+            logging.info(
+                f"'{webhook_data['product_name']}' has {webhook_data['total_inventory']} in stock, "
+                f"setting it to {statuses[webhook_data['product_id']]}"
+            )
+
+    # The status changes are sent as batched productUpdate mutations rather than one PUT per product
+    try:
+        results = update_products_status(statuses)
+    except Exception as e:
+        logging.exception(f"Failed to update the status of {len(claimed)} products")
+        results = {product_id: str(e) for product_id in statuses}
+
+    # Webhooks whose update failed are retried by the inbox
+    for product_id, webhook_data in claimed.items():
+        _complete_waiters(waiters[product_id], results.get(webhook_data['product_id']))
+
+def _complete_waiters(waiters, error=None):
+    # Completes the inbox futures of webhooks whose status update has been written (or has failed)
+    for waiter in waiters:
+        if error:
+            waiter.set_exception(RuntimeError(error))
+        else:
+            waiter.set_result(None)
+
+def target_status(webhook_data):
+    # Sold-out products are set to draft and made active again once they are back in stock
+    return 'draft' if webhook_data.get('total_inventory') <= 0 else 'active'
+
+# Single scheduler thread for all pending webhooks, keyed by parent product ID
+webhook_debouncer = KeyedDebouncer(
+    WEBHOOK_DEBOUNCE_DELAY, process_webhooks, max_pending=WEBHOOK_DEBOUNCE_MAX_PENDING, name="webhook-debouncer"
+)
+
+# Inbox futures waiting for their product's status update, keyed by parent product ID
+_status_waiters = {}
+_status_waiters_lock = threading.Lock()
+
+def init_app(app):
+    """
+    Opens the durable inbox and starts processing it, including webhooks left unprocessed by a previous run.
+    Called from the app's setup, so that importing this module has no side effects.
+    """
+    os.makedirs(app.instance_path, exist_ok=True)
+    inbox = get_webhook_inbox(os.path.join(app.instance_path, 'webhook_inbox.db'))
+
+    # Status updates that were debounced but never written, e.g. because the worker that scheduled them exited
+    for product_id, webhook_data in get_shared_state().pending_debounces().items():
+        webhook_debouncer.schedule(product_id, webhook_data)
+
+    inbox.start_consumer(dispatch_webhook)
@@ -0,0 +1,41 @@
+import aiohttp
+
+# Pooled aiohttp sessions used by the code running on the ASGI event loop, by name
+_sessions = {}
+
+def get_session(name, pool_size=100, timeout=None, headers=None):
+    """
+    Returns the named keep-alive session, creating it on first use. Sessions are bound to the event loop
+    they are created on, so this must be called from a coroutine; the pool size, timeout and headers only
+    apply when the session is created.
+
+    Args:
+        name (str): The session name, e.g. 'shopify' or 'openai'.
+        pool_size (int): The maximum number of open connections; further requests wait for a free one.
+        timeout (float or tuple): The default timeout in seconds, or a (connect, read) tuple as used by requests.
+        headers (dict): Headers sent with every request.
+
+    Returns:
+        aiohttp.ClientSession: The shared session.
+    """
+    session = _sessions.get(name)
+    if session is None or session.closed:
+        if isinstance(timeout, tuple):
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
+        session = _sessions[name] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=client_timeout,
+            headers=headers,
+        )
+    return session
+
+async def close_sessions():
+    """
+    Closes every pooled session, e.g. when the event loop shuts down.
+    """
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    for session in sessions:
+        await session.close()
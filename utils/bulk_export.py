@@ -0,0 +1,202 @@
+import json
+import logging
+import time
+import requests
+import config
+from utils.shopify_client import get_shopify_client
+
+# Seconds between bulk operation status checks, and the longest we wait for one to finish
+BULK_POLL_INTERVAL = getattr(config, 'BULK_POLL_INTERVAL', 5)
+BULK_TIMEOUT = getattr(config, 'BULK_TIMEOUT', 3600)
+
+# Session for downloading bulk results. The result URL is a signed link to Shopify's storage host, so it must
+# not go through the Shopify client's session, which would send the store's access token along with it.
+result_session = requests.Session()
+
+BULK_PRODUCTS_QUERY = """
+{
+  products(query: %s) {
+    edges {
+      node {
+        id
+        title
+        vendor
+        status
+        updatedAt
+        variants {
+          edges {
+            node {
+              id
+              inventoryQuantity
+              inventoryItem {
+                id
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+RUN_BULK_QUERY = """
+mutation($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+CURRENT_BULK_OPERATION_QUERY = """
+{
+  currentBulkOperation {
+    id
+    status
+    errorCode
+    objectCount
+    url
+  }
+}
+"""
+
+class BulkExportError(Exception):
+    pass
+
+def get_vendor_products_bulk(vendor, min_inventory_level):
+    """
+    Fetches a vendor's products with a GraphQL bulk operation instead of REST pagination, for catalogues
+    too large to page through. Products are filtered by inventory while the result is streamed.
+
+    Args:
+        vendor (str): The vendor to filter products by.
+        min_inventory_level (int): The minimum total inventory level for a product to be included.
+
+    Returns:
+        list: The products below the inventory level, in the same structure as the REST products endpoint
+        (id, title, vendor, status, updated_at and variants with inventory_quantity).
+    """
+    url = run_bulk_export(BULK_PRODUCTS_QUERY % json.dumps(f'vendor:"{_escape_search(vendor)}"'))
+    if not url:
+        # The operation matched no objects
+        return []
+
+    with result_session.get(url, stream=True, timeout=get_shopify_client().timeout) as response:
+        response.raise_for_status()
+        products = list(parse_bulk_products(response.iter_lines(decode_unicode=True), min_inventory_level))
+
+    logging.info(f"Bulk export found {len(products)} products for vendor {vendor} below the threshold")
+    return products
+
+def run_bulk_export(query, poll_interval=BULK_POLL_INTERVAL, timeout=BULK_TIMEOUT):
+    """
+    Starts a bulk query operation and waits for it to finish.
+
+    Args:
+        query (str): The GraphQL query to run in bulk.
+        poll_interval (float): Seconds between status checks.
+        timeout (float): The longest time to wait for the operation.
+
+    Returns:
+        str: The URL of the JSONL result, or None if the operation matched nothing.
+
+    Raises:
+        BulkExportError: If the operation could not be started, failed, or timed out.
+    """
+    client = get_shopify_client()
+
+    response = client.graphql(RUN_BULK_QUERY, variables={"query": query})
+    if response.status_code != 200:
+        raise BulkExportError(f"Failed to start bulk operation. Status code: {response.status_code}")
+    result = (response.json().get('data') or {}).get('bulkOperationRunQuery') or {}
+    if result.get('userErrors'):
+        raise BulkExportError(f"Failed to start bulk operation: {result['userErrors']}")
+    operation_id = (result.get('bulkOperation') or {}).get('id')
+    if not operation_id:
+        raise BulkExportError("Failed to start bulk operation: no operation was returned")
+    logging.info(f"Started bulk operation {operation_id}")
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+
+        response = client.graphql(CURRENT_BULK_OPERATION_QUERY)
+        if response.status_code != 200:
+            logging.error(f"Failed to check bulk operation {operation_id}. Status code: {response.status_code}")
+            continue
+
+        operation = (response.json().get('data') or {}).get('currentBulkOperation') or {}
+        if operation.get('id') != operation_id:
+            # Another bulk operation has replaced ours; its status and result belong to someone else
+            raise BulkExportError(f"Bulk operation {operation_id} was replaced by {operation.get('id')}")
+        status = operation.get('status')
+        if status == 'COMPLETED':
+            logging.info(f"Bulk operation {operation_id} completed with {operation.get('objectCount')} objects")
+            return operation.get('url')
+        if status in ('FAILED', 'CANCELED', 'EXPIRED'):
+            raise BulkExportError(f"Bulk operation {operation_id} ended with status {status}: {operation.get('errorCode')}")
+
+    raise BulkExportError(f"Bulk operation {operation_id} did not finish within {timeout} seconds")
+
+def parse_bulk_products(lines, min_inventory_level=None):
+    """
+    Parses the JSONL result of the bulk products query one line at a time. Shopify writes each product
+    followed by its variants (linked with __parentId), so only the product being assembled is held in memory.
+
+    benchmarks/fixtures/bulk_products.jsonl is a small result in this format.
+
+    Args:
+        lines (iterable): The JSONL lines, e.g. a streamed response or an open result file.
+        min_inventory_level (int): If given, only products whose total inventory is below it are yielded.
+
+    Yields:
+        dict: Products in the REST products endpoint structure.
+    """
+    product = None
+    for line in lines:
+        if not line or not line.strip():
+            continue
+        record = json.loads(line)
+
+        if '__parentId' not in record:
+            if product and _below_threshold(product, min_inventory_level):
+                yield product
+            product = {
+                "id": _numeric_id(record['id']),
+                "admin_graphql_api_id": record['id'],
+                "title": record.get('title'),
+                "vendor": record.get('vendor'),
+                "status": (record.get('status') or '').lower() or None,
+                "updated_at": record.get('updatedAt'),
+                "variants": [],
+            }
+        elif product and _numeric_id(record['__parentId']) == product['id']:
+            inventory_item = record.get('inventoryItem') or {}
+            product['variants'].append({
+                "id": _numeric_id(record['id']),
+                "product_id": product['id'],
+                "inventory_item_id": _numeric_id(inventory_item['id']) if inventory_item.get('id') else None,
+                "inventory_quantity": record.get('inventoryQuantity') or 0,
+            })
+
+    if product and _below_threshold(product, min_inventory_level):
+        yield product
+
+def _below_threshold(product, min_inventory_level):
+    if min_inventory_level is None:
+        return True
+    return sum(variant['inventory_quantity'] for variant in product['variants']) < min_inventory_level
+
+def _numeric_id(gid):
+    return int(gid.split('/')[-1])
+
+def _escape_search(value):
+    # Escape characters that are special inside a quoted search term
+    return value.replace('\\', '\\\\').replace('"', '\\"')
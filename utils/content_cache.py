@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import threading
+import time
+import config
+from utils.sqlite_helper import connect
+
+# Path of the SQLite database holding generated content; None disables the cache
+CONTENT_CACHE_PATH = getattr(config, 'CONTENT_CACHE_PATH', 'content_cache.db')
+
+# Maximum number of generations kept; the least recently used are evicted beyond this
+CONTENT_CACHE_MAX_ENTRIES = getattr(config, 'CONTENT_CACHE_MAX_ENTRIES', 20000)
+
+class ContentCache:
+    """
+    Disk-backed cache of OpenAI generations. Entries are keyed by a hash of the model, the prompts and the
+    product title, so changing any of them produces a fresh generation.
+    """
+    def __init__(self, path, max_entries=CONTENT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        with connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS generations (
+                    key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS generations_last_used ON generations (last_used)")
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Builds the cache key for a generation from its model, prompts and product title.
+        """
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached content for a key, or None if it has not been generated before.
+        """
+        with connect(self.path) as conn:
+            row = conn.execute("SELECT content FROM generations WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE generations SET last_used = ? WHERE key = ?", (time.time(), key))
+                return row["content"]
+        return None
+
+    def set(self, key, content):
+        """
+        Stores generated content, evicting the least recently used entries when the cache is over its size.
+        """
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (key, content, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, content, now, now)
+            )
+
+        # Counting rows on every write is wasteful; check the size every hundred writes instead
+        with self._lock:
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction < 100:
+                return
+            self._writes_since_eviction = 0
+        self.evict()
+
+    def evict(self):
+        with connect(self.path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM generations WHERE key IN (SELECT key FROM generations ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                logging.info(f"Evicted {excess} entries from the content cache")
+
+_content_cache = None
+_content_cache_lock = threading.Lock()
+
+def get_content_cache():
+    """
+    Returns the process-wide content cache, or None if caching is disabled.
+    """
+    global _content_cache
+    if not CONTENT_CACHE_PATH:
+        return None
+    with _content_cache_lock:
+        if _content_cache is None:
+            _content_cache = ContentCache(CONTENT_CACHE_PATH)
+        return _content_cache
@@ -0,0 +1,106 @@
+import heapq
+import logging
+import threading
+import time
+
+class KeyedDebouncer:
+    """
+    Debounces events by key on a single scheduler thread.
+
+    Scheduling a key that is already pending replaces its payload and pushes its deadline back, so a burst
+    of events for one key results in a single flush. The heap holds at most one entry per pending key, and
+    all keys that are due at the same time are handed to the flush callback together.
+
+    Keys flushed before their deadline because more than max_pending keys were pending are reported to the
+    flush callback, so that it does not wait on them again.
+    """
+    def __init__(self, delay, flush, max_pending=10000, name="debouncer"):
+        """
+        Args:
+            delay (float): Seconds of quiet required before a key is flushed.
+            flush (callable): Called with a dict of key -> latest payload for every key that is due, and the
+                set of those keys that were flushed early.
+            max_pending (int): When this many keys are pending, the oldest are flushed early to bound memory.
+            name (str): The name of the scheduler thread.
+        """
+        self.delay = delay
+        self.flush = flush
+        self.max_pending = max_pending
+        self._condition = threading.Condition()
+        self._pending = {}  # key -> (deadline, payload)
+        self._heap = []  # (deadline, sequence, key), one entry per pending key
+        self._sequence = 0
+
+        # Counters for monitoring
+        self.flushes = 0
+        self.early_flushes = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, key, payload):
+        """
+        Schedules a key to be flushed after the debounce delay, extending its deadline if it is already pending.
+        """
+        with self._condition:
+            deadline = time.monotonic() + self.delay
+            if key in self._pending:
+                # The existing heap entry is moved to the new deadline when it comes due
+                self._pending[key] = (deadline, payload)
+                return
+
+            self._pending[key] = (deadline, payload)
+            self._sequence += 1
+            heapq.heappush(self._heap, (deadline, self._sequence, key))
+            if len(self._heap) == 1 or len(self._pending) > self.max_pending:
+                self._condition.notify()
+
+    def pending_count(self):
+        with self._condition:
+            return len(self._pending)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "flushes": self.flushes,
+                "early_flushes": self.early_flushes,
+            }
+
+    def _take_due(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = {}
+                early = set()
+                overflow = len(self._pending) - self.max_pending
+
+                while self._heap and (self._heap[0][0] <= now or overflow > 0):
+                    _, _, key = heapq.heappop(self._heap)
+                    deadline, payload = self._pending[key]
+                    if deadline > now and overflow <= 0:
+                        # The key was rescheduled after this entry was pushed
+                        self._sequence += 1
+                        heapq.heappush(self._heap, (deadline, self._sequence, key))
+                        continue
+                    del self._pending[key]
+                    due[key] = payload
+                    if deadline > now:
+                        early.add(key)
+                    overflow -= 1
+
+                if due:
+                    self.flushes += 1
+                    self.early_flushes += len(early)
+                    return due, early
+
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._condition.wait(timeout)
+
+    def _run(self):
+        while True:
+            due, early = self._take_due()
+            try:
+                self.flush(due, early)
+            except Exception:
+                logging.exception(f"Failed to flush {len(due)} debounced keys")
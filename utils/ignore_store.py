@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from config import IGNORE_LIST_FILE
+from utils.shared_state import get_shared_state
+
+class IgnoreStore:
+    """
+    Set of ignored product titles persisted to a file.
+
+    The file holds a JSON array, so titles may contain commas or any other character. Changes are written
+    to a temporary file and renamed over the original, so readers never see a half-written list, and the
+    file is reloaded whenever another process has replaced it. Changes are made under the shared-state
+    lock, so concurrent edits from several worker processes are not lost.
+    """
+    def __init__(self, path=IGNORE_LIST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._names = set()
+        self._loaded_stat = None
+        self._reload_if_changed()
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _reload_if_changed(self):
+        stat = self._file_stat()
+        if stat == self._loaded_stat:
+            return
+        self._names = self._read()
+        self._loaded_stat = stat
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, 'r', encoding='utf-8') as file:
+            data = file.read().strip()
+        if not data:
+            return set()
+        if data.startswith('['):
+            try:
+                return set(json.loads(data))
+            except ValueError:
+                logging.error(f"Ignore list {self.path} is not valid JSON, treating it as empty")
+                return set()
+        # Legacy format: a single comma-separated line; rewritten as JSON on the next change
+        return set(data.split(","))
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.ignore-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(sorted(self._names), file, ensure_ascii=False, indent=0)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._loaded_stat = self._file_stat()
+
+    def __contains__(self, name):
+        with self._lock:
+            self._reload_if_changed()
+            return name in self._names
+
+    def names(self):
+        """
+        Returns the ignored titles, sorted.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            return sorted(self._names)
+
+    def add(self, name):
+        with get_shared_state().lock('ignore_list'), self._lock:
+            self._reload_if_changed()
+            if name in self._names:
+                return False
+            self._names.add(name)
+            self._write()
+            return True
+
+    def remove(self, name):
+        with get_shared_state().lock('ignore_list'), self._lock:
+            self._reload_if_changed()
+            if name not in self._names:
+                return False
+            self._names.discard(name)
+            self._write()
+            return True
+
+    def snapshot(self):
+        """
+        Returns the current set of ignored titles for filtering many products at once.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            return frozenset(self._names)
+
+# Process-wide ignore list
+ignore_store = IgnoreStore()
@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+import config
+from utils.sqlite_helper import connect
+
+# Path of the SQLite database remembering which images have been uploaded; None disables deduplication
+IMAGE_INDEX_PATH = getattr(config, 'IMAGE_INDEX_PATH', 'image_index.db')
+
+class ImageIndex:
+    """
+    Content-addressed index of uploaded images.
+
+    Source URLs are mapped to the sha256 digest of their bytes, and digests are mapped to the Shopify image
+    created for each product. This lets a repeat image skip the upload entirely when the product already
+    has it, and skip the download when another product already has it on Shopify's CDN.
+    """
+    def __init__(self, path):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_sources (
+                    source_url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS uploaded_images (
+                    digest TEXT NOT NULL,
+                    product_id TEXT NOT NULL,
+                    shopify_image_id TEXT,
+                    shopify_src TEXT,
+                    uploaded_at REAL NOT NULL,
+                    PRIMARY KEY (digest, product_id)
+                )
+            """)
+
+    @staticmethod
+    def digest(image_data):
+        return hashlib.sha256(image_data).hexdigest()
+
+    @staticmethod
+    def url_key(source_url):
+        """
+        Key used in place of a digest for images that were added by URL without downloading them.
+        """
+        return "url:" + hashlib.sha256(source_url.encode("utf-8")).hexdigest()
+
+    def get_digest(self, source_url):
+        with connect(self.path) as conn:
+            row = conn.execute("SELECT digest FROM image_sources WHERE source_url = ?", (source_url,)).fetchone()
+        return row["digest"] if row else None
+
+    def set_digest(self, source_url, digest):
+        with connect(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO image_sources (source_url, digest) VALUES (?, ?)", (source_url, digest))
+
+    def get_upload(self, digest, product_id):
+        """
+        Returns the Shopify image already uploaded to a product for a digest, or None.
+        """
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT shopify_image_id, shopify_src FROM uploaded_images WHERE digest = ? AND product_id = ?",
+                (digest, str(product_id))
+            ).fetchone()
+        return {"id": row["shopify_image_id"], "src": row["shopify_src"]} if row else None
+
+    def find_uploaded_src(self, digest):
+        """
+        Returns the Shopify CDN URL of any earlier upload of a digest, or None.
+        """
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT shopify_src FROM uploaded_images WHERE digest = ? AND shopify_src IS NOT NULL "
+                "ORDER BY uploaded_at DESC LIMIT 1",
+                (digest,)
+            ).fetchone()
+        return row["shopify_src"] if row else None
+
+    def forget_upload(self, product_id, shopify_image_id):
+        """
+        Removes every entry for a Shopify image, e.g. after it was deleted from the product in Shopify.
+        """
+        with connect(self.path) as conn:
+            conn.execute(
+                "DELETE FROM uploaded_images WHERE product_id = ? AND shopify_image_id = ?",
+                (str(product_id), str(shopify_image_id))
+            )
+
+    def record_upload(self, digest, product_id, image):
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploaded_images (digest, product_id, shopify_image_id, shopify_src, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (digest, str(product_id), str(image.get("id")), image.get("src"), time.time())
+            )
+
+_image_index = None
+_image_index_lock = threading.Lock()
+
+def get_image_index():
+    """
+    Returns the process-wide image index, or None if deduplication is disabled.
+    """
+    global _image_index
+    if not IMAGE_INDEX_PATH:
+        return None
+    with _image_index_lock:
+        if _image_index is None:
+            _image_index = ImageIndex(IMAGE_INDEX_PATH)
+        return _image_index
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import config
+from utils.image_index import get_image_index
+from utils.shopify_helper import (
+    upload_image_from_url, upload_images_to_shopify, download_image, product_image_exists,
+    upload_image_from_url_async, upload_images_to_shopify_async, download_image_async, product_image_exists_async
+)
+
+# Number of images transferred to Shopify at the same time
+IMAGE_TRANSFER_CONCURRENCY = getattr(config, 'IMAGE_TRANSFER_CONCURRENCY', 8)
+
+def transfer_image(product_id, image_url):
+    """
+    Adds an image to a Shopify product, using the image index to avoid repeat work: an image the product
+    already has is not uploaded again, and an image already on Shopify's CDN for another product is added
+    from there without downloading it. An indexed image is checked with Shopify before it is skipped, so
+    one deleted from the product in Shopify is added again. Public URLs are first passed to Shopify as the
+    image source; if Shopify cannot fetch them (or the URL is an inline data: URI) the image is downloaded
+    and uploaded as a base64-encoded attachment instead.
+
+    Args:
+        product_id (str): The Shopify product ID.
+        image_url (str): The URL of the image to add.
+
+    Returns:
+        dict: The Shopify image (created or already present), or None if the image could not be added.
+    """
+    index = get_image_index()
+    if index:
+        url_key = index.url_key(image_url)
+        keys = [key for key in (index.get_digest(image_url), url_key) if key]
+        image = _reuse_uploaded_image(index, keys, product_id)
+        if image:
+            return image
+
+    # Let Shopify fetch public URLs itself
+    if image_url.startswith(('http://', 'https://')):
+        image = upload_image_from_url(product_id, image_url)
+        if image:
+            if index:
+                _record(index, keys, product_id, image)
+            return image
+
+    image_data = download_image(image_url)
+    if not image_data:
+        logging.error(f"Failed to process image for product {product_id}")
+        return None
+    if not index:
+        return upload_images_to_shopify(product_id, image_data, filename="product_image.jpg")
+
+    # Identical bytes may already be on Shopify under a different source URL
+    digest = index.digest(image_data)
+    index.set_digest(image_url, digest)
+    image = _reuse_uploaded_image(index, [digest], product_id)
+    if not image:
+        image = upload_images_to_shopify(product_id, image_data, filename="product_image.jpg")
+    if image:
+        _record(index, [digest, url_key], product_id, image)
+    return image
+
+async def transfer_image_async(product_id, image_url):
+    """
+    Like transfer_image, for callers on an event loop: Shopify calls and downloads are awaited, and the
+    image index, a local SQLite database, is read and written in worker threads.
+    """
+    index = await asyncio.to_thread(get_image_index)
+    if index:
+        url_key = index.url_key(image_url)
+        digest = await asyncio.to_thread(index.get_digest, image_url)
+        keys = [key for key in (digest, url_key) if key]
+        image = await _reuse_uploaded_image_async(index, keys, product_id)
+        if image:
+            return image
+
+    # Let Shopify fetch public URLs itself
+    if image_url.startswith(('http://', 'https://')):
+        image = await upload_image_from_url_async(product_id, image_url)
+        if image:
+            if index:
+                await asyncio.to_thread(_record, index, keys, product_id, image)
+            return image
+
+    image_data = await download_image_async(image_url)
+    if not image_data:
+        logging.error(f"Failed to process image for product {product_id}")
+        return None
+    if not index:
+        return await upload_images_to_shopify_async(product_id, image_data, filename="product_image.jpg")
+
+    # Identical bytes may already be on Shopify under a different source URL
+    digest = await asyncio.to_thread(index.digest, image_data)
+    await asyncio.to_thread(index.set_digest, image_url, digest)
+    image = await _reuse_uploaded_image_async(index, [digest], product_id)
+    if not image:
+        image = await upload_images_to_shopify_async(product_id, image_data, filename="product_image.jpg")
+    if image:
+        await asyncio.to_thread(_record, index, [digest, url_key], product_id, image)
+    return image
+
+def _reuse_uploaded_image(index, keys, product_id):
+    for key in keys:
+        image = index.get_upload(key, product_id)
+        if not image:
+            continue
+        if image["id"] not in (None, "None") and not product_image_exists(product_id, image["id"]):
+            # Deleted in Shopify since it was indexed; forgetting it lets the image be added again
+            logging.info(f"Image {image['id']} is no longer on product {product_id}, adding it again")
+            index.forget_upload(product_id, image["id"])
+            continue
+        logging.info(f"Product {product_id} already has this image, skipping upload")
+        return image
+
+    for key in keys:
+        shopify_src = index.find_uploaded_src(key)
+        if shopify_src:
+            image = upload_image_from_url(product_id, shopify_src)
+            if image:
+                logging.info(f"Added image to product {product_id} from an earlier upload")
+                _record(index, keys, product_id, image)
+                return image
+    return None
+
+async def _reuse_uploaded_image_async(index, keys, product_id):
+    for key in keys:
+        image = await asyncio.to_thread(index.get_upload, key, product_id)
+        if not image:
+            continue
+        if image["id"] not in (None, "None") and not await product_image_exists_async(product_id, image["id"]):
+            # Deleted in Shopify since it was indexed; forgetting it lets the image be added again
+            logging.info(f"Image {image['id']} is no longer on product {product_id}, adding it again")
+            await asyncio.to_thread(index.forget_upload, product_id, image["id"])
+            continue
+        logging.info(f"Product {product_id} already has this image, skipping upload")
+        return image
+
+    for key in keys:
+        shopify_src = await asyncio.to_thread(index.find_uploaded_src, key)
+        if shopify_src:
+            image = await upload_image_from_url_async(product_id, shopify_src)
+            if image:
+                logging.info(f"Added image to product {product_id} from an earlier upload")
+                await asyncio.to_thread(_record, index, keys, product_id, image)
+                return image
+    return None
+
+def _record(index, keys, product_id, image):
+    for key in keys:
+        index.record_upload(key, product_id, image)
+
+def _safe_transfer(product_id, image_url):
+    try:
+        return transfer_image(product_id, image_url)
+    except Exception:
+        logging.exception(f"Unexpected error while adding image {image_url} to product {product_id}")
+        return None
+
+async def _safe_transfer_async(product_id, image_url, semaphore):
+    async with semaphore:
+        try:
+            return await transfer_image_async(product_id, image_url)
+        except Exception:
+            logging.exception(f"Unexpected error while adding image {image_url} to product {product_id}")
+            return None
+
+def transfer_images(images, max_workers=None):
+    """
+    Adds many images to Shopify products concurrently using a bounded thread pool. Because at most
+    max_workers images are in flight, and each download is size-limited, memory use stays bounded no
+    matter how many images are selected.
+
+    Args:
+        images (list): (product ID, image URL) pairs. Duplicate pairs are transferred once.
+        max_workers (int): The maximum number of concurrent transfers. Defaults to IMAGE_TRANSFER_CONCURRENCY.
+
+    Returns:
+        list: A dict per distinct pair, in input order, with 'product_id', 'image_url' and 'image'
+        (the created Shopify image, or None if the transfer failed).
+    """
+    # The same image selected twice for a product is only transferred once
+    images = list(dict.fromkeys(images))
+    if not images:
+        return []
+
+    max_workers = max(1, min(max_workers or IMAGE_TRANSFER_CONCURRENCY, len(images)))
+    product_ids = [product_id for product_id, _ in images]
+    image_urls = [image_url for _, image_url in images]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image") as executor:
+        uploaded = list(executor.map(_safe_transfer, product_ids, image_urls))
+
+    return _transfer_results(product_ids, image_urls, uploaded)
+
+async def transfer_images_async(images, max_concurrency=None):
+    """
+    Like transfer_images, for callers on an event loop. At most max_concurrency transfers (defaulting to
+    IMAGE_TRANSFER_CONCURRENCY) run at once, so memory use stays bounded in the same way.
+    """
+    images = list(dict.fromkeys(images))
+    if not images:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or IMAGE_TRANSFER_CONCURRENCY))
+    product_ids = [product_id for product_id, _ in images]
+    image_urls = [image_url for _, image_url in images]
+
+    uploaded = await asyncio.gather(*(
+        _safe_transfer_async(product_id, image_url, semaphore) for product_id, image_url in images
+    ))
+    return _transfer_results(product_ids, image_urls, uploaded)
+
+def _transfer_results(product_ids, image_urls, uploaded):
+    failed = sum(1 for image in uploaded if not image)
+    logging.info(f"Transferred {len(uploaded) - failed} of {len(uploaded)} images ({failed} failed)")
+
+    return [
+        {"product_id": product_id, "image_url": image_url, "image": image}
+        for product_id, image_url, image in zip(product_ids, image_urls, uploaded)
+    ]
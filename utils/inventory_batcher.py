@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+import config
+from utils.shopify_helper import get_parent_products_info, INVENTORY_LOOKUP_BATCH_SIZE
+
+# How long (in seconds) to collect inventory item IDs before resolving them in one query
+INVENTORY_BATCH_WINDOW = getattr(config, 'INVENTORY_BATCH_WINDOW', 0.5)
+
+class InventoryLookupBatcher:
+    """
+    Coalesces parent product lookups for inventory items. IDs submitted within a short window are resolved
+    together with a single get_parent_products_info call, and the result is handed to every pending caller.
+    """
+    def __init__(self, window=INVENTORY_BATCH_WINDOW, max_batch_size=INVENTORY_LOOKUP_BATCH_SIZE):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._condition = threading.Condition()
+        self._pending = {}  # inventory item ID -> list of futures waiting for it
+        self._batch_started = None
+        self._thread = threading.Thread(target=self._run, name="inventory-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, inventory_item_id):
+        """
+        Queues an inventory item for lookup.
+
+        Args:
+            inventory_item_id (int or str): The numeric inventory item ID.
+
+        Returns:
+            Future: Resolves to the (product name, total inventory, product ID) tuple for the item.
+        """
+        future = Future()
+        with self._condition:
+            if not self._pending:
+                self._batch_started = time.monotonic()
+            self._pending.setdefault(str(inventory_item_id), []).append(future)
+            # Wake the batch thread to start the window, or to flush early once the batch is full
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+        return future
+
+    def _take_batch(self):
+        with self._condition:
+            while True:
+                if self._pending:
+                    remaining = self._batch_started + self.window - time.monotonic()
+                    if remaining <= 0 or len(self._pending) >= self.max_batch_size:
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait()
+
+            batch = self._pending
+            self._pending = {}
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                results = get_parent_products_info(list(batch))
+            except Exception as e:
+                logging.exception(f"Failed to resolve {len(batch)} inventory items")
+                for futures in batch.values():
+                    for future in futures:
+                        future.set_exception(e)
+                continue
+
+            logging.info(f"Resolved {len(batch)} inventory items in one batch")
+            for inventory_item_id, futures in batch.items():
+                result = results.get(inventory_item_id, ('Unknown Product', 0, None))
+                for future in futures:
+                    future.set_result(result)
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_inventory_batcher():
+    """
+    Returns the process-wide inventory lookup batcher, creating it on first use.
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = InventoryLookupBatcher()
+        return _batcher
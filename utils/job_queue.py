@@ -0,0 +1,357 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import config
+from utils.sqlite_helper import connect
+from utils.pipeline import complete_product, generate_contents, GENERATION_CONCURRENCY
+from utils.openai_helper import OPENAI_BATCH_SIZE
+from utils.logging_helper import log_context
+from utils.shopify_helper import get_vendor_products
+
+# Number of vendor jobs that may run at the same time
+JOB_WORKERS = getattr(config, 'JOB_WORKERS', 2)
+
+# Path of the SQLite job database; None keeps jobs in process memory only
+JOB_STORE_PATH = getattr(config, 'JOB_STORE_PATH', None)
+
+# How often a process refreshes the heartbeat of the jobs it owns, and how long a job may go without one
+# before other processes consider its owner gone
+JOB_HEARTBEAT_INTERVAL = getattr(config, 'JOB_HEARTBEAT_INTERVAL', 10)
+JOB_LEASE = getattr(config, 'JOB_LEASE', 60)
+
+class InMemoryJobStore:
+    """
+    Keeps jobs and their per-product results in process memory. Jobs are lost on restart.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._results = {}
+
+    def create_job(self, vendor, min_inventory_level):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "vendor": vendor,
+                "min_inventory_level": min_inventory_level,
+                "status": "queued",
+                "error": None,
+                "total": 0,
+                "created_at": time.time(),
+                "finished_at": None,
+            }
+            self._results[job_id] = {}
+        return job_id
+
+    def update_job(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def add_result(self, job_id, index, product_id, result=None, error=None):
+        with self._lock:
+            self._results[job_id][index] = {
+                "product_id": product_id,
+                "status": "failed" if error else "completed",
+                "result": result,
+                "error": error,
+            }
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            results = self._results[job_id].values()
+            completed = sum(1 for item in results if item["status"] == "completed")
+            failed = len(results) - completed
+            return _with_counts(dict(job), completed, failed)
+
+    def get_results(self, job_id):
+        with self._lock:
+            results = self._results.get(job_id, {})
+            return [results[index]["result"] for index in sorted(results) if results[index]["status"] == "completed"]
+
+    def heartbeat(self, job_ids):
+        # Jobs held in memory cannot outlive the process running them
+        pass
+
+class SQLiteJobStore:
+    """
+    Keeps jobs and their per-product results in a SQLite database so that progress and partial results
+    can be read from any worker process and survive restarts.
+
+    Each job records the process that owns it and a heartbeat the owner refreshes while the job is queued or
+    running. A job whose owner has exited, or whose heartbeat is older than the lease, can never finish and
+    is reported as interrupted; jobs owned by other live workers are left alone.
+    """
+    def __init__(self, path, lease=JOB_LEASE):
+        self.path = path
+        self.lease = lease
+        with connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    vendor TEXT NOT NULL,
+                    min_inventory_level INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    finished_at REAL,
+                    owner_pid INTEGER,
+                    heartbeat_at REAL
+                )
+            """)
+            # Databases created before jobs had owners
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner_pid", "INTEGER"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_results (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    product_id TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    PRIMARY KEY (job_id, position)
+                )
+            """)
+        self.reclaim_abandoned()
+
+    def create_job(self, vendor, min_inventory_level):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, vendor, min_inventory_level, status, created_at, owner_pid, heartbeat_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, vendor, min_inventory_level, now, os.getpid(), now)
+            )
+        return job_id
+
+    def update_job(self, job_id, **fields):
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with connect(self.path) as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def heartbeat(self, job_ids):
+        """
+        Refreshes the heartbeat of jobs owned by this process that are still queued or running.
+        """
+        if not job_ids:
+            return
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                [(now, job_id) for job_id in job_ids]
+            )
+
+    def reclaim_abandoned(self):
+        """
+        Marks queued or running jobs whose owner is gone as interrupted.
+        """
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT job_id, owner_pid, heartbeat_at, created_at FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        for row in rows:
+            if self._is_abandoned(row):
+                self._interrupt(row["job_id"])
+
+    def _is_abandoned(self, row):
+        heartbeat_at = row["heartbeat_at"] or row["created_at"]
+        if heartbeat_at < time.time() - self.lease:
+            return True
+        return row["owner_pid"] is not None and row["owner_pid"] != os.getpid() and not _process_exists(row["owner_pid"])
+
+    def _interrupt(self, job_id):
+        with connect(self.path) as conn:
+            # The status check keeps a job that finished in the meantime from being overwritten
+            conn.execute(
+                "UPDATE jobs SET status = 'interrupted', finished_at = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+        logging.warning(f"Job {job_id} was interrupted: the process running it has stopped")
+
+    def add_result(self, job_id, index, product_id, result=None, error=None):
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_results (job_id, position, product_id, status, result, error) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, index, str(product_id), "failed" if error else "completed",
+                 json.dumps(result) if result is not None else None, error)
+            )
+
+    def get_job(self, job_id):
+        with connect(self.path) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if not row:
+                return None
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM job_results WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        job = dict(row)
+        if job["status"] in ("queued", "running") and self._is_abandoned(row):
+            self._interrupt(job_id)
+            job["status"] = "interrupted"
+        return _with_counts(job, counts.get("completed", 0), counts.get("failed", 0))
+
+    def get_results(self, job_id):
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT result FROM job_results WHERE job_id = ? AND status = 'completed' ORDER BY position", (job_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+def _process_exists(pid):
+    """
+    Returns whether a process with this ID is running on this host. Only POSIX can check this without side
+    effects (os.kill terminates the process on Windows), so elsewhere the heartbeat alone decides.
+    """
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
+    return True
+
+def _with_counts(job, completed, failed):
+    job["completed"] = completed
+    job["failed"] = failed
+    job["pending"] = max(job["total"] - completed - failed, 0)
+    return job
+
+class JobQueue:
+    """
+    Runs vendor content-generation jobs in the background. Each job fetches the vendor's products and runs
+    the content pipeline for them, recording every product's result as soon as it is ready.
+    """
+    def __init__(self, store, workers=JOB_WORKERS, product_workers=GENERATION_CONCURRENCY,
+                 heartbeat_interval=JOB_HEARTBEAT_INTERVAL):
+        self.store = store
+        self._job_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._product_executor = ThreadPoolExecutor(max_workers=product_workers, thread_name_prefix="job-product")
+        self._heartbeat_interval = heartbeat_interval
+        self._active_lock = threading.Lock()
+        self._active = set()  # ids of the jobs queued or running in this process
+        threading.Thread(target=self._send_heartbeats, name="job-heartbeat", daemon=True).start()
+
+    def submit(self, vendor, min_inventory_level, force_regenerate=False):
+        """
+        Queues a content-generation job for a vendor.
+
+        Args:
+            vendor (str): The vendor whose products should be processed.
+            min_inventory_level (int): Only products below this total inventory are processed.
+            force_regenerate (bool): Ignore cached content and generate it again.
+
+        Returns:
+            str: The id of the new job.
+        """
+        job_id = self.store.create_job(vendor, min_inventory_level)
+        with self._active_lock:
+            self._active.add(job_id)
+        self._job_executor.submit(self._run_job, job_id, vendor, min_inventory_level, force_regenerate)
+        logging.info(f"Queued job {job_id} for vendor {vendor}")
+        return job_id
+
+    def _run_job(self, job_id, vendor, min_inventory_level, force_regenerate):
+        try:
+            with log_context(job_id=job_id):
+                self._process_job(job_id, vendor, min_inventory_level, force_regenerate)
+        finally:
+            with self._active_lock:
+                self._active.discard(job_id)
+
+    def _send_heartbeats(self):
+        # Tells the other worker processes that this process is still working on its jobs
+        while True:
+            time.sleep(self._heartbeat_interval)
+            with self._active_lock:
+                job_ids = list(self._active)
+            try:
+                self.store.heartbeat(job_ids)
+            except Exception:
+                logging.exception("Failed to record the heartbeat of running jobs")
+
+    def _process_job(self, job_id, vendor, min_inventory_level, force_regenerate):
+        self.store.update_job(job_id, status="running")
+        try:
+            products = get_vendor_products(vendor, min_inventory_level)
+            self.store.update_job(job_id, total=len(products))
+
+            # Content is generated a batch of products per OpenAI request, then each product is finished on its own
+            batches = [
+                (start, products[start:start + OPENAI_BATCH_SIZE])
+                for start in range(0, len(products), OPENAI_BATCH_SIZE)
+            ]
+            generation_futures = [
+                (start, batch, self._product_executor.submit(self._generate_batch, job_id, batch, force_regenerate))
+                for start, batch in batches
+            ]
+
+            futures = []
+            for start, batch, generation_future in generation_futures:
+                for offset, (product, content) in enumerate(zip(batch, generation_future.result())):
+                    futures.append(self._product_executor.submit(self._run_product, job_id, start + offset, product, content))
+            for future in futures:
+                future.result()
+
+            self.store.update_job(job_id, status="completed", finished_at=time.time())
+            logging.info(f"Job {job_id} for vendor {vendor} completed")
+        except Exception as e:
+            logging.exception(f"Job {job_id} for vendor {vendor} failed")
+            self.store.update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    def _generate_batch(self, job_id, batch, force_regenerate):
+        with log_context(job_id=job_id):
+            return generate_contents(batch, force_regenerate)
+
+    def _run_product(self, job_id, index, product, generated_content):
+        with log_context(job_id=job_id, product_id=product['id']):
+            self._complete_product(job_id, index, product, generated_content)
+
+    def _complete_product(self, job_id, index, product, generated_content):
+        try:
+            result = complete_product(product, generated_content)
+        except Exception as e:
+            logging.exception(f"Job {job_id}: unexpected error while processing product '{product.get('title')}'")
+            self.store.add_result(job_id, index, product['id'], error=str(e))
+            return
+
+        if result:
+            self.store.add_result(job_id, index, product['id'], result=result)
+        else:
+            self.store.add_result(job_id, index, product['id'], error="Content generation failed")
+
+    def get_job(self, job_id):
+        return self.store.get_job(job_id)
+
+    def get_results(self, job_id):
+        return self.store.get_results(job_id)
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """
+    Returns the process-wide job queue, creating it on first use.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            store = SQLiteJobStore(JOB_STORE_PATH) if JOB_STORE_PATH else InMemoryJobStore()
+            _job_queue = JobQueue(store)
+        return _job_queue
@@ -1,15 +1,210 @@
+import contextvars
 import logging
+import threading
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+import config
 
-log_data = []
+# Number of log entries kept for the /logs page, and the maximum number of concurrent stream clients
+LOG_BUFFER_SIZE = getattr(config, 'LOG_BUFFER_SIZE', 5000)
+LOG_MAX_SUBSCRIBERS = getattr(config, 'LOG_MAX_SUBSCRIBERS', 20)
+
+# Product and job IDs attached to every record logged inside a log_context block
+_log_context = contextvars.ContextVar('log_context', default={})
+
+@contextmanager
+def log_context(**fields):
+    """
+    Tags every log record emitted by the current thread inside the block with the given fields
+    (e.g. product_id, job_id), so the log viewer can filter on them.
+    """
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+def _normalize_id(value):
+    # Accept both numeric IDs and GraphQL GIDs such as 'gid://shopify/Product/123'
+    return str(value).split('/')[-1] if value is not None else None
+
+def entry_matches(entry, level=None, logger=None, product_id=None, job_id=None):
+    """
+    Checks a structured log entry against optional filters. level is a minimum level name such as 'WARNING'.
+    """
+    if level:
+        minimum = logging.getLevelName(level.upper())
+        if isinstance(minimum, int) and entry["levelno"] < minimum:
+            return False
+    if logger and entry["logger"] != logger:
+        return False
+    if product_id and entry["product_id"] != _normalize_id(product_id):
+        return False
+    if job_id and entry["job_id"] != job_id:
+        return False
+    return True
+
+class LogStore:
+    """
+    Bounded ring buffer of structured log entries. Every entry gets a monotonically increasing sequence
+    number, so readers can resume from the last entry they saw, and waiting readers are woken as soon as
+    a new entry arrives. Sequence numbers restart at 1 with the process, so the IDs handed to stream
+    clients also carry a per-process epoch.
+    """
+    def __init__(self, max_entries=LOG_BUFFER_SIZE, max_subscribers=LOG_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._entries = deque(maxlen=max_entries)  # (sequence number, entry)
+        self._last_seq = 0
+        self._subscribers = 0
+        self._condition = threading.Condition()
+        self._listeners = []
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def append(self, entry):
+        """
+        Adds a structured entry (a dict), setting its 'seq' field.
+
+        Returns:
+            int: The entry's sequence number.
+        """
+        with self._condition:
+            self._last_seq += 1
+            entry["seq"] = self._last_seq
+            self._entries.append((self._last_seq, entry))
+            self._condition.notify_all()
+            seq = self._last_seq
+            listeners = self._listeners
+        for listener in listeners:
+            listener()
+        return seq
+
+    def _since(self, seq):
+        # Sequence numbers are contiguous, so the position of seq + 1 can be computed instead of searched
+        if not self._entries or seq >= self._last_seq:
+            return []
+        first_seq = self._entries[0][0]
+        return list(islice(self._entries, max(0, seq + 1 - first_seq), None))
+
+    def since(self, seq):
+        """
+        Returns the buffered (sequence number, entry) pairs newer than seq.
+        """
+        with self._condition:
+            return self._since(seq)
+
+    def wait_for_entries(self, seq, timeout=None):
+        """
+        Blocks until there are entries newer than seq, or the timeout expires.
+
+        Returns:
+            list: The (sequence number, entry) pairs newer than seq; empty if the wait timed out.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_seq > seq, timeout)
+            return self._since(seq)
+
+    def between(self, after=0, before=None, limit=100, **filters):
+        """
+        Pages through the buffered history.
+
+        Args:
+            after (int): Only entries with a sequence number greater than this are returned.
+            before (int): If given, only entries with a sequence number less than this are returned.
+            limit (int): The maximum number of entries returned.
+            **filters: Filters accepted by entry_matches.
+
+        Returns:
+            list: Matching entries, oldest first.
+        """
+        matches = []
+        for seq, entry in self.since(after):
+            if before is not None and seq >= before:
+                break
+            if entry_matches(entry, **filters):
+                matches.append(entry)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    @property
+    def last_seq(self):
+        with self._condition:
+            return self._last_seq
+
+    def event_id(self, seq):
+        """
+        Returns the stream event ID of a sequence number, qualified with this process's epoch.
+        """
+        return f"{self.epoch}-{seq}"
+
+    def resume_point(self, event_id):
+        """
+        Returns the sequence number a stream should resume after, given the last event ID the client saw (or
+        a bare sequence number). An ID from another process, or one beyond the last sequence number, means
+        the numbering has restarted since, so the whole buffer is replayed.
+        """
+        epoch, _, seq = str(event_id or "").rpartition("-")
+        try:
+            seq = int(seq)
+        except ValueError:
+            return 0
+        if (epoch and epoch != self.epoch) or seq > self.last_seq:
+            return 0
+        return max(seq, 0)
+
+    def add_subscriber(self):
+        """
+        Registers a stream client.
+
+        Returns:
+            bool: False if the maximum number of subscribers is already connected.
+        """
+        with self._condition:
+            if self._subscribers >= self.max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+
+    def remove_subscriber(self):
+        with self._condition:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def add_listener(self, callback):
+        """
+        Registers a callback invoked (without arguments, on the logging thread) after every new entry, for
+        readers that cannot block on the condition, such as an event loop.
+        """
+        with self._condition:
+            self._listeners = self._listeners + [callback]
+
+    def remove_listener(self, callback):
+        with self._condition:
+            # Compared by equality: bound methods are a new object on every attribute access
+            self._listeners = [listener for listener in self._listeners if listener != callback]
+
+# Process-wide store of recent log entries
+log_store = LogStore()
 
 class CustomHandler(logging.StreamHandler):
     def emit(self, record):
-        log_entry = self.format(record)
-        log_data.append(log_entry)
+        context = _log_context.get()
+        log_store.append({
+            "timestamp": record.created,
+            "level": record.levelname,
+            "levelno": record.levelno,
+            "logger": record.name,
+            "message": self.format(record),
+            # Fields passed with extra= take precedence over the surrounding log_context
+            "product_id": _normalize_id(getattr(record, 'product_id', None) or context.get('product_id')),
+            "job_id": getattr(record, 'job_id', None) or context.get('job_id'),
+        })
         super().emit(record)
 
 def setup_logging():
     handler = CustomHandler()
     handler.setLevel(logging.INFO)
     logging.getLogger().addHandler(handler)
-    logging.basicConfig(level=logging.INFO)
+    # basicConfig is a no-op once the root logger has a handler, so set the level explicitly
+    logging.getLogger().setLevel(logging.INFO)
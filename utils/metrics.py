@@ -0,0 +1,199 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+# Latency histogram buckets in seconds, from fast Shopify calls up to slow generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Registry:
+    """
+    The set of metrics exposed on /metrics.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return "".join(metric.render() for metric in metrics)
+
+REGISTRY = Registry()
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # tuple of label values -> value
+        if registry:
+            registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(labelname, "")) for labelname in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def _header(self):
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type}\n"
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + "".join(f"{self.name}{self._labels(key)} {_number(value)}\n" for key, value in values)
+
+class Counter(_Metric):
+    """
+    A count that only goes up, e.g. requests sent.
+    """
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, e.g. calls in flight.
+    """
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    """
+    Counts observations (e.g. latencies) into buckets, from which percentiles can be estimated.
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one for values above every bucket), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+
+        lines = [self._header()]
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', _number(bound))])} {cumulative}\n")
+            lines.append(f"{self.name}_bucket{self._labels(key, [('le', '+Inf')])} {count}\n")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(total)}\n")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}\n")
+        return "".join(lines)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+# Pipeline stages: the functions wrapped with track_stage
+STAGE_DURATION = Histogram('pipeline_stage_duration_seconds', 'Time spent in each pipeline stage.', ['stage'])
+STAGE_IN_FLIGHT = Gauge('pipeline_stage_in_flight', 'Calls currently running in each pipeline stage.', ['stage'])
+STAGE_ERRORS = Counter('pipeline_stage_errors_total', 'Pipeline stage calls that raised an exception.', ['stage'])
+
+# Outbound HTTP calls, by service: shopify_rest, shopify_graphql, openai, image_search or image_download
+OUTBOUND_REQUESTS = Counter('outbound_requests_total', 'HTTP requests to external services, by response status.', ['service', 'status'])
+OUTBOUND_DURATION = Histogram('outbound_request_duration_seconds', 'Latency of HTTP requests to external services.', ['service'])
+OUTBOUND_RETRIES = Counter('outbound_retries_total', 'Requests to external services retried after being throttled.', ['service'])
+RATE_LIMIT_THROTTLES = Counter('rate_limit_throttles_total', 'Throttled responses (HTTP 429 or GraphQL THROTTLED) received.', ['service'])
+RATE_LIMIT_WAIT = Counter('rate_limit_wait_seconds_total', 'Time spent waiting for rate-limit budget before sending.', ['service'])
+
+def track_stage(stage):
+    """
+    Decorator recording the latency, in-flight calls and exceptions of a pipeline stage. Coroutine
+    functions are timed until they complete, not until they return their coroutine.
+
+    Args:
+        stage (str): The stage label, usually the function name.
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                STAGE_IN_FLIGHT.inc(stage=stage)
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                except Exception:
+                    STAGE_ERRORS.inc(stage=stage)
+                    raise
+                finally:
+                    STAGE_DURATION.observe(time.perf_counter() - started, stage=stage)
+                    STAGE_IN_FLIGHT.dec(stage=stage)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            STAGE_IN_FLIGHT.inc(stage=stage)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(stage=stage)
+                raise
+            finally:
+                STAGE_DURATION.observe(time.perf_counter() - started, stage=stage)
+                STAGE_IN_FLIGHT.dec(stage=stage)
+        return wrapper
+    return decorator
+
+def record_request(service, status, elapsed):
+    """
+    Records one outbound HTTP request.
+
+    Args:
+        service (str): The service called.
+        status (int or str): The HTTP status code, or 'error' if no response was received.
+        elapsed (float): The request latency in seconds.
+    """
+    OUTBOUND_REQUESTS.inc(service=service, status=status)
+    OUTBOUND_DURATION.observe(elapsed, service=service)
+
+def render():
+    return REGISTRY.render()
@@ -1,41 +1,380 @@
+import asyncio
 import openai
+import json
+import re
 import time
 import logging
+import config
 from config import OPENAI_API_KEY
+from utils.async_http import get_session
+from utils.content_cache import get_content_cache, ContentCache
+from utils.rate_limiter import OpenAIRateLimiter
+from utils.metrics import track_stage, record_request, OUTBOUND_RETRIES, RATE_LIMIT_THROTTLES
 
 openai.api_key = OPENAI_API_KEY
 
-def generate_product_content(product_title):
-    prompt = f"""
+# Overrides the OpenAI API base URL, e.g. to point at a local test server
+OPENAI_API_BASE = getattr(config, 'OPENAI_API_BASE', None)
+if OPENAI_API_BASE:
+    openai.api_base = OPENAI_API_BASE
+
+# Number of times a rate-limited request is retried
+OPENAI_MAX_RETRIES = getattr(config, 'OPENAI_MAX_RETRIES', 5)
+
+# Maximum number of connections open to OpenAI from the event loop (see _chat_completion_async)
+OPENAI_POOL_SIZE = getattr(config, 'OPENAI_POOL_SIZE', 100)
+
+# Request and token budget shared by every thread generating content
+openai_limiter = OpenAIRateLimiter()
+
+MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "You are an AI that generates product descriptions for e-commerce."
+PROMPT_TEMPLATE = """
     Generate a product description, tags, and category for a product titled '{product_title}'.
     Provide the output in the following structured format:
     1. Description: [Insert product description here]
     2. Tags: [Insert comma-separated tags here]
     3. Category: [Insert category here]
     """
-    max_retries = 3
-    retries = 0
 
-    while retries < max_retries:
+# Number of product titles sent in one batched prompt
+OPENAI_BATCH_SIZE = getattr(config, 'OPENAI_BATCH_SIZE', 10)
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + " You always answer with valid JSON only."
+BATCH_PROMPT_TEMPLATE = """
+    Generate a product description, tags, and category for each of the following products.
+    Respond with a JSON array containing one object per product, in the same order, with the keys
+    "index" (the product's number below), "title" (the product's title exactly as given below), "description",
+    "tags" (a comma-separated string) and "category".
+    Products:
+    {product_list}
+    """
+
+@track_stage('generate_product_content')
+def generate_product_content(product_title, force=False):
+    """
+    Generates the description, tags and category for a product. Results are cached on disk, keyed by the
+    model, the prompts and the product title, so re-running a vendor reuses earlier generations, including
+    those made by generate_product_content_batch.
+
+    Args:
+        product_title (str): The title of the product.
+        force (bool): Ignore any cached generation and call the API again.
+
+    Returns:
+        str: The generated text, or None if generation failed.
+    """
+    cache = get_content_cache()
+    cache_key = _cache_key(product_title)
+    if cache and not force:
+        cached_content = _cached_content(cache, product_title)
+        if cached_content:
+            logging.info(f"Using cached content for product '{product_title}'")
+            return cached_content
+
+    content = _request_product_content(product_title)
+    if content and cache:
+        cache.set(cache_key, content)
+    return content
+
+@track_stage('generate_product_content')
+async def generate_product_content_async(product_title, force=False):
+    """
+    Like generate_product_content, for callers on an event loop. The request is awaited and the content
+    cache, a local SQLite database, is read and written in a worker thread.
+    """
+    cache = get_content_cache()
+    if cache and not force:
+        cached_content = await asyncio.to_thread(_cached_content, cache, product_title)
+        if cached_content:
+            logging.info(f"Using cached content for product '{product_title}'")
+            return cached_content
+
+    content = await _chat_completion_async(_product_messages(product_title), max_tokens=300)
+    if content and cache:
+        await asyncio.to_thread(cache.set, _cache_key(product_title), content)
+    return content
+
+def _cache_key(product_title):
+    return ContentCache.make_key(MODEL, SYSTEM_PROMPT, PROMPT_TEMPLATE, product_title)
+
+def _batch_cache_key(product_title):
+    # Batched generations come from different prompts, so changing those must not serve stale content
+    return ContentCache.make_key(MODEL, BATCH_SYSTEM_PROMPT, BATCH_PROMPT_TEMPLATE, product_title)
+
+def _cached_content(cache, product_title):
+    """
+    Returns the cached generation for a product from either the single-product or the batched prompts.
+    """
+    return cache.get(_cache_key(product_title)) or cache.get(_batch_cache_key(product_title))
+
+def _request_product_content(product_title):
+    return _chat_completion(_product_messages(product_title), max_tokens=300)
+
+def _product_messages(product_title):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": PROMPT_TEMPLATE.format(product_title=product_title)}
+    ]
+
+def _chat_completion(messages, max_tokens):
+    reserved_tokens = _reserved_tokens(messages, max_tokens)
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        openai_limiter.acquire(reserved_tokens)
+        started = time.monotonic()
         try:
             response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an AI that generates product descriptions for e-commerce."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300
+                model=MODEL,
+                messages=messages,
+                max_tokens=max_tokens
             )
-            return response['choices'][0]['message']['content'].strip()
+            return _completion_content(response, reserved_tokens, time.monotonic() - started)
         except openai.error.RateLimitError as e:
-            logging.error(f"Rate limit exceeded: {e}. Retrying in 20 seconds...")
-            retries += 1
-            time.sleep(20)
+            if not _rate_limited(e, attempt, reserved_tokens, time.monotonic() - started):
+                break
         except openai.error.OpenAIError as e:
-            logging.error(f"Failed to generate product content due to API error: {e}")
+            _request_failed(e, reserved_tokens, time.monotonic() - started)
             return None
     return None
 
+async def _chat_completion_async(messages, max_tokens):
+    """
+    Like _chat_completion, but awaits the request and the rate-limit waits on the event loop. Requests
+    share one pooled aiohttp session instead of opening a connection each.
+    """
+    reserved_tokens = _reserved_tokens(messages, max_tokens)
+    openai.aiosession.set(get_session("openai", OPENAI_POOL_SIZE))
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        await openai_limiter.acquire_async(reserved_tokens)
+        started = time.monotonic()
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model=MODEL,
+                messages=messages,
+                max_tokens=max_tokens
+            )
+            return _completion_content(response, reserved_tokens, time.monotonic() - started)
+        except openai.error.RateLimitError as e:
+            if not _rate_limited(e, attempt, reserved_tokens, time.monotonic() - started):
+                break
+        except openai.error.OpenAIError as e:
+            _request_failed(e, reserved_tokens, time.monotonic() - started)
+            return None
+    return None
+
+def _reserved_tokens(messages, max_tokens):
+    # Rough prompt size: about four characters per token
+    return max_tokens + sum(len(message["content"]) for message in messages) // 4
+
+def _completion_content(response, reserved_tokens, elapsed):
+    record_request('openai', 200, elapsed)
+    used_tokens = (response.get('usage') or {}).get('total_tokens')
+    openai_limiter.record_usage(reserved_tokens, used_tokens, elapsed)
+    return response['choices'][0]['message']['content'].strip()
+
+def _rate_limited(error, attempt, reserved_tokens, elapsed):
+    """
+    Records a rate-limited request and backs every caller off before the next attempt.
+
+    Returns:
+        bool: False if the request has run out of retries.
+    """
+    record_request('openai', 429, elapsed)
+    RATE_LIMIT_THROTTLES.inc(service='openai')
+    openai_limiter.record_usage(reserved_tokens, None, elapsed)
+    if attempt == OPENAI_MAX_RETRIES:
+        logging.error(f"Rate limit exceeded: {error}. Giving up after {OPENAI_MAX_RETRIES} retries.")
+        return False
+    OUTBOUND_RETRIES.inc(service='openai')
+    # Every caller waits out the backoff together before its next attempt
+    delay = openai_limiter.backoff(attempt, _retry_after(error))
+    logging.warning(f"Rate limit exceeded: {error}. Retrying in {delay:.1f} seconds...")
+    return True
+
+def _request_failed(error, reserved_tokens, elapsed):
+    record_request('openai', getattr(error, 'http_status', None) or 'error', elapsed)
+    openai_limiter.record_usage(reserved_tokens, None, elapsed)
+    logging.error(f"Failed to generate product content due to API error: {error}")
+
+def _retry_after(error):
+    """
+    Reads the server's retry hint from a rate-limit error, in seconds, or None if it sent none.
+    Understands Retry-After and the x-ratelimit-reset-* durations such as '1s', '250ms' or '6m0s'.
+    """
+    headers = getattr(error, 'headers', None) or {}
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    resets = [
+        _parse_duration(headers.get(header))
+        for header in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')
+        if headers.get(header)
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return min(resets) if resets else None
+
+def _parse_duration(value):
+    match = re.fullmatch(r'(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?', value.strip())
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds, milliseconds = (float(group or 0) for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + milliseconds / 1000
+
+@track_stage('generate_product_content_batch')
+def generate_product_content_batch(product_titles, force=False):
+    """
+    Generates content for several products with a single chat completion. The model is asked for a JSON
+    array with one object per product, which is mapped back to the titles by index. Titles that are cached
+    are not sent, and titles whose entry is missing or malformed fall back to generate_product_content.
+
+    Args:
+        product_titles (list): The titles of the products, at most OPENAI_BATCH_SIZE of them.
+        force (bool): Ignore any cached generations and call the API again.
+
+    Returns:
+        list: The generated text for each title in the same order (None where generation failed), in the
+        same format as generate_product_content so it can be read with parse_generated_content.
+    """
+    cache = get_content_cache()
+    contents = _cached_contents(cache, product_titles, force)
+
+    missing = [index for index, content in enumerate(contents) if not content]
+    if len(missing) == 1:
+        # Nothing to batch; the single-product prompt is cheaper
+        contents[missing[0]] = generate_product_content(product_titles[missing[0]], force=force)
+        return contents
+    if not missing:
+        return contents
+
+    generated_text = _chat_completion(*_batch_request(product_titles, missing))
+    _store_batch_response(cache, product_titles, missing, contents, generated_text)
+
+    for index in missing:
+        if not contents[index]:
+            logging.warning(f"Batched generation returned nothing usable for '{product_titles[index]}', retrying on its own")
+            contents[index] = generate_product_content(product_titles[index], force=force)
+
+    return contents
+
+@track_stage('generate_product_content_batch')
+async def generate_product_content_batch_async(product_titles, force=False):
+    """
+    Like generate_product_content_batch, for callers on an event loop. Products left without content by
+    the batched request are retried on their own concurrently.
+    """
+    cache = get_content_cache()
+    contents = await asyncio.to_thread(_cached_contents, cache, product_titles, force)
+
+    missing = [index for index, content in enumerate(contents) if not content]
+    if len(missing) == 1:
+        contents[missing[0]] = await generate_product_content_async(product_titles[missing[0]], force=force)
+        return contents
+    if not missing:
+        return contents
+
+    generated_text = await _chat_completion_async(*_batch_request(product_titles, missing))
+    await asyncio.to_thread(_store_batch_response, cache, product_titles, missing, contents, generated_text)
+
+    retries = [index for index in missing if not contents[index]]
+    for index in retries:
+        logging.warning(f"Batched generation returned nothing usable for '{product_titles[index]}', retrying on its own")
+    retried = await asyncio.gather(*(generate_product_content_async(product_titles[index], force=force) for index in retries))
+    for index, content in zip(retries, retried):
+        contents[index] = content
+
+    return contents
+
+def _cached_contents(cache, product_titles, force):
+    if not cache or force:
+        return [None] * len(product_titles)
+    return [_cached_content(cache, title) for title in product_titles]
+
+def _batch_request(product_titles, missing):
+    """
+    Builds the messages and token limit of a batched request for the products at the missing indexes.
+    """
+    product_list = "\n".join(f"{position}. {product_titles[index]}" for position, index in enumerate(missing))
+    messages = [
+        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": BATCH_PROMPT_TEMPLATE.format(product_list=product_list)}
+    ]
+    return messages, min(300 * len(missing), 3500)
+
+def _store_batch_response(cache, product_titles, missing, contents, generated_text):
+    """
+    Fills contents with the products found in a batched response, caching each of them.
+    """
+    for position, item in _parse_batch_response(generated_text, [product_titles[index] for index in missing]).items():
+        index = missing[position]
+        contents[index] = format_generated_content(item.get("description"), item.get("tags"), item.get("category"))
+        if cache:
+            cache.set(_batch_cache_key(product_titles[index]), contents[index])
+
+def _parse_batch_response(generated_text, titles):
+    """
+    Parses the JSON array returned for a batched prompt into a dict of position -> product object, for
+    the products listed in the prompt with the given titles.
+
+    Content stored under the wrong product would be cached and reused, so the answer is only trusted when
+    its indexes are exactly the positions 0..n-1, each once. Otherwise nothing is returned and every
+    product falls back to the single-product prompt. Entries without a description, or whose echoed title
+    is not the product's, are left out.
+    """
+    if not generated_text:
+        return {}
+
+    # Models sometimes wrap the array in prose or a markdown code fence
+    start, end = generated_text.find("["), generated_text.rfind("]")
+    try:
+        items = json.loads(generated_text[start:end + 1]) if start != -1 else None
+    except ValueError:
+        logging.error("Failed to parse batched product content as JSON")
+        return {}
+
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        logging.error("Batched product content is not a JSON array of objects")
+        return {}
+
+    indexes = [item.get("index") for item in items]
+    if any(type(index) is not int for index in indexes) or sorted(indexes) != list(range(len(titles))):
+        logging.error(f"Batched product content has indexes {indexes} for {len(titles)} products, discarding it")
+        return {}
+
+    results = {}
+    for item in items:
+        position = item["index"]
+        if _normalize_title(item.get("title")) != _normalize_title(titles[position]):
+            logging.warning(f"Batched content for '{titles[position]}' was returned as '{item.get('title')}', discarding it")
+        elif item.get("description"):
+            results[position] = item
+    return results
+
+def _normalize_title(title):
+    # Models may change case or spacing when they echo a title
+    return " ".join(str(title or "").split()).casefold()
+
+def format_generated_content(description, tags, category):
+    """
+    Formats generated fields in the structure produced by the single-product prompt, the inverse of
+    parse_generated_content.
+    """
+    if isinstance(tags, list):
+        tags = ", ".join(str(tag) for tag in tags)
+
+    def single_line(value):
+        return " ".join(str(value or "").split())
+
+    return (
+        f"1. Description: {single_line(description)}\n"
+        f"2. Tags: {single_line(tags)}\n"
+        f"3. Category: {single_line(category)}"
+    )
+
 def parse_generated_content(generated_text):
     description, tags, category = None, None, None
     for line in generated_text.split('\n'):
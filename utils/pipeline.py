@@ -0,0 +1,298 @@
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import config
+from utils.logging_helper import log_context
+from utils.openai_helper import (
+    generate_product_content, generate_product_content_batch, generate_product_content_async,
+    generate_product_content_batch_async, parse_generated_content, OPENAI_BATCH_SIZE
+)
+from utils.shopify_helper import scrape_images, scrape_images_async
+
+# Default number of products processed at once by the content pipeline
+GENERATION_CONCURRENCY = getattr(config, 'GENERATION_CONCURRENCY', 8)
+
+# Upper limit on the concurrency a request may ask for, as it sizes the thread pool and in-flight window
+GENERATION_CONCURRENCY_MAX = getattr(config, 'GENERATION_CONCURRENCY_MAX', 32)
+
+def process_product(product, force_regenerate=False):
+    """
+    Runs the content pipeline for a single product: generates the description, tags and category with OpenAI
+    and looks up candidate images.
+
+    Args:
+        product (dict): The Shopify product (must contain 'id' and 'title').
+        force_regenerate (bool): Ignore cached content and generate it again.
+
+    Returns:
+        dict: The product details and generated content, or None if content generation failed.
+    """
+    # Log the product being processed
+    logging.info(f"Processing product '{product['title']}' with ID {product['id']}")
+
+    generated_content = generate_product_content(product['title'], force=force_regenerate)
+    return complete_product(product, generated_content)
+
+def complete_product(product, generated_content):
+    """
+    Finishes the pipeline for a product whose content has already been generated: parses the content and
+    looks up candidate images.
+
+    Args:
+        product (dict): The Shopify product (must contain 'id' and 'title').
+        generated_content (str): The generated text, or None if generation failed.
+
+    Returns:
+        dict: The product details and generated content, or None if content generation failed.
+    """
+    product_title = product['title']
+    product_id = product['id']
+
+    if not generated_content:
+        logging.error(f"Failed to generate content for product '{product_title}'")
+        return None
+
+    description, tags, category = parse_generated_content(generated_content)
+    images = scrape_images(product_title)
+
+    return {
+        "product_id": product_id,
+        "title": product_title,
+        "description": description,
+        "tags": tags,
+        "category": category,
+        "images": images
+    }
+
+async def process_product_async(product, force_regenerate=False):
+    """
+    Like process_product, awaiting the OpenAI request and the image search on the event loop.
+    """
+    logging.info(f"Processing product '{product['title']}' with ID {product['id']}")
+
+    generated_content = await generate_product_content_async(product['title'], force=force_regenerate)
+    return await complete_product_async(product, generated_content)
+
+async def complete_product_async(product, generated_content):
+    """
+    Like complete_product, awaiting the image search on the event loop.
+    """
+    if not generated_content:
+        logging.error(f"Failed to generate content for product '{product['title']}'")
+        return None
+
+    description, tags, category = parse_generated_content(generated_content)
+    images = await scrape_images_async(product['title'])
+
+    return {
+        "product_id": product['id'],
+        "title": product['title'],
+        "description": description,
+        "tags": tags,
+        "category": category,
+        "images": images
+    }
+
+def _safe_call(function, product, *args):
+    """
+    Calls a pipeline stage so that an unexpected exception for one product is logged instead of
+    propagating to the other products in the batch.
+    """
+    try:
+        with log_context(product_id=product.get('id')):
+            return function(product, *args)
+    except Exception:
+        logging.exception(f"Unexpected error while processing product '{product.get('title')}'")
+        return None
+
+async def _safe_call_async(semaphore, function, product, *args):
+    # The semaphore bounds the stages running at once, as the thread pool does for the threaded pipeline
+    async with semaphore:
+        try:
+            with log_context(product_id=product.get('id')):
+                return await function(product, *args)
+        except Exception:
+            logging.exception(f"Unexpected error while processing product '{product.get('title')}'")
+            return None
+
+def _copy_result(source, target):
+    # Work cancelled because the generator was closed cancels the product's future too
+    if source.cancelled():
+        target.cancel()
+    else:
+        target.set_result(source.result())
+
+def generate_contents(products, force_regenerate=False):
+    """
+    Generates content for a batch of products with one OpenAI request. Never raises; products whose
+    content could not be generated get None.
+
+    Args:
+        products (list): The Shopify products, at most OPENAI_BATCH_SIZE of them.
+        force_regenerate (bool): Ignore cached content and generate it again.
+
+    Returns:
+        list: The generated text for each product, in the same order.
+    """
+    titles = [product['title'] for product in products]
+    logging.info(f"Generating content for {len(titles)} products in one request")
+    try:
+        return generate_product_content_batch(titles, force=force_regenerate)
+    except Exception:
+        logging.exception(f"Unexpected error while generating content for products {titles}")
+        return [None] * len(products)
+
+async def generate_contents_async(products, force_regenerate=False):
+    """
+    Like generate_contents, awaiting the OpenAI request on the event loop.
+    """
+    titles = [product['title'] for product in products]
+    logging.info(f"Generating content for {len(titles)} products in one request")
+    try:
+        return await generate_product_content_batch_async(titles, force=force_regenerate)
+    except Exception:
+        logging.exception(f"Unexpected error while generating content for products {titles}")
+        return [None] * len(products)
+
+def _worker_count(max_workers):
+    # The value may come straight from a form, so it is bounded here rather than trusted
+    if not max_workers or max_workers < 1:
+        return GENERATION_CONCURRENCY
+    return min(max_workers, GENERATION_CONCURRENCY_MAX)
+
+def generate_products_content(products, max_workers=None, force_regenerate=False, batch_size=None):
+    """
+    Runs the content pipeline for many products at once using a bounded thread pool.
+
+    Args:
+        products (list): The Shopify products to process.
+        max_workers (int): The maximum number of products processed concurrently, at most
+            GENERATION_CONCURRENCY_MAX. Defaults to GENERATION_CONCURRENCY, also used for values below 1.
+        force_regenerate (bool): Ignore cached content and generate it again.
+        batch_size (int): Number of products whose content is generated by one OpenAI request.
+            Defaults to OPENAI_BATCH_SIZE; 1 sends one request per product.
+
+    Returns:
+        list: The generated product details, in the same order as the input products. Products that failed
+        are left out.
+    """
+    return list(iter_products_content(products, max_workers, force_regenerate, batch_size))
+
+def iter_products_content(products, max_workers=None, force_regenerate=False, batch_size=None):
+    """
+    Streaming form of generate_products_content: yields each product's details as soon as it, and every
+    product before it, is done. Only a window of batches ahead of the consumer is in flight, so memory
+    stays flat however many products there are. Closing the generator early (e.g. because the client
+    disconnected) drops the work that has not started yet.
+
+    Args:
+        products (list): The Shopify products to process.
+        max_workers (int): The maximum number of products processed concurrently, at most
+            GENERATION_CONCURRENCY_MAX. Defaults to GENERATION_CONCURRENCY, also used for values below 1.
+        force_regenerate (bool): Ignore cached content and generate it again.
+        batch_size (int): Number of products whose content is generated by one OpenAI request.
+            Defaults to OPENAI_BATCH_SIZE; 1 sends one request per product.
+
+    Yields:
+        dict: The generated product details, in the same order as the input products. Products that failed
+        are left out.
+    """
+    max_workers = _worker_count(max_workers)
+    batch_size = max(1, batch_size or OPENAI_BATCH_SIZE)
+    batches = [products[start:start + batch_size] for start in range(0, len(products), batch_size)]
+    if not batches:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(products))))
+
+    def submit(function, *args):
+        # Stages are chained from callbacks, which may run after the generator was closed
+        try:
+            return executor.submit(_safe_call, function, *args)
+        except RuntimeError:
+            return None
+
+    def start_batch(batch):
+        if len(batch) == 1:
+            future = submit(process_product, batch[0], force_regenerate)
+            return [future] if future else []
+
+        # One future per product, resolved once its images have been looked up
+        results = [Future() for _ in batch]
+
+        def on_generated(generated):
+            if generated.cancelled():
+                return
+            for product, content, result in zip(batch, generated.result(), results):
+                completed = submit(complete_product, product, content)
+                if completed:
+                    completed.add_done_callback(lambda future, result=result: _copy_result(future, result))
+                else:
+                    result.cancel()
+
+        executor.submit(generate_contents, batch, force_regenerate).add_done_callback(on_generated)
+        return results
+
+    try:
+        # Keep enough batches in flight to occupy every worker, in input order
+        in_flight = deque()
+        next_batch = 0
+        while next_batch < len(batches) or in_flight:
+            while next_batch < len(batches) and len(in_flight) < max_workers:
+                in_flight.append(start_batch(batches[next_batch]))
+                next_batch += 1
+
+            for future in in_flight.popleft():
+                result = future.result()
+                if result:
+                    yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def generate_products_content_async(products, max_workers=None, force_regenerate=False, batch_size=None):
+    """
+    Like generate_products_content, running the pipeline on the event loop.
+    """
+    return [result async for result in iter_products_content_async(products, max_workers, force_regenerate, batch_size)]
+
+async def iter_products_content_async(products, max_workers=None, force_regenerate=False, batch_size=None):
+    """
+    Like iter_products_content, running the pipeline on the event loop instead of a thread pool: the
+    stages are coroutines, at most max_workers of which run at once, and a window of max_workers batches
+    is kept in flight ahead of the consumer. Closing the generator early cancels the batches in flight.
+
+    Yields:
+        dict: The generated product details, in the same order as the input products. Products that failed
+        are left out.
+    """
+    max_workers = _worker_count(max_workers)
+    batch_size = max(1, batch_size or OPENAI_BATCH_SIZE)
+    batches = [products[start:start + batch_size] for start in range(0, len(products), batch_size)]
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run_batch(batch):
+        if len(batch) == 1:
+            return [await _safe_call_async(semaphore, process_product_async, batch[0], force_regenerate)]
+
+        async with semaphore:
+            generated = await generate_contents_async(batch, force_regenerate)
+        return await asyncio.gather(*(
+            _safe_call_async(semaphore, complete_product_async, product, content)
+            for product, content in zip(batch, generated)
+        ))
+
+    in_flight = deque()
+    try:
+        next_batch = 0
+        while next_batch < len(batches) or in_flight:
+            while next_batch < len(batches) and len(in_flight) < max_workers:
+                in_flight.append(asyncio.ensure_future(run_batch(batches[next_batch])))
+                next_batch += 1
+
+            for result in await in_flight.popleft():
+                if result:
+                    yield result
+    finally:
+        for task in in_flight:
+            task.cancel()
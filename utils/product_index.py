@@ -0,0 +1,218 @@
+import json
+import logging
+import threading
+import time
+import config
+from utils.shopify_client import get_shopify_client
+from utils.sqlite_helper import connect
+
+# Path of the SQLite product index; None disables the index and every vendor query pages through Shopify
+PRODUCT_INDEX_PATH = getattr(config, 'PRODUCT_INDEX_PATH', None)
+
+# Minimum number of seconds between incremental syncs; webhooks keep the index current in between
+PRODUCT_INDEX_SYNC_INTERVAL = getattr(config, 'PRODUCT_INDEX_SYNC_INTERVAL', 60)
+
+class ProductIndex:
+    """
+    Local index of the store's products and variants.
+
+    The index is filled by incremental syncs that only fetch products updated since the previous sync
+    (updated_at_min), and kept current between syncs by the product and inventory webhooks. Vendor and
+    low-inventory queries are then answered locally.
+    """
+    def __init__(self, path, sync_interval=PRODUCT_INDEX_SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0.0
+        with connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    id INTEGER PRIMARY KEY,
+                    title TEXT,
+                    vendor TEXT,
+                    status TEXT,
+                    updated_at TEXT,
+                    total_inventory INTEGER NOT NULL DEFAULT 0,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS products_vendor_inventory ON products (vendor, total_inventory)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS variants (
+                    id INTEGER PRIMARY KEY,
+                    product_id INTEGER NOT NULL,
+                    inventory_item_id INTEGER,
+                    inventory_quantity INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS variants_product ON variants (product_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS variants_inventory_item ON variants (inventory_item_id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS inventory_levels (
+                    inventory_item_id INTEGER NOT NULL,
+                    location_id INTEGER NOT NULL,
+                    available INTEGER NOT NULL,
+                    PRIMARY KEY (inventory_item_id, location_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+
+    def upsert_products(self, products):
+        """
+        Stores REST-format products (with their variants), replacing any earlier copies.
+        """
+        with connect(self.path) as conn:
+            for product in products:
+                variants = product.get('variants') or []
+                total_inventory = sum(variant.get('inventory_quantity') or 0 for variant in variants)
+                conn.execute(
+                    "INSERT OR REPLACE INTO products (id, title, vendor, status, updated_at, total_inventory, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (product['id'], product.get('title'), product.get('vendor'), product.get('status'),
+                     product.get('updated_at'), total_inventory, json.dumps(product))
+                )
+                conn.execute("DELETE FROM variants WHERE product_id = ?", (product['id'],))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO variants (id, product_id, inventory_item_id, inventory_quantity) VALUES (?, ?, ?, ?)",
+                    [(variant['id'], product['id'], variant.get('inventory_item_id'), variant.get('inventory_quantity') or 0)
+                     for variant in variants]
+                )
+
+    def delete_product(self, product_id):
+        product_id = _numeric_id(product_id)
+        with connect(self.path) as conn:
+            conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            conn.execute("DELETE FROM variants WHERE product_id = ?", (product_id,))
+
+    def update_inventory_level(self, inventory_item_id, location_id, available):
+        """
+        Applies an inventory_levels/update webhook. The webhook carries the item's level at one location while
+        variants hold the total across all locations, so levels are recorded per location and the variant and
+        product totals are moved by the change from the previous level at that location. The first webhook
+        for a location only records its level; the totalInventory lookup made for every inventory webhook
+        corrects the product total in that case.
+        """
+        with connect(self.path) as conn:
+            previous = conn.execute(
+                "SELECT available FROM inventory_levels WHERE inventory_item_id = ? AND location_id = ?",
+                (inventory_item_id, location_id)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO inventory_levels (inventory_item_id, location_id, available) VALUES (?, ?, ?)",
+                (inventory_item_id, location_id, available)
+            )
+            row = conn.execute(
+                "SELECT product_id FROM variants WHERE inventory_item_id = ?", (inventory_item_id,)
+            ).fetchone()
+            if not previous or not row:
+                return
+
+            change = available - previous["available"]
+            conn.execute(
+                "UPDATE variants SET inventory_quantity = inventory_quantity + ? WHERE inventory_item_id = ?",
+                (change, inventory_item_id)
+            )
+            conn.execute(
+                "UPDATE products SET total_inventory = total_inventory + ? WHERE id = ?", (change, row["product_id"])
+            )
+
+    def update_total_inventory(self, product_id, total_inventory):
+        """
+        Records a product's total inventory as reported by a GraphQL lookup.
+        """
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE products SET total_inventory = ? WHERE id = ?", (total_inventory, _numeric_id(product_id))
+            )
+
+    def get_vendor_products(self, vendor, min_inventory_level):
+        """
+        Returns the indexed products of a vendor whose total inventory is below the minimum inventory level.
+        """
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT data, total_inventory FROM products WHERE vendor = ? AND total_inventory < ? ORDER BY id",
+                (vendor, min_inventory_level)
+            ).fetchall()
+
+        products = []
+        for row in rows:
+            product = json.loads(row["data"])
+            product['total_inventory'] = row["total_inventory"]
+            products.append(product)
+        return products
+
+    def sync(self, force=False):
+        """
+        Fetches the products updated since the last sync and stores them. Skipped if the previous sync was
+        less than sync_interval seconds ago, unless force is set.
+
+        Returns:
+            int: The number of products fetched.
+        """
+        with self._sync_lock:
+            if not force and time.monotonic() - self._last_sync < self.sync_interval:
+                return 0
+
+            with connect(self.path) as conn:
+                row = conn.execute("SELECT value FROM sync_state WHERE key = 'updated_at_min'").fetchone()
+            updated_at_min = row["value"] if row else None
+
+            client = get_shopify_client()
+            params = {"limit": 250}
+            if updated_at_min:
+                params["updated_at_min"] = updated_at_min
+
+            url = client.url("products.json")
+            fetched = 0
+            latest = updated_at_min
+            while url:
+                response = client.get(url, params=params)
+                if response.status_code != 200:
+                    logging.error(f"Failed to sync product index. Status code: {response.status_code}")
+                    return fetched
+
+                products = response.json().get('products', [])
+                self.upsert_products(products)
+                fetched += len(products)
+                for product in products:
+                    if product.get('updated_at') and (not latest or product['updated_at'] > latest):
+                        latest = product['updated_at']
+
+                # Pagination links already carry the query parameters
+                url = client.next_page_url(response)
+                params = None
+
+            if latest:
+                with connect(self.path) as conn:
+                    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('updated_at_min', ?)", (latest,))
+
+            self._last_sync = time.monotonic()
+            logging.info(f"Product index sync fetched {fetched} updated products")
+            return fetched
+
+def _numeric_id(product_id):
+    # Accept both numeric IDs and GraphQL GIDs such as 'gid://shopify/Product/123'
+    return int(str(product_id).split('/')[-1])
+
+_product_index = None
+_product_index_lock = threading.Lock()
+
+def get_product_index():
+    """
+    Returns the process-wide product index, or None if the index is disabled.
+    """
+    global _product_index
+    if not PRODUCT_INDEX_PATH:
+        return None
+    with _product_index_lock:
+        if _product_index is None:
+            _product_index = ProductIndex(PRODUCT_INDEX_PATH)
+        return _product_index
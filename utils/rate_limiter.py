@@ -0,0 +1,254 @@
+import asyncio
+import random
+import threading
+import time
+import config
+from utils.metrics import RATE_LIMIT_WAIT
+
+# REST Admin API leaky bucket: capacity and leak rate (requests per second). Shopify Plus stores use 80 / 4.
+SHOPIFY_REST_BUCKET_SIZE = getattr(config, 'SHOPIFY_REST_BUCKET_SIZE', 40)
+SHOPIFY_REST_LEAK_RATE = getattr(config, 'SHOPIFY_REST_LEAK_RATE', 2.0)
+
+# GraphQL Admin API cost bucket: maximum available points and restore rate (points per second)
+SHOPIFY_GRAPHQL_BUCKET_SIZE = getattr(config, 'SHOPIFY_GRAPHQL_BUCKET_SIZE', 1000)
+SHOPIFY_GRAPHQL_RESTORE_RATE = getattr(config, 'SHOPIFY_GRAPHQL_RESTORE_RATE', 50.0)
+
+# Number of REST slots left free so that requests from other processes do not push the bucket over
+SHOPIFY_REST_HEADROOM = getattr(config, 'SHOPIFY_REST_HEADROOM', 1)
+
+class ShopifyRateLimiter:
+    """
+    Paces Shopify Admin API calls just under the store's rate limits.
+
+    Each bucket is modelled locally (filled by our own requests, drained at the leak/restore rate) and
+    corrected from what Shopify reports: the X-Shopify-Shop-Api-Call-Limit header for REST and
+    extensions.cost.throttleStatus for GraphQL. A throttled response pauses every caller until the
+    Retry-After time has passed.
+    """
+    def __init__(self, rest_capacity=SHOPIFY_REST_BUCKET_SIZE, rest_leak_rate=SHOPIFY_REST_LEAK_RATE,
+                 graphql_capacity=SHOPIFY_GRAPHQL_BUCKET_SIZE, graphql_restore_rate=SHOPIFY_GRAPHQL_RESTORE_RATE,
+                 rest_headroom=SHOPIFY_REST_HEADROOM):
+        self._lock = threading.Lock()
+        now = time.monotonic()
+
+        self.rest_capacity = rest_capacity
+        self.rest_leak_rate = rest_leak_rate
+        self.rest_headroom = rest_headroom
+        self._rest_used = 0.0
+        self._rest_updated = now
+
+        self.graphql_capacity = graphql_capacity
+        self.graphql_restore_rate = graphql_restore_rate
+        self._graphql_available = float(graphql_capacity)
+        self._graphql_updated = now
+
+        self._paused_until = 0.0
+
+        # Counters for monitoring
+        self.throttled = 0
+        self.wait_time = 0.0
+
+    def _leak(self, now):
+        self._rest_used = max(0.0, self._rest_used - (now - self._rest_updated) * self.rest_leak_rate)
+        self._rest_updated = now
+        self._graphql_available = min(
+            float(self.graphql_capacity),
+            self._graphql_available + (now - self._graphql_updated) * self.graphql_restore_rate
+        )
+        self._graphql_updated = now
+
+    def acquire_rest(self):
+        """
+        Blocks until a REST call fits in the bucket, then reserves a slot for it.
+        """
+        self._sleep(self._reserve_rest(), "shopify_rest")
+
+    async def acquire_rest_async(self):
+        """
+        Like acquire_rest, but waits without blocking the event loop.
+        """
+        await asyncio.sleep(self._record_wait(self._reserve_rest(), "shopify_rest"))
+
+    def _reserve_rest(self):
+        # Returns how long the caller has to wait before sending
+        with self._lock:
+            now = time.monotonic()
+            self._leak(now)
+            limit = max(1, self.rest_capacity - self.rest_headroom)
+            # Reserve the slot now; the bucket drains while we wait, so overflow is converted into a delay
+            delay = max(0.0, (self._rest_used + 1 - limit) / self.rest_leak_rate, self._paused_until - now)
+            self._rest_used += 1
+        return delay
+
+    def acquire_graphql(self, cost):
+        """
+        Blocks until the GraphQL bucket has enough points for a query of the given cost, then reserves them.
+        """
+        self._sleep(self._reserve_graphql(cost), "shopify_graphql")
+
+    async def acquire_graphql_async(self, cost):
+        """
+        Like acquire_graphql, but waits without blocking the event loop.
+        """
+        await asyncio.sleep(self._record_wait(self._reserve_graphql(cost), "shopify_graphql"))
+
+    def _reserve_graphql(self, cost):
+        with self._lock:
+            now = time.monotonic()
+            self._leak(now)
+            cost = min(cost, self.graphql_capacity)
+            delay = max(0.0, (cost - self._graphql_available) / self.graphql_restore_rate, self._paused_until - now)
+            self._graphql_available -= cost
+        return delay
+
+    def update_rest(self, call_limit_header):
+        """
+        Corrects the REST bucket from an X-Shopify-Shop-Api-Call-Limit header value such as '32/40'.
+        """
+        try:
+            used, capacity = (int(part) for part in call_limit_header.split('/'))
+        except (AttributeError, ValueError):
+            return
+        with self._lock:
+            self._leak(time.monotonic())
+            self.rest_capacity = capacity
+            # Keep reservations made by in-flight calls that Shopify has not counted yet
+            self._rest_used = max(self._rest_used, float(used))
+
+    def update_graphql(self, throttle_status):
+        """
+        Corrects the GraphQL bucket from an extensions.cost.throttleStatus object.
+        """
+        if not throttle_status:
+            return
+        with self._lock:
+            self._leak(time.monotonic())
+            self.graphql_capacity = throttle_status.get('maximumAvailable', self.graphql_capacity)
+            self.graphql_restore_rate = throttle_status.get('restoreRate', self.graphql_restore_rate)
+            available = throttle_status.get('currentlyAvailable')
+            if available is not None:
+                self._graphql_available = float(available)
+
+    def pause(self, seconds):
+        """
+        Holds back every caller for the given number of seconds, e.g. after a 429 response.
+        """
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _sleep(self, delay, service):
+        if self._record_wait(delay, service) > 0:
+            time.sleep(delay)
+
+    def _record_wait(self, delay, service):
+        if delay > 0:
+            with self._lock:
+                self.wait_time += delay
+            RATE_LIMIT_WAIT.inc(delay, service=service)
+        return delay
+
+# OpenAI account limits shared by every thread in the process
+OPENAI_REQUESTS_PER_MINUTE = getattr(config, 'OPENAI_REQUESTS_PER_MINUTE', 3500)
+OPENAI_TOKENS_PER_MINUTE = getattr(config, 'OPENAI_TOKENS_PER_MINUTE', 90000)
+
+class OpenAIRateLimiter:
+    """
+    Shares the OpenAI request and token budget between concurrent callers.
+
+    Requests and tokens are drawn from two buckets that refill at the per-minute limits. When any caller
+    is rate limited, every caller backs off together until the server's retry hint (or a jittered
+    exponential backoff) has passed, instead of each thread retrying on its own.
+    """
+    def __init__(self, requests_per_minute=OPENAI_REQUESTS_PER_MINUTE, tokens_per_minute=OPENAI_TOKENS_PER_MINUTE):
+        self._lock = threading.Lock()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests_available = float(requests_per_minute)
+        self._tokens_available = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+        # Counters for monitoring
+        self.requests = 0
+        self.rate_limited = 0
+        self.wait_time = 0.0
+        self.generation_time = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._requests_available = min(
+            float(self.requests_per_minute), self._requests_available + elapsed * self.requests_per_minute / 60
+        )
+        self._tokens_available = min(
+            float(self.tokens_per_minute), self._tokens_available + elapsed * self.tokens_per_minute / 60
+        )
+        self._updated = now
+
+    def acquire(self, tokens):
+        """
+        Blocks until the budget allows one more request of roughly the given number of tokens, then reserves it.
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens):
+        """
+        Like acquire, but waits without blocking the event loop.
+        """
+        await asyncio.sleep(self._reserve(tokens))
+
+    def _reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            tokens = min(tokens, self.tokens_per_minute)
+            delay = max(
+                0.0,
+                (1 - self._requests_available) * 60 / self.requests_per_minute,
+                (tokens - self._tokens_available) * 60 / self.tokens_per_minute,
+                self._paused_until - now
+            )
+            self._requests_available -= 1
+            self._tokens_available -= tokens
+            self.requests += 1
+            self.wait_time += delay
+        if delay > 0:
+            RATE_LIMIT_WAIT.inc(delay, service="openai")
+        return delay
+
+    def record_usage(self, reserved_tokens, used_tokens, elapsed):
+        """
+        Returns unused reserved tokens to the budget and records the time spent generating.
+        """
+        with self._lock:
+            self.generation_time += elapsed
+            if used_tokens is not None:
+                self._tokens_available += reserved_tokens - used_tokens
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Pauses every caller after a rate-limit error.
+
+        Args:
+            attempt (int): The zero-based attempt number that was rate limited.
+            retry_after (float): The server's retry hint in seconds, if it sent one.
+
+        Returns:
+            float: The number of seconds callers will wait.
+        """
+        delay = retry_after if retry_after is not None else min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+        with self._lock:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "wait_seconds": round(self.wait_time, 3),
+                "generation_seconds": round(self.generation_time, 3),
+            }
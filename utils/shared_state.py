@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+import config
+from utils.sqlite_helper import connect
+
+# Path of the SQLite database shared by all worker processes; None keeps state in process memory,
+# which is only correct when the app runs as a single process
+SHARED_STATE_PATH = getattr(config, 'SHARED_STATE_PATH', None)
+
+class InProcessState:
+    """
+    Shared-state backend for a single process: pending debounced events and stored values live in dicts
+    and locks are ordinary thread locks.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> (deadline, payload)
+        self._values = {}  # key -> (expiry, value)
+        self._named_locks = {}
+
+    def schedule_debounce(self, key, payload, delay):
+        """
+        Records the latest payload for a debounced key and pushes its deadline back by delay seconds.
+        """
+        with self._lock:
+            self._pending[key] = (time.time() + delay, payload)
+
+    def claim_debounce(self, key, force=False):
+        """
+        Claims a debounced key whose deadline has passed, so that exactly one caller processes it.
+
+        Args:
+            key: The debounced key.
+            force (bool): Claim the key even if its deadline has not passed, e.g. when it is flushed early
+                to bound the number of pending keys.
+
+        Returns:
+            The latest payload scheduled for the key, or None if it is not due or was already claimed.
+        """
+        with self._lock:
+            entry = self._pending.get(key)
+            if not entry or (entry[0] > time.time() and not force):
+                return None
+            del self._pending[key]
+            return entry[1]
+
+    def debounce_pending(self, key):
+        """
+        Returns whether a debounced key is scheduled and not yet claimed.
+        """
+        with self._lock:
+            return key in self._pending
+
+    def pending_debounces(self):
+        """
+        Returns every scheduled, unclaimed debounced key with its latest payload.
+        """
+        with self._lock:
+            return {key: payload for key, (_, payload) in self._pending.items()}
+
+    def set_value(self, key, value, ttl):
+        """
+        Stores a JSON-serialisable value that any worker can read for the next ttl seconds.
+        """
+        with self._lock:
+            now = time.time()
+            self._values = {k: entry for k, entry in self._values.items() if entry[0] > now}
+            self._values[key] = (now + ttl, value)
+
+    def get_value(self, key):
+        """
+        Returns a stored value, or None if it was never stored or has expired.
+        """
+        with self._lock:
+            entry = self._values.get(key)
+            return entry[1] if entry and entry[0] > time.time() else None
+
+    @contextmanager
+    def lock(self, name):
+        """
+        Holds a named lock for the duration of the block.
+        """
+        with self._lock:
+            named_lock = self._named_locks.setdefault(name, threading.Lock())
+        with named_lock:
+            yield
+
+class SQLiteState:
+    """
+    Shared-state backend for several worker processes on one host, backed by a SQLite database and needing
+    no outside service. Debounced events are claimed with a conditional delete, so only one worker fires
+    for each burst, and named locks are held as SQLite write transactions, which serialise across processes.
+    """
+    def __init__(self, path):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS debounce (
+                    key TEXT PRIMARY KEY,
+                    deadline REAL NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shared_values (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL,
+                    value TEXT NOT NULL
+                )
+            """)
+
+    def schedule_debounce(self, key, payload, delay):
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO debounce (key, deadline, payload) VALUES (?, ?, ?)",
+                (str(key), time.time() + delay, json.dumps(payload))
+            )
+
+    def claim_debounce(self, key, force=False):
+        with connect(self.path) as conn:
+            # Take the write lock up front so that the read and the delete are one atomic step
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT payload FROM debounce WHERE key = ? AND deadline <= ?",
+                (str(key), float('inf') if force else time.time())
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute("DELETE FROM debounce WHERE key = ?", (str(key),))
+            return json.loads(row["payload"])
+
+    def debounce_pending(self, key):
+        with connect(self.path) as conn:
+            return conn.execute("SELECT 1 FROM debounce WHERE key = ?", (str(key),)).fetchone() is not None
+
+    def pending_debounces(self):
+        # Keys come back as strings; callers key debounced events by their string form
+        with connect(self.path) as conn:
+            rows = conn.execute("SELECT key, payload FROM debounce").fetchall()
+        return {row["key"]: json.loads(row["payload"]) for row in rows}
+
+    def set_value(self, key, value, ttl):
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute("DELETE FROM shared_values WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_values (key, expires_at, value) VALUES (?, ?, ?)",
+                (str(key), now + ttl, json.dumps(value))
+            )
+
+    def get_value(self, key):
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT value FROM shared_values WHERE key = ? AND expires_at > ?", (str(key), time.time())
+            ).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    @contextmanager
+    def lock(self, name):
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield
+
+_shared_state = None
+_shared_state_lock = threading.Lock()
+
+def get_shared_state():
+    """
+    Returns the process-wide shared-state backend: SQLiteState when SHARED_STATE_PATH is set, otherwise
+    InProcessState.
+    """
+    global _shared_state
+    with _shared_state_lock:
+        if _shared_state is None:
+            _shared_state = SQLiteState(SHARED_STATE_PATH) if SHARED_STATE_PATH else InProcessState()
+        return _shared_state
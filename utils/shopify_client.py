@@ -0,0 +1,332 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from config import SHOPIFY_STORE, SHOPIFY_ACCESS_TOKEN
+from utils.async_http import get_session
+from utils.rate_limiter import ShopifyRateLimiter
+from utils.metrics import record_request, OUTBOUND_RETRIES, RATE_LIMIT_THROTTLES
+
+SHOPIFY_API_VERSION = getattr(config, 'SHOPIFY_API_VERSION', '2023-07')
+
+# Overrides the Admin API base URL (https://<store>/admin/api/<version>), e.g. to point at a local test server
+SHOPIFY_API_BASE_URL = getattr(config, 'SHOPIFY_API_BASE_URL', None)
+
+# Maximum number of keep-alive connections kept open to the store
+SHOPIFY_POOL_SIZE = getattr(config, 'SHOPIFY_POOL_SIZE', 20)
+
+# (connect, read) timeouts in seconds for every Shopify request
+SHOPIFY_TIMEOUT = getattr(config, 'SHOPIFY_TIMEOUT', (5, 30))
+
+# Number of times a throttled request is retried before its response is returned to the caller
+SHOPIFY_MAX_RETRIES = getattr(config, 'SHOPIFY_MAX_RETRIES', 5)
+
+# Cost assumed for a GraphQL query when the caller does not give one
+SHOPIFY_GRAPHQL_DEFAULT_COST = getattr(config, 'SHOPIFY_GRAPHQL_DEFAULT_COST', 10)
+
+class BaseShopifyClient:
+    """
+    What the threaded and the asyncio Shopify clients share: URL building and reading Shopify's throttling
+    feedback. Both pace their requests with a ShopifyRateLimiter and retry throttled requests with backoff.
+    """
+    def __init__(self, store=SHOPIFY_STORE, access_token=SHOPIFY_ACCESS_TOKEN, api_version=SHOPIFY_API_VERSION,
+                 timeout=SHOPIFY_TIMEOUT, max_retries=SHOPIFY_MAX_RETRIES, rate_limiter=None,
+                 base_url=SHOPIFY_API_BASE_URL):
+        self.base_url = (base_url or f"https://{store}/admin/api/{api_version}").rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or ShopifyRateLimiter()
+        self.headers = {
+            "Content-Type": "application/json",
+            "X-Shopify-Access-Token": access_token
+        }
+
+    def url(self, path):
+        """
+        Builds the full Admin API URL for a path such as 'products.json'. Full URLs (e.g. pagination links)
+        are returned unchanged.
+        """
+        if path.startswith(("https://", "http://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    @staticmethod
+    def next_page_url(response):
+        """
+        Returns the URL of the next page from a paginated REST response's Link header, or None on the last page.
+        """
+        for link in response.headers.get("Link", "").split(","):
+            if 'rel="next"' in link:
+                return link.split(";")[0].strip().strip("<>")
+        return None
+
+    def _should_retry(self, method, url, response, graphql_cost, attempt):
+        """
+        Feeds a response's rate-limit headers back to the rate limiter and decides whether to retry it.
+        When it is retried, every caller is paused for the retry delay first.
+
+        Returns:
+            bool: True if the request was throttled and has retries left.
+        """
+        service = "shopify_rest" if graphql_cost is None else "shopify_graphql"
+
+        call_limit = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
+        if call_limit:
+            self.rate_limiter.update_rest(call_limit)
+
+        throttled = response.status_code == 429
+        if graphql_cost is not None and response.status_code == 200:
+            throttled = self._update_graphql_cost(response)
+
+        if throttled:
+            RATE_LIMIT_THROTTLES.inc(service=service)
+
+        if not throttled or attempt == self.max_retries:
+            if throttled:
+                logging.error(f"Shopify request {method} {url} still throttled after {self.max_retries} retries")
+            return False
+
+        delay = self._retry_delay(response, attempt)
+        logging.warning(f"Shopify request {method} {url} throttled, retrying in {delay:.1f} seconds")
+        self.rate_limiter.pause(delay)
+        OUTBOUND_RETRIES.inc(service=service)
+        return True
+
+    def _update_graphql_cost(self, response):
+        """
+        Feeds the GraphQL throttle status back to the rate limiter.
+
+        Returns:
+            bool: True if the query was rejected as THROTTLED.
+        """
+        try:
+            data = response.json()
+        except ValueError:
+            return False
+
+        cost = (data.get("extensions") or {}).get("cost") or {}
+        self.rate_limiter.update_graphql(cost.get("throttleStatus"))
+
+        errors = data.get("errors") or []
+        return any((error.get("extensions") or {}).get("code") == "THROTTLED" for error in errors if isinstance(error, dict))
+
+    @staticmethod
+    def _retry_delay(response, attempt):
+        """
+        Uses the Retry-After header when Shopify sends one, otherwise exponential backoff with jitter.
+        """
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _graphql_payload(query, variables):
+        payload = {"query": query}
+        if variables is not None:
+            payload["variables"] = variables
+        return payload
+
+class ShopifyClient(BaseShopifyClient):
+    """
+    Client for the Shopify Admin API. All requests share one keep-alive requests.Session, so connections
+    (and their TLS handshakes) to the store are pooled and reused between calls and threads.
+
+    Requests are paced by a ShopifyRateLimiter, and throttled requests (HTTP 429 or a GraphQL THROTTLED
+    error) are retried with backoff.
+    """
+    def __init__(self, store=SHOPIFY_STORE, access_token=SHOPIFY_ACCESS_TOKEN, api_version=SHOPIFY_API_VERSION,
+                 pool_size=SHOPIFY_POOL_SIZE, timeout=SHOPIFY_TIMEOUT, max_retries=SHOPIFY_MAX_RETRIES,
+                 rate_limiter=None, base_url=SHOPIFY_API_BASE_URL):
+        """
+        Args:
+            store (str): The store domain, e.g. 'example.myshopify.com'.
+            access_token (str): The Admin API access token.
+            api_version (str): The Admin API version to call.
+            pool_size (int): The maximum number of pooled connections per host.
+            timeout (float or tuple): The default request timeout, as accepted by requests.
+            max_retries (int): The number of retries for throttled requests.
+            rate_limiter (ShopifyRateLimiter): The limiter to pace requests with. A new one is created if omitted.
+            base_url (str): The Admin API base URL; built from store and api_version if omitted.
+        """
+        super().__init__(store, access_token, api_version, timeout, max_retries, rate_limiter, base_url)
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        # One pool per host; pool_block makes extra threads wait for a free connection instead of opening more
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends a REST request, waiting for room in the rate-limit bucket first and retrying on HTTP 429.
+        """
+        return self._send(method, self.url(path), None, **kwargs)
+
+    def _send(self, method, url, graphql_cost, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        service = "shopify_rest" if graphql_cost is None else "shopify_graphql"
+
+        for attempt in range(self.max_retries + 1):
+            if graphql_cost is None:
+                self.rate_limiter.acquire_rest()
+            else:
+                self.rate_limiter.acquire_graphql(graphql_cost)
+
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException:
+                record_request(service, "error", time.perf_counter() - started)
+                raise
+            record_request(service, response.status_code, time.perf_counter() - started)
+
+            if not self._should_retry(method, url, response, graphql_cost, attempt):
+                return response
+
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def graphql(self, query, variables=None, cost=SHOPIFY_GRAPHQL_DEFAULT_COST):
+        """
+        Sends a GraphQL query to the Admin API, waiting for enough points in the cost bucket first and
+        retrying if the query is throttled.
+
+        Args:
+            query (str): The GraphQL query or mutation.
+            variables (dict): Optional query variables.
+            cost (int): The expected query cost, used to pace the request.
+
+        Returns:
+            requests.Response: The raw response.
+        """
+        return self._send("POST", self.url("graphql.json"), cost, json=self._graphql_payload(query, variables))
+
+class ShopifyResponse:
+    """
+    A response read in full by AsyncShopifyClient, with the parts of requests.Response that callers use.
+    """
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+class AsyncShopifyClient(BaseShopifyClient):
+    """
+    Client for the Shopify Admin API for code running on an event loop, such as the routes served by
+    asgi.py. Requests go through a pooled aiohttp session, so thousands of them can wait on Shopify
+    without a thread each. Pacing and retries are the same as ShopifyClient's, and the process-wide client
+    shares its rate limiter with the threaded one, so both draw on one budget.
+    """
+    def __init__(self, store=SHOPIFY_STORE, access_token=SHOPIFY_ACCESS_TOKEN, api_version=SHOPIFY_API_VERSION,
+                 pool_size=SHOPIFY_POOL_SIZE, timeout=SHOPIFY_TIMEOUT, max_retries=SHOPIFY_MAX_RETRIES,
+                 rate_limiter=None, base_url=SHOPIFY_API_BASE_URL):
+        """
+        Args are the same as ShopifyClient's; pool_size caps the open connections to the store.
+        """
+        super().__init__(store, access_token, api_version, timeout, max_retries, rate_limiter, base_url)
+        self.pool_size = pool_size
+
+    async def request(self, method, path, **kwargs):
+        """
+        Sends a REST request, waiting for room in the rate-limit bucket first and retrying on HTTP 429.
+
+        Returns:
+            ShopifyResponse: The response, read in full.
+        """
+        return await self._send(method, self.url(path), None, **kwargs)
+
+    async def _send(self, method, url, graphql_cost, **kwargs):
+        session = get_session("shopify", self.pool_size, self.timeout, self.headers)
+        service = "shopify_rest" if graphql_cost is None else "shopify_graphql"
+
+        for attempt in range(self.max_retries + 1):
+            if graphql_cost is None:
+                await self.rate_limiter.acquire_rest_async()
+            else:
+                await self.rate_limiter.acquire_graphql_async(graphql_cost)
+
+            started = time.perf_counter()
+            try:
+                async with session.request(method, url, **kwargs) as raw_response:
+                    response = ShopifyResponse(raw_response.status, raw_response.headers, await raw_response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                record_request(service, "error", time.perf_counter() - started)
+                raise
+            record_request(service, response.status_code, time.perf_counter() - started)
+
+            if not self._should_retry(method, url, response, graphql_cost, attempt):
+                return response
+
+        return response
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path, **kwargs):
+        return await self.request("PUT", path, **kwargs)
+
+    async def graphql(self, query, variables=None, cost=SHOPIFY_GRAPHQL_DEFAULT_COST):
+        """
+        Sends a GraphQL query to the Admin API, like ShopifyClient.graphql.
+
+        Returns:
+            ShopifyResponse: The response, read in full.
+        """
+        return await self._send("POST", self.url("graphql.json"), cost, json=self._graphql_payload(query, variables))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_shopify_client():
+    """
+    Returns the process-wide Shopify client, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ShopifyClient()
+        return _client
+
+_async_client = None
+
+def get_async_shopify_client():
+    """
+    Returns the process-wide asyncio Shopify client, creating it on first use. It shares the threaded
+    client's rate limiter.
+    """
+    global _async_client
+    rate_limiter = get_shopify_client().rate_limiter
+    with _client_lock:
+        if _async_client is None:
+            _async_client = AsyncShopifyClient(rate_limiter=rate_limiter)
+        return _async_client
@@ -1,12 +1,41 @@
+import asyncio
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import logging
-import os
 import random
 import time
 import urllib.parse
 import base64
-from config import SHOPIFY_STORE, SHOPIFY_ACCESS_TOKEN, IGNORE_LIST_FILE
+import config
+from utils.async_http import get_session
+from utils.shopify_client import get_shopify_client, get_async_shopify_client
+from utils.status_cache import status_cache
+from utils.product_index import get_product_index
+from utils.bulk_export import get_vendor_products_bulk, BulkExportError
+from utils.ignore_store import ignore_store
+from utils.metrics import track_stage, record_request
+
+# Largest image accepted for upload, and the time allowed to download one
+IMAGE_MAX_BYTES = getattr(config, 'IMAGE_MAX_BYTES', 20 * 1024 * 1024)
+IMAGE_DOWNLOAD_TIMEOUT = getattr(config, 'IMAGE_DOWNLOAD_TIMEOUT', 30)
+
+# How vendor products are fetched when the product index is disabled: 'rest' pages through products.json,
+# 'bulk' runs a GraphQL bulk operation (for very large catalogues)
+VENDOR_FETCH_MODE = getattr(config, 'VENDOR_FETCH_MODE', 'rest')
+
+# Image search page scraped for product images, and the random delay (in seconds) before each search
+IMAGE_SEARCH_URL = getattr(config, 'IMAGE_SEARCH_URL', 'https://www.google.com/search')
+SCRAPE_DELAY = getattr(config, 'SCRAPE_DELAY', (1.5, 4.0))
+
+# Maximum number of connections open to external image hosts from the event loop
+IMAGE_POOL_SIZE = getattr(config, 'IMAGE_POOL_SIZE', 20)
+
+# Shared keep-alive session for downloading images from external hosts
+image_session = requests.Session()
+image_session.mount('https://', HTTPAdapter(pool_maxsize=20))
+image_session.mount('http://', HTTPAdapter(pool_maxsize=20))
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
@@ -15,6 +44,7 @@ USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/55.0.2883.87 Safari/537.36',
 ]
 
+@track_stage('scrape_images')
 def scrape_images(product_title):
     """
     Scrapes images related to the product title from Google Images. Introduces delay and user-agent rotation to avoid
@@ -26,25 +56,27 @@ def scrape_images(product_title):
     Returns:
         list: A list of image URLs related to the product title.
     """
-    search_query = f"https://www.google.com/search?q={product_title}&tbm=isch"
+    search_query = f"{IMAGE_SEARCH_URL}?q={product_title}&tbm=isch"
     headers = {
         'User-Agent': random.choice(USER_AGENTS)  # Rotate User-Agent
     }
 
     try:
         # Introduce a random delay to avoid quick successive requests
-        time.sleep(random.uniform(1.5, 4.0))
+        time.sleep(random.uniform(*SCRAPE_DELAY))
 
         # Make the request to Google Images
-        response = requests.get(search_query, headers=headers, timeout=10)
+        started = time.perf_counter()
+        try:
+            response = requests.get(search_query, headers=headers, timeout=10)
+        except requests.exceptions.RequestException:
+            record_request('image_search', 'error', time.perf_counter() - started)
+            raise
+        record_request('image_search', response.status_code, time.perf_counter() - started)
         response.raise_for_status()
 
         # Parse the response content
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Find image tags and extract the image URLs
-        image_elements = soup.find_all('img')
-        image_urls = [img['src'] for img in image_elements if 'src' in img.attrs]
+        image_urls = _image_urls(response.content)
 
         # Log the number of images found
         logging.info(f"Successfully fetched {len(image_urls)} images for {product_title}")
@@ -60,24 +92,152 @@ def scrape_images(product_title):
         logging.error(f"Error scraping images for {product_title}: {e}")
         return []  # Return an empty list in case of any other error
 
-def download_image(image_url):
+@track_stage('scrape_images')
+async def scrape_images_async(product_title):
+    """
+    Like scrape_images, for callers on an event loop. The delay and the search are awaited, and the page is
+    parsed in a worker thread.
     """
-    Downloads an image from the specified URL and returns it as binary data.
+    headers = {
+        'User-Agent': random.choice(USER_AGENTS)  # Rotate User-Agent
+    }
+
+    await asyncio.sleep(random.uniform(*SCRAPE_DELAY))
+
+    started = time.perf_counter()
+    response = None
+    try:
+        session = get_session('images', IMAGE_POOL_SIZE)
+        params = {'q': product_title, 'tbm': 'isch'}
+        async with session.get(IMAGE_SEARCH_URL, params=params, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            record_request('image_search', response.status, time.perf_counter() - started)
+            response.raise_for_status()
+            content = await response.read()
+    except asyncio.TimeoutError:
+        if response is None:
+            record_request('image_search', 'error', time.perf_counter() - started)
+        logging.error(f"Timeout occurred while trying to scrape images for {product_title}")
+        return []
+    except aiohttp.ClientError as e:
+        if response is None:
+            record_request('image_search', 'error', time.perf_counter() - started)
+        logging.error(f"Error scraping images for {product_title}: {e}")
+        return []
+
+    image_urls = await asyncio.to_thread(_image_urls, content)
+    logging.info(f"Successfully fetched {len(image_urls)} images for {product_title}")
+    return image_urls
+
+def _image_urls(content):
+    # Find image tags in the search page and extract the image URLs
+    soup = BeautifulSoup(content, 'html.parser')
+    return [img['src'] for img in soup.find_all('img') if 'src' in img.attrs]
+
+@track_stage('download_image')
+def download_image(image_url, max_bytes=IMAGE_MAX_BYTES, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    """
+    Downloads an image from the specified URL and returns it as binary data. The body is streamed and the
+    download is abandoned if it exceeds max_bytes or takes longer than timeout seconds in total.
+    Inline data: URIs (as returned by some image searches) are decoded without a request.
     
     Args:
         image_url (str): The URL of the image to download.
+        max_bytes (int): The largest image accepted.
+        timeout (float): The maximum time in seconds for the whole download.
     
     Returns:
-        bytes: The binary image data.
+        bytes: The binary image data, or None if the download failed.
     """
-    response = requests.get(image_url)
-    
-    if response.status_code == 200:
-        return response.content  # Return the image data as binary
-    else:
-        print(f"Failed to download image from {image_url}. Status code: {response.status_code}")
+    if image_url.startswith('data:'):
+        return _decode_data_uri(image_url, max_bytes)
+
+    deadline = time.monotonic() + timeout
+    started = time.perf_counter()
+    response = None
+    try:
+        with image_session.get(image_url, stream=True, timeout=(5, timeout)) as response:
+            # Latency to the response headers; the whole download is covered by the stage timing
+            record_request('image_download', response.status_code, time.perf_counter() - started)
+            if response.status_code != 200:
+                logging.error(f"Failed to download image from {image_url}. Status code: {response.status_code}")
+                return None
+
+            if int(response.headers.get('Content-Length') or 0) > max_bytes:
+                logging.error(f"Image at {image_url} is larger than {max_bytes} bytes, skipping")
+                return None
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    logging.error(f"Image at {image_url} is larger than {max_bytes} bytes, skipping")
+                    return None
+                if time.monotonic() > deadline:
+                    logging.error(f"Timed out downloading image from {image_url}")
+                    return None
+                chunks.append(chunk)
+            return b"".join(chunks)  # Return the image data as binary
+
+    except requests.exceptions.RequestException as e:
+        if response is None:
+            record_request('image_download', 'error', time.perf_counter() - started)
+        logging.error(f"Failed to download image from {image_url}: {e}")
+        return None
+
+@track_stage('download_image')
+async def download_image_async(image_url, max_bytes=IMAGE_MAX_BYTES, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    """
+    Like download_image, for callers on an event loop, using a pooled aiohttp session.
+    """
+    if image_url.startswith('data:'):
+        return _decode_data_uri(image_url, max_bytes)
+
+    started = time.perf_counter()
+    response = None
+    try:
+        session = get_session('images', IMAGE_POOL_SIZE)
+        async with session.get(image_url, timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=5)) as response:
+            record_request('image_download', response.status, time.perf_counter() - started)
+            if response.status != 200:
+                logging.error(f"Failed to download image from {image_url}. Status code: {response.status}")
+                return None
+
+            if (response.content_length or 0) > max_bytes:
+                logging.error(f"Image at {image_url} is larger than {max_bytes} bytes, skipping")
+                return None
+
+            chunks = []
+            size = 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    logging.error(f"Image at {image_url} is larger than {max_bytes} bytes, skipping")
+                    return None
+                chunks.append(chunk)
+            return b"".join(chunks)
+
+    except asyncio.TimeoutError:
+        if response is None:
+            record_request('image_download', 'error', time.perf_counter() - started)
+        logging.error(f"Timed out downloading image from {image_url}")
+        return None
+    except aiohttp.ClientError as e:
+        if response is None:
+            record_request('image_download', 'error', time.perf_counter() - started)
+        logging.error(f"Failed to download image from {image_url}: {e}")
         return None
 
+def _decode_data_uri(image_url, max_bytes):
+    header, _, data = image_url.partition(',')
+    try:
+        image_data = base64.b64decode(data) if header.endswith(';base64') else urllib.parse.unquote_to_bytes(data)
+    except ValueError:
+        logging.error("Failed to decode inline image data")
+        return None
+    return image_data if len(image_data) <= max_bytes else None
+
+@track_stage('upload_images_to_shopify')
 def upload_images_to_shopify(product_id, image_data, filename):
     """
     Uploads an image to Shopify for the specified product using base64 encoding.
@@ -88,175 +248,356 @@ def upload_images_to_shopify(product_id, image_data, filename):
         filename (str): The filename to use when uploading the image.
     
     Returns:
-        None
+        dict: The created Shopify image, or None if the upload failed.
+    """
+    return _create_product_image(product_id, _attachment_payload(image_data, filename))
+
+@track_stage('upload_images_to_shopify')
+async def upload_images_to_shopify_async(product_id, image_data, filename):
+    """
+    Like upload_images_to_shopify, using the asyncio Shopify client.
     """
+    response = await get_async_shopify_client().post(
+        f"products/{product_id}/images.json", json=_attachment_payload(image_data, filename)
+    )
+    return _created_image(product_id, response)
+
+def _attachment_payload(image_data, filename):
     # Convert the binary image data to a base64-encoded string
     base64_image = base64.b64encode(image_data).decode('utf-8')
 
     # Create the payload for the Shopify API
-    payload = {
+    return {
         "image": {
             "attachment": base64_image,
             "filename": filename  # Optionally, specify a filename for the image
         }
     }
 
-    # Shopify API endpoint for uploading images to a product
-    url = f"https://{SHOPIFY_STORE}/admin/api/2023-07/products/{product_id}/images.json"
+@track_stage('upload_image_from_url')
+def upload_image_from_url(product_id, image_url):
+    """
+    Adds an image to a Shopify product by URL. Shopify fetches the image itself, so nothing is downloaded
+    or re-encoded here.
     
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN
-    }
+    Args:
+        product_id (str): The Shopify product ID.
+        image_url (str): The public http(s) URL of the image.
+    
+    Returns:
+        dict: The created Shopify image, or None if Shopify could not add it.
+    """
+    return _create_product_image(product_id, {"image": {"src": image_url}})
 
-    # Send the HTTP POST request to Shopify
-    response = requests.post(url, json=payload, headers=headers)
+@track_stage('upload_image_from_url')
+async def upload_image_from_url_async(product_id, image_url):
+    """
+    Like upload_image_from_url, using the asyncio Shopify client.
+    """
+    response = await get_async_shopify_client().post(f"products/{product_id}/images.json", json={"image": {"src": image_url}})
+    return _created_image(product_id, response)
+
+def _create_product_image(product_id, payload):
+    # Send the HTTP POST request to Shopify's product images endpoint
+    response = get_shopify_client().post(f"products/{product_id}/images.json", json=payload)
+    return _created_image(product_id, response)
 
+def _created_image(product_id, response):
     # Log the result with more detail
-    if response.status_code == 201:
+    if response.status_code in (200, 201):
         logging.info(f"Successfully uploaded image to product {product_id}")
-    else:
-        logging.error(f"Failed to upload image to product {product_id}. Status code: {response.status_code}, response: {response.text}")
+        return response.json().get('image')
 
-def process_image_upload(product_id, image_url):
+    logging.error(f"Failed to upload image to product {product_id}. Status code: {response.status_code}, response: {response.text}")
+    return None
+
+def product_image_exists(product_id, image_id):
     """
-    Downloads an image from the provided URL and uploads it to Shopify as a base64-encoded image.
-    
+    Checks that an image is still attached to a Shopify product.
+
     Args:
         product_id (str): The Shopify product ID.
-        image_url (str): The URL of the image to download and upload.
-    
+        image_id (str): The Shopify image ID.
+
     Returns:
-        None
+        bool: False if Shopify reports the image (or the product) as gone. Other failures count as present,
+        so that a failed check does not lead to a duplicate upload.
     """
-    # Step 1: Download the image from the external source
-    image_data = download_image(image_url)
-
-    if image_data:
-        # Step 2: Upload the image to Shopify
-        upload_image_to_shopify(product_id, image_data, filename="product_image.jpg")
-    else:
-        print(f"Failed to process image for product {product_id}")
+    response = get_shopify_client().get(f"products/{product_id}/images/{image_id}.json")
+    return _image_exists(product_id, image_id, response)
 
+async def product_image_exists_async(product_id, image_id):
+    """
+    Like product_image_exists, using the asyncio Shopify client.
+    """
+    response = await get_async_shopify_client().get(f"products/{product_id}/images/{image_id}.json")
+    return _image_exists(product_id, image_id, response)
 
-def update_product_with_content(product_id, description, tags, category):
-    payload = {
-        "product": {
-            "id": product_id,
-            "body_html": description,
-            "tags": tags,
-            "product_type": category
-        }
-    }
-    url = f"https://{SHOPIFY_STORE}/admin/api/2023-07/products/{product_id}.json"
-    headers = {"Content-Type": "application/json", "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN}
-    response = requests.put(url, json=payload, headers=headers)
+def _image_exists(product_id, image_id, response):
+    if response.status_code == 404:
+        return False
+    if response.status_code != 200:
+        logging.warning(f"Could not check image {image_id} of product {product_id}. Status code: {response.status_code}")
+    return True
 
-    if response.status_code == 200:
-        logging.info(f"Successfully updated product {product_id}.")
-    else:
-        logging.error(f"Failed to update product {product_id}. Status code: {response.status_code}")
+# Maximum number of inventory items resolved by one batched GraphQL query
+INVENTORY_LOOKUP_BATCH_SIZE = 100
 
-def get_parent_product_info(inventory_item_id):
+@track_stage('get_parent_products_info')
+def get_parent_products_info(inventory_item_ids):
     """
-    Fetches product information including the title, variants, and total inventory
-    for the given inventory item ID from Shopify using GraphQL.
+    Fetches the parent product information for many inventory items at once, using one GraphQL
+    nodes(ids: [...]) query per batch of INVENTORY_LOOKUP_BATCH_SIZE items.
+
+    Args:
+        inventory_item_ids (list): The numeric inventory item IDs.
+
+    Returns:
+        dict: Maps each inventory item ID (as a string) that was found to a
+        (product name, total inventory, product ID) tuple.
     """
-    url = f"https://{SHOPIFY_STORE}/admin/api/2023-07/graphql.json"
-    
     query = """
-    {
-      inventoryItem(id: "gid://shopify/InventoryItem/{inventory_item_id}") {
-        id
-        variant {
-          product {
+    query($ids: [ID!]!) {
+      nodes(ids: $ids) {
+        ... on InventoryItem {
+          id
+          variant {
             title
-            id
-            variants(first: 100) {
-              edges {
-                node {
-                  inventoryQuantity
-                }
-              }
+            product {
+              id
+              title
+              status
+              totalInventory
             }
           }
-          title
         }
       }
     }
-    """.replace("{inventory_item_id}", str(inventory_item_id))
+    """
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN
-    }
+    ids = list(dict.fromkeys(str(inventory_item_id) for inventory_item_id in inventory_item_ids))
+    results = {}
 
-    response = requests.post(url, json={'query': query}, headers=headers)
+    for start in range(0, len(ids), INVENTORY_LOOKUP_BATCH_SIZE):
+        batch = ids[start:start + INVENTORY_LOOKUP_BATCH_SIZE]
+        gids = [f"gid://shopify/InventoryItem/{inventory_item_id}" for inventory_item_id in batch]
 
-    if response.status_code == 200:
-        data = response.json()
-        inventory_item = data['data'].get('inventoryItem')
-        if inventory_item:
-            product_name = inventory_item['variant']['product']['title']
-            variant_name = inventory_item['variant']['title']
-            product_id = inventory_item['variant']['product']['id']
-
-            total_inventory = sum(
-                edge['node']['inventoryQuantity'] for edge in inventory_item['variant']['product']['variants']['edges']
-            )
+        # Each node costs a few points: the item, its variant and the variant's product
+        response = get_shopify_client().graphql(query, variables={"ids": gids}, cost=3 * len(batch) + 1)
 
-            return f"{product_name} ({variant_name})", total_inventory, product_id
-        else:
-            logging.error(f"No product found for inventory item ID: {inventory_item_id}")
-    else:
-        logging.error(f"Failed to fetch inventory item. Status code: {response.status_code}")
+        if response.status_code != 200:
+            logging.error(f"Failed to fetch {len(batch)} inventory items. Status code: {response.status_code}")
+            continue
+
+        nodes = (response.json().get('data') or {}).get('nodes') or []
+        for inventory_item_id, inventory_item in zip(batch, nodes):
+            if inventory_item and inventory_item.get('variant'):
+                product = inventory_item['variant']['product']
+                status_cache.set(product['id'], product['status'])
+                variant_name = inventory_item['variant']['title']
+                results[inventory_item_id] = (
+                    f"{product['title']} ({variant_name})", product['totalInventory'], product['id']
+                )
+            else:
+                logging.error(f"No product found for inventory item ID: {inventory_item_id}")
+
+    return results
+
+# Number of products changed by one GraphQL request of aliased productUpdate mutations
+PRODUCT_UPDATE_BATCH_SIZE = getattr(config, 'PRODUCT_UPDATE_BATCH_SIZE', 25)
 
-    return 'Unknown Product', 0, None
+# Cost Shopify charges for one productUpdate mutation
+PRODUCT_UPDATE_COST = 10
 
-def update_product_status(product_id, status):
+@track_stage('update_products')
+def update_products(updates, batch_size=PRODUCT_UPDATE_BATCH_SIZE):
     """
-    Updates the status (e.g., 'draft', 'active') of a product on Shopify.
-    
+    Updates many products with aliased GraphQL productUpdate mutations, batch_size products per request,
+    instead of one REST PUT per product.
+
     Args:
-        product_id (str): The product ID in Shopify.
-        status (str): The status to set for the product (e.g., 'draft', 'active').
-    
+        updates (list): One dict per product with 'id' and any of 'description', 'tags' (comma-separated),
+            'category' and 'status' ('active', 'draft' or 'archived'). Fields that are missing or None are
+            left unchanged.
+        batch_size (int): The number of products changed per request.
+
     Returns:
-        None
+        dict: Maps each product ID, as given, to None if the product was updated or to an error message.
     """
-    # Extract the numeric part of the product ID (Shopify uses GID format)
-    numeric_product_id = product_id.split('/')[-1]
-    
-    # Shopify API URL to update product status
-    url = f"https://{SHOPIFY_STORE}/admin/api/2023-07/products/{numeric_product_id}.json"
-    
-    # Payload to update product status
-    payload = {
-        "product": {
-            "id": numeric_product_id,
-            "status": status
-        }
-    }
-    
-    # Headers for the request
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN
-    }
+    client = get_shopify_client()
+    results = {}
+    for start in range(0, len(updates), batch_size):
+        batch = updates[start:start + batch_size]
+        mutation, variables = _product_update_mutation(batch)
+        try:
+            response = client.graphql(mutation, variables=variables, cost=PRODUCT_UPDATE_COST * len(batch) + 1)
+        except requests.exceptions.RequestException as e:
+            # A failed batch is reported for its products; the remaining batches are still sent
+            results.update(_failed_batch(batch, e))
+            continue
+        results.update(_product_update_results(batch, response))
+
+    _log_update_summary(results)
+    return results
+
+@track_stage('update_products')
+async def update_products_async(updates, batch_size=PRODUCT_UPDATE_BATCH_SIZE):
+    """
+    Like update_products, using the asyncio Shopify client. The batches are sent concurrently; the rate
+    limiter spaces them out when they would exceed the store's GraphQL budget.
+    """
+    client = get_async_shopify_client()
+
+    async def update_batch(batch):
+        mutation, variables = _product_update_mutation(batch)
+        try:
+            response = await client.graphql(mutation, variables=variables, cost=PRODUCT_UPDATE_COST * len(batch) + 1)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return _failed_batch(batch, e)
+        return _product_update_results(batch, response)
+
+    results = {}
+    batches = [updates[start:start + batch_size] for start in range(0, len(updates), batch_size)]
+    # Every batch is awaited even if one raises unexpectedly, and reported per product either way
+    outcomes = await asyncio.gather(*(update_batch(batch) for batch in batches), return_exceptions=True)
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, BaseException):
+            if not isinstance(outcome, Exception):
+                raise outcome
+            logging.error(f"Unexpected error while updating {len(batch)} products", exc_info=outcome)
+            outcome = _failed_batch(batch, outcome)
+        results.update(outcome)
+
+    _log_update_summary(results)
+    return results
+
+def _failed_batch(batch, exception):
+    """
+    Maps every product in a batch whose request could not be sent or answered to the error.
+    """
+    error = f"Request failed: {str(exception) or type(exception).__name__}"
+    logging.error(f"Failed to update {len(batch)} products. {error}")
+    return {update['id']: error for update in batch}
 
-    # Send the PUT request to Shopify to update the product status
-    response = requests.put(url, json=payload, headers=headers)
-    
-    # Log the result
-    if response.status_code == 200:
-        logging.info(f"Successfully updated product {numeric_product_id} to {status}.")
-    else:
-        logging.error(f"Failed to update product {numeric_product_id} to {status}. Status code: {response.status_code}")
+def _log_update_summary(results):
+    failed = sum(1 for error in results.values() if error)
+    logging.info(f"Updated {len(results) - failed} of {len(results)} products ({failed} failed)")
+
+def update_products_status(statuses, batch_size=PRODUCT_UPDATE_BATCH_SIZE):
+    """
+    Sets the status of many products with batched productUpdate mutations. Products the status cache
+    already has at the requested status are skipped.
+
+    Args:
+        statuses (dict): Maps product IDs (numeric or GID) to the status to set.
+        batch_size (int): The number of products changed per request.
+
+    Returns:
+        dict: Maps each product ID to None if it was updated or skipped, or to an error message.
+    """
+    results = {}
+    updates = []
+    for product_id, status in statuses.items():
+        if status_cache.get(_numeric_product_id(product_id)) == status:
+            status_cache.record_skip()
+            logging.info(
+                f"Product {_numeric_product_id(product_id)} is already {status}, skipping update.",
+                extra={'product_id': product_id}
+            )
+            results[product_id] = None
+        else:
+            updates.append({"id": product_id, "status": status})
+
+    if updates:
+        results.update(update_products(updates, batch_size))
+    return results
+
+def _product_update_mutation(batch):
+    """
+    Builds one request of aliased productUpdate mutations for a batch of updates.
+
+    Returns:
+        tuple: The mutation and its variables.
+    """
+    aliases = [f"p{position}" for position in range(len(batch))]
+    mutation = (
+        "mutation(" + ", ".join(f"${alias}: ProductInput!" for alias in aliases) + ") {\n"
+        + "".join(
+            f"  {alias}: productUpdate(input: ${alias}) {{ product {{ id }} userErrors {{ field message }} }}\n"
+            for alias in aliases
+        )
+        + "}"
+    )
+    variables = {alias: _product_input(update) for alias, update in zip(aliases, batch)}
+    return mutation, variables
+
+def _product_update_results(batch, response):
+    """
+    Maps each product in a batch to None or its error, from the response to the batch's mutation.
+    """
+    aliases = [f"p{position}" for position in range(len(batch))]
+    if response.status_code != 200:
+        error = f"Status code: {response.status_code}"
+        logging.error(f"Failed to update {len(batch)} products. {error}")
+        return {update['id']: error for update in batch}
+
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        error = "Response is not a GraphQL result"
+        logging.error(f"Failed to update {len(batch)} products. {error}")
+        return {update['id']: error for update in batch}
+
+    data = body.get('data') or {}
+    # Top-level errors (e.g. a throttled or invalid request) apply to every product without a result
+    request_error = "; ".join(error.get('message', str(error)) for error in body.get('errors') or []) or "No result returned"
+
+    results = {}
+    for alias, update in zip(aliases, batch):
+        numeric_product_id = _numeric_product_id(update['id'])
+        result = data.get(alias)
+        if result is None:
+            error = request_error
+        else:
+            error = "; ".join(
+                f"{'.'.join(user_error.get('field') or [])}: {user_error.get('message')}".lstrip(": ")
+                for user_error in result.get('userErrors') or []
+            ) or None
+
+        # Tagged with the product so the log viewer can filter on it
+        if error:
+            logging.error(f"Failed to update product {numeric_product_id}: {error}", extra={'product_id': numeric_product_id})
+        else:
+            logging.info(f"Successfully updated product {numeric_product_id}.", extra={'product_id': numeric_product_id})
+            if update.get('status'):
+                status_cache.set(numeric_product_id, update['status'])
+        results[update['id']] = error
+    return results
+
+def _product_input(update):
+    product_input = {"id": f"gid://shopify/Product/{_numeric_product_id(update['id'])}"}
+    if update.get('description') is not None:
+        product_input['descriptionHtml'] = update['description']
+    if update.get('tags') is not None:
+        product_input['tags'] = [tag.strip() for tag in update['tags'].split(',') if tag.strip()]
+    if update.get('category') is not None:
+        product_input['productType'] = update['category']
+    if update.get('status'):
+        product_input['status'] = update['status'].upper()
+    return product_input
+
+def _numeric_product_id(product_id):
+    # Accept both numeric IDs and GraphQL GIDs such as 'gid://shopify/Product/123'
+    return str(product_id).split('/')[-1]
 
 def get_vendor_products(vendor, min_inventory_level):
     """
     Fetch all products from a vendor with pagination and filter out products whose total inventory 
-    is above the minimum inventory level.
+    is above the minimum inventory level. When the product index is enabled, it is brought up to date
+    with an incremental sync and the query is answered from it instead; when VENDOR_FETCH_MODE is 'bulk',
+    the products are fetched with a GraphQL bulk operation. Products on the ignore list are left out.
     
     Args:
         vendor (str): The vendor to filter products by.
@@ -265,6 +606,75 @@ def get_vendor_products(vendor, min_inventory_level):
     Returns:
         list: A list of products that meet the inventory requirement.
     """
+    return _remove_ignored(_fetch_vendor_products(vendor, min_inventory_level))
+
+async def get_vendor_products_async(vendor, min_inventory_level):
+    """
+    Like get_vendor_products, for callers on an event loop. Pages of products.json are fetched with the
+    asyncio Shopify client. The product index sync and bulk exports read and write local databases and
+    poll for minutes, so with either of them enabled the whole fetch runs in a worker thread instead.
+    """
+    if VENDOR_FETCH_MODE == 'bulk' or await asyncio.to_thread(get_product_index):
+        return await asyncio.to_thread(get_vendor_products, vendor, min_inventory_level)
+
+    client = get_async_shopify_client()
+    products = []
+    url = client.url(f"products.json?limit=50&vendor={urllib.parse.quote(vendor)}")
+    while url:
+        logging.info(f"Requesting URL: {url}")
+        response = await client.get(url)
+        if response.status_code != 200:
+            logging.error(f"Failed to fetch products for vendor {vendor}. Status code: {response.status_code}. Response: {response.text}")
+            break
+
+        fetched_products = response.json().get('products', [])
+        logging.info(f"Fetched {len(fetched_products)} products from the Shopify API.")
+        products.extend(_below_inventory_level(fetched_products, min_inventory_level))
+        url = client.next_page_url(response)
+
+    logging.info(f"Total products after filtering: {len(products)}")
+    return _remove_ignored(products)
+
+def _remove_ignored(products):
+    ignored_products = ignore_store.snapshot()
+    products = [product for product in products if product['title'] not in ignored_products]
+    logging.info(f"{len(products)} products remain after removing ignored products")
+    return products
+
+def _below_inventory_level(fetched_products, min_inventory_level):
+    """
+    Returns the fetched products whose total inventory over all variants is below the threshold.
+    """
+    products = []
+    for product in fetched_products:
+        # Sum the inventory of all variants
+        total_inventory = sum(variant['inventory_quantity'] for variant in product['variants'])
+
+        # Log the total inventory and the threshold for debugging
+        logging.info(f"Product '{product['title']}' has total inventory: {total_inventory}, threshold: {min_inventory_level}")
+
+        # Only include products where the total inventory is below the threshold
+        if total_inventory >= min_inventory_level:
+            logging.info(f"Skipping product '{product['title']}' with total inventory: {total_inventory} (above threshold).")
+        else:
+            logging.info(f"Including product '{product['title']}' with total inventory: {total_inventory} (below threshold).")
+            products.append(product)
+    return products
+
+def _fetch_vendor_products(vendor, min_inventory_level):
+    index = get_product_index()
+    if index:
+        index.sync()
+        products = index.get_vendor_products(vendor, min_inventory_level)
+        logging.info(f"Found {len(products)} products for vendor {vendor} below the threshold in the product index")
+        return products
+
+    if VENDOR_FETCH_MODE == 'bulk':
+        try:
+            return get_vendor_products_bulk(vendor, min_inventory_level)
+        except BulkExportError as e:
+            logging.error(f"Bulk export failed, falling back to paginated fetch: {e}")
+
     products = []
     limit = 50  # Number of products to fetch per page
     page_info = None  # For pagination tracking
@@ -272,24 +682,21 @@ def get_vendor_products(vendor, min_inventory_level):
     # URL-encode the vendor name to handle spaces or special characters
     vendor = urllib.parse.quote(vendor)
 
+    client = get_shopify_client()
+
     while True:
         # Construct the URL for the request
         if page_info:
             # Use page_info for pagination, omit the vendor parameter in subsequent requests
-            url = f"https://{SHOPIFY_STORE}/admin/api/2023-07/products.json?limit={limit}&page_info={page_info}"
+            url = client.url(f"products.json?limit={limit}&page_info={page_info}")
         else:
             # Initial request includes the vendor parameter
-            url = f"https://{SHOPIFY_STORE}/admin/api/2023-07/products.json?limit={limit}&vendor={vendor}"
-
-        headers = {
-            "Content-Type": "application/json",
-            "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN
-        }
+            url = client.url(f"products.json?limit={limit}&vendor={vendor}")
 
         logging.info(f"Requesting URL: {url}")  # Log the request URL
 
         # Fetch the data from Shopify
-        response = requests.get(url, headers=headers)
+        response = client.get(url)
 
         if response.status_code == 400:
             logging.error(f"Failed to fetch products for vendor {vendor}. Status code: {response.status_code}. Response: {response.text}")
@@ -306,19 +713,7 @@ def get_vendor_products(vendor, min_inventory_level):
         logging.info(f"Fetched {len(fetched_products)} products from the Shopify API.")
 
         # Filter products by the total inventory of all variants
-        for product in fetched_products:
-            # Sum the inventory of all variants
-            total_inventory = sum(variant['inventory_quantity'] for variant in product['variants'])
-
-            # Log the total inventory and the threshold for debugging
-            logging.info(f"Product '{product['title']}' has total inventory: {total_inventory}, threshold: {min_inventory_level}")
-
-            # Only include products where the total inventory is below the threshold
-            if total_inventory >= min_inventory_level:
-                logging.info(f"Skipping product '{product['title']}' with total inventory: {total_inventory} (above threshold).")
-            else:
-                logging.info(f"Including product '{product['title']}' with total inventory: {total_inventory} (below threshold).")
-                products.append(product)
+        products.extend(_below_inventory_level(fetched_products, min_inventory_level))
 
         # Check for pagination (if there's a next page)
         link_header = response.headers.get('Link', '')
@@ -334,28 +729,3 @@ def get_vendor_products(vendor, min_inventory_level):
 
     logging.info(f"Total products after filtering: {len(products)}")
     return products
-
-def load_ignored_products():
-    """
-    Loads the list of ignored products from a text file.
-    
-    Returns:
-        list: A list of ignored product names.
-    """
-    if os.path.exists(IGNORE_LIST_FILE):
-        with open(IGNORE_LIST_FILE, 'r') as file:
-            data = file.read().strip()
-            # Split the file content by commas to create a list of ignored products
-            return data.split(",") if data else []
-    else:
-        return []
-
-def save_ignored_products(ignored_products):
-    """
-    Saves the list of ignored products to a text file.
-    
-    Args:
-        ignored_products (list): The list of ignored product names.
-    """
-    with open(IGNORE_LIST_FILE, 'w') as file:
-        file.write(",".join(ignored_products))
\ No newline at end of file
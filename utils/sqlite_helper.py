@@ -0,0 +1,22 @@
+import sqlite3
+from contextlib import contextmanager
+
+@contextmanager
+def connect(path):
+    """
+    Opens a SQLite connection for a single unit of work. The transaction is committed when the block exits
+    normally, rolled back if it raises, and the connection is always closed.
+
+    Args:
+        path (str): The path of the SQLite database file.
+
+    Yields:
+        sqlite3.Connection: The open connection, with rows returned as sqlite3.Row.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
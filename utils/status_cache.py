@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+import config
+
+# Maximum number of products whose status is remembered, and for how long (in seconds)
+STATUS_CACHE_SIZE = getattr(config, 'STATUS_CACHE_SIZE', 50000)
+STATUS_CACHE_TTL = getattr(config, 'STATUS_CACHE_TTL', 600)
+
+class StatusCache:
+    """
+    Remembers the last known status ('active', 'draft', 'archived') of products so that status updates
+    which would not change anything can be skipped. Entries expire after a TTL and the least recently
+    used entries are evicted once the cache is full.
+    """
+    def __init__(self, max_size=STATUS_CACHE_SIZE, ttl=STATUS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # product ID -> (status, expires at)
+
+        # Counters for monitoring
+        self.hits = 0
+        self.misses = 0
+        self.skipped_writes = 0
+
+    @staticmethod
+    def _key(product_id):
+        # Accept both numeric IDs and GraphQL GIDs such as 'gid://shopify/Product/123'
+        return str(product_id).split('/')[-1]
+
+    def get(self, product_id):
+        """
+        Returns the cached status of a product, or None if it is unknown or expired.
+        """
+        key = self._key(product_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, product_id, status):
+        """
+        Records the current status of a product.
+        """
+        key = self._key(product_id)
+        with self._lock:
+            self._entries[key] = (status.lower(), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped_writes += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped_writes": self.skipped_writes,
+            }
+
+# Process-wide cache of product statuses
+status_cache = StatusCache()
@@ -0,0 +1,235 @@
+import json
+import logging
+import threading
+import time
+import uuid
+import config
+from utils.sqlite_helper import connect
+
+# Path of the SQLite inbox holding received webhooks until they are processed; None puts webhook_inbox.db
+# in the Flask app's instance folder
+WEBHOOK_INBOX_PATH = getattr(config, 'WEBHOOK_INBOX_PATH', None)
+
+# Number of webhooks a consumer claims at once, and how long a claim lasts before another consumer may retry it
+WEBHOOK_INBOX_BATCH_SIZE = getattr(config, 'WEBHOOK_INBOX_BATCH_SIZE', 200)
+WEBHOOK_INBOX_LEASE = getattr(config, 'WEBHOOK_INBOX_LEASE', 120)
+
+# Maximum number of claimed webhooks whose processing (e.g. a debounced status update) has not finished yet
+WEBHOOK_INBOX_MAX_IN_FLIGHT = getattr(config, 'WEBHOOK_INBOX_MAX_IN_FLIGHT', 5000)
+
+# Processed webhooks are kept this long (Shopify retries for up to 48 hours) so that retries are recognised
+WEBHOOK_INBOX_RETENTION = getattr(config, 'WEBHOOK_INBOX_RETENTION', 48 * 3600)
+
+class WebhookInbox:
+    """
+    Durable inbox for received webhooks.
+
+    The endpoint only appends the raw payload, which is a single SQLite insert, and acknowledges. A
+    consumer thread claims pending webhooks in batches and processes them. A webhook is only marked done
+    once its processing has fully finished, including work it hands off such as a debounced status
+    update. Webhooks are de-duplicated on Shopify's webhook ID, and claimed webhooks that were never marked
+    done (e.g. because the process was restarted) are claimed again once their lease expires.
+    """
+    def __init__(self, path, batch_size=WEBHOOK_INBOX_BATCH_SIZE, lease=WEBHOOK_INBOX_LEASE,
+                 retention=WEBHOOK_INBOX_RETENTION, max_in_flight=WEBHOOK_INBOX_MAX_IN_FLIGHT):
+        self.path = path
+        self.batch_size = batch_size
+        self.lease = lease
+        self.retention = retention
+        self.max_in_flight = max_in_flight
+        self._condition = threading.Condition()
+        self._consumer = None
+        self._last_cleanup = 0.0
+        self._in_flight = set()  # ids of claimed webhooks whose processing has not finished
+        self._finished = []  # ids of in-flight webhooks whose processing succeeded
+        with connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS inbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    webhook_id TEXT NOT NULL UNIQUE,
+                    topic TEXT,
+                    payload TEXT NOT NULL,
+                    received_at REAL NOT NULL,
+                    claimed_at REAL,
+                    processed_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS inbox_pending ON inbox (processed_at, id)")
+
+    def append(self, webhook_id, topic, payload):
+        """
+        Stores a received webhook.
+
+        Args:
+            webhook_id (str): The X-Shopify-Webhook-Id header; a random ID is used if it is missing.
+            topic (str): The X-Shopify-Topic header.
+            payload (str): The raw JSON body.
+
+        Returns:
+            bool: False if a webhook with this ID was already received.
+        """
+        with connect(self.path) as conn:
+            # WAL with synchronous=NORMAL survives process restarts without an fsync per webhook
+            conn.execute("PRAGMA synchronous=NORMAL")
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO inbox (webhook_id, topic, payload, received_at) VALUES (?, ?, ?, ?)",
+                (webhook_id or uuid.uuid4().hex, topic, payload, time.time())
+            )
+            inserted = cursor.rowcount == 1
+
+        if inserted:
+            with self._condition:
+                self._condition.notify()
+        return inserted
+
+    def claim(self, limit=None):
+        """
+        Claims a batch of pending webhooks for processing.
+
+        Args:
+            limit (int): The most webhooks to claim; defaults to the batch size.
+
+        Returns:
+            list: (id, topic, payload) tuples, oldest first, with the payload decoded.
+        """
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, topic, payload FROM inbox WHERE processed_at IS NULL "
+                "AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY id LIMIT ?",
+                (now - self.lease, limit or self.batch_size)
+            ).fetchall()
+            conn.executemany("UPDATE inbox SET claimed_at = ? WHERE id = ?", [(now, row["id"]) for row in rows])
+
+        claimed = []
+        for row in rows:
+            try:
+                claimed.append((row["id"], row["topic"], json.loads(row["payload"])))
+            except ValueError:
+                logging.error(f"Discarding webhook {row['id']} with an invalid JSON payload")
+                self.mark_processed([row["id"]])
+        return claimed
+
+    def mark_processed(self, ids):
+        if not ids:
+            return
+        with connect(self.path) as conn:
+            conn.executemany("UPDATE inbox SET processed_at = ? WHERE id = ?", [(time.time(), id_) for id_ in ids])
+
+    def pending_count(self):
+        with connect(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM inbox WHERE processed_at IS NULL").fetchone()[0]
+
+    def cleanup(self):
+        """
+        Deletes processed webhooks older than the retention period.
+        """
+        with connect(self.path) as conn:
+            conn.execute(
+                "DELETE FROM inbox WHERE processed_at IS NOT NULL AND processed_at < ?", (time.time() - self.retention,)
+            )
+
+    def start_consumer(self, handler):
+        """
+        Starts the consumer thread, which calls handler(topic, payload) for every claimed webhook. The handler
+        may return a Future, in which case the webhook is marked processed when the future succeeds, while
+        the consumer goes on claiming; if the future fails the webhook is retried when its lease expires.
+        """
+        if self._consumer:
+            return
+        self._consumer = threading.Thread(target=self._consume, args=(handler,), name="webhook-inbox", daemon=True)
+        self._consumer.start()
+
+    def _consume(self, handler):
+        while True:
+            with self._condition:
+                # Holding more unfinished webhooks would only grow memory; wait for some to finish
+                while len(self._in_flight) >= self.max_in_flight and not self._finished:
+                    self._condition.wait(1.0)
+                finished, self._finished = self._finished, []
+                capacity = self.max_in_flight - len(self._in_flight)
+                in_flight = set(self._in_flight)
+            self._mark_processed_safely(finished)
+
+            batch = []
+            if capacity > 0:
+                try:
+                    batch = self.claim(min(self.batch_size, capacity))
+                except Exception:
+                    logging.exception("Failed to claim webhooks from the inbox")
+
+            if not batch:
+                # Woken immediately by webhooks received (or finished) in this process; polls for those
+                # received by others
+                with self._condition:
+                    if not self._finished:
+                        self._condition.wait(1.0)
+                self._maybe_cleanup()
+                continue
+
+            processed = []
+            for id_, topic, payload in batch:
+                if id_ in in_flight:
+                    # Still being processed here after its lease expired; claiming it again renewed the lease
+                    continue
+                try:
+                    future = handler(topic, payload)
+                except Exception:
+                    # Failed webhooks stay claimed and are retried when their lease expires
+                    logging.exception(f"Failed to process webhook {id_} ({topic})")
+                    continue
+                if future is None:
+                    processed.append(id_)
+                    continue
+                with self._condition:
+                    self._in_flight.add(id_)
+                future.add_done_callback(lambda future, id_=id_: self._on_finished(id_, future))
+            self._mark_processed_safely(processed)
+
+    def _on_finished(self, id_, future):
+        error = future.exception()
+        if error:
+            logging.error(f"Failed to process webhook {id_}, it will be retried: {error}")
+        with self._condition:
+            self._in_flight.discard(id_)
+            if not error:
+                self._finished.append(id_)
+            self._condition.notify()
+
+    def _mark_processed_safely(self, ids):
+        try:
+            self.mark_processed(ids)
+        except Exception:
+            # The webhooks are processed again once their lease expires
+            logging.exception(f"Failed to mark {len(ids)} webhooks as processed")
+
+    def _maybe_cleanup(self):
+        if time.monotonic() - self._last_cleanup < 3600:
+            return
+        self._last_cleanup = time.monotonic()
+        try:
+            self.cleanup()
+        except Exception:
+            logging.exception("Failed to clean up the webhook inbox")
+
+_webhook_inbox = None
+_webhook_inbox_lock = threading.Lock()
+
+def get_webhook_inbox(path=None):
+    """
+    Returns the process-wide webhook inbox, creating it on first use.
+
+    Args:
+        path (str): Where to create the inbox if WEBHOOK_INBOX_PATH is not set. The app's setup opens the
+            inbox in its instance folder, so later calls need no path.
+    """
+    global _webhook_inbox
+    with _webhook_inbox_lock:
+        if _webhook_inbox is None:
+            path = WEBHOOK_INBOX_PATH or path
+            if not path:
+                raise RuntimeError("The webhook inbox has not been opened and WEBHOOK_INBOX_PATH is not set")
+            _webhook_inbox = WebhookInbox(path)
+        return _webhook_inbox